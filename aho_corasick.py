@@ -0,0 +1,131 @@
+"""
+Aho-Corasick automaton for multi-keyword substring matching
+
+Finds every occurrence of any keyword in a single left-to-right pass over the
+text, so the cost of a lookup depends on the text length rather than on how
+many keywords are configured. Used for large subject keyword lists (rules.py)
+and for partial-name allowlist entries.
+"""
+
+# Keyword lists at least this long are worth an automaton; below it a plain
+# substring loop is faster (see benchmarks/bench_keywords.py)
+AUTOMATON_MIN_KEYWORDS = 128
+
+
+class KeywordAutomaton:
+    """Immutable Aho-Corasick automaton over a fixed list of keywords."""
+
+    __slots__ = ('keywords', '_goto', '_fail', '_best', '_outputs')
+
+    def __init__(self, keywords):
+        """
+        Build the automaton.
+
+        Keywords are matched exactly as given (callers lowercase both sides
+        for case-insensitive matching). When a keyword appears more than once,
+        the first occurrence's index is the one reported.
+
+        Args:
+            keywords (list): Keywords to search for
+        """
+        self.keywords = tuple(keywords)
+        goto = [{}]
+        own = [None]
+
+        # Trie of all keywords; own[node] is the lowest keyword index ending there
+        for index, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                nxt = goto[node].get(char)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][char] = nxt
+                    goto.append({})
+                    own.append(None)
+                node = nxt
+            if own[node] is None:
+                own[node] = index
+
+        # Breadth-first pass for failure links. best[node] is the lowest keyword
+        # index ending at this node or any suffix of it; outputs lists them all.
+        fail = [0] * len(goto)
+        best = list(own)
+        outputs = [() if index is None else (index,) for index in own]
+        queue = list(goto[0].values())
+        for node in queue:
+            fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                link = goto[state].get(char, 0)
+                fail[child] = link if link != child else 0
+                suffix = fail[child]
+                if best[suffix] is not None and (best[child] is None or best[suffix] < best[child]):
+                    best[child] = best[suffix]
+                outputs[child] = outputs[child] + outputs[suffix]
+                queue.append(child)
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+        self._outputs = outputs
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def first(self, text):
+        """
+        Find the keyword with the lowest index that occurs anywhere in text.
+
+        This reproduces "for keyword in keywords: if keyword in text" in one
+        pass, stopping early once the first keyword in list order is seen.
+
+        Args:
+            text (str): Text to search
+
+        Returns:
+            int: Index into keywords, or None if nothing matches
+        """
+        goto = self._goto
+        fail = self._fail
+        best_at = self._best
+        best = best_at[0]  # an empty keyword matches any text
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            candidate = best_at[node]
+            if candidate is not None and (best is None or candidate < best):
+                best = candidate
+            if best == 0:
+                break
+        return best
+
+    def find_all(self, text):
+        """
+        Report every keyword occurrence in text.
+
+        Args:
+            text (str): Text to search
+
+        Returns:
+            list: (end_offset, keyword_index) tuples in order of end offset
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        hits = []
+        node = 0
+        for offset, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in outputs[node]:
+                hits.append((offset, index))
+        return hits
@@ -0,0 +1,169 @@
+"""
+Compiled allowlist index
+
+AllowlistIndex.from_config() compiles a dict shaped like config.ALLOWLIST once
+so that checking a sender no longer scans every entry. It keeps the original
+_is_allowlisted semantics:
+
+  - a sender entry matches if it is contained in the sender address, or the
+    sender address is contained in it (both case-insensitive)
+  - a domain entry "company.com" matches senders ending in "@company.com"
+
+and adds "*.company.com" domain entries, which match company.com and any of
+its subdomains. match() reports which entry allowed the sender.
+"""
+
+from bisect import bisect_right
+
+from aho_corasick import KeywordAutomaton, AUTOMATON_MIN_KEYWORDS
+
+# Separator between entries in the reverse-containment haystack; it cannot
+# occur in an email address, so a search never spans two entries
+_SEPARATOR = '\x00'
+
+
+class DomainTrie:
+    """Trie of domain names keyed by reversed labels (com -> company -> mail)."""
+
+    __slots__ = ('_root',)
+
+    # Keys in a node dict that mark entries rather than child labels
+    _EXACT = '\x00exact'
+    _SUBDOMAINS = '\x00subdomains'
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, domain, entry, include_subdomains=False):
+        """
+        Add a domain.
+
+        Args:
+            domain (str): Lowercased domain name, e.g. 'company.com'
+            entry (str): Allowlist entry to report when it matches
+            include_subdomains (bool): Also match any subdomain of domain
+        """
+        node = self._root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        key = self._SUBDOMAINS if include_subdomains else self._EXACT
+        node.setdefault(key, entry)
+
+    def match(self, domain):
+        """
+        Find the entry covering a domain.
+
+        An exact entry wins over a subdomain entry; among subdomain entries the
+        most specific one (longest suffix) is reported.
+
+        Args:
+            domain (str): Lowercased domain to look up
+
+        Returns:
+            str: Matching allowlist entry, or None
+        """
+        node = self._root
+        found = None
+        for label in reversed(domain.split('.')):
+            node = node.get(label)
+            if node is None:
+                return found
+            found = node.get(self._SUBDOMAINS, found)
+        return node.get(self._EXACT, found)
+
+
+class AllowlistIndex:
+    """Immutable index over allowlisted senders and domains."""
+
+    __slots__ = ('_exact', '_partials', '_lowered', '_automaton', '_haystack',
+                 '_offsets', '_domains')
+
+    def __init__(self, senders=(), domains=()):
+        """
+        Args:
+            senders (list): Sender entries (full addresses or partial names)
+            domains (list): Domain entries; prefix with '*.' to include subdomains
+        """
+        self._partials = tuple(senders)
+        self._lowered = tuple(entry.lower() for entry in senders)
+
+        # Exact addresses: the common case answered with a single hash lookup
+        self._exact = {}
+        for entry, lowered in zip(self._partials, self._lowered):
+            self._exact.setdefault(lowered, entry)
+
+        # "entry in sender": one pass over the sender for long lists
+        self._automaton = None
+        if len(self._lowered) >= AUTOMATON_MIN_KEYWORDS:
+            self._automaton = KeywordAutomaton(self._lowered)
+
+        # "sender in entry": one C-level substring search over all entries
+        self._haystack = _SEPARATOR.join(self._lowered)
+        self._offsets = []
+        offset = 0
+        for lowered in self._lowered:
+            self._offsets.append(offset)
+            offset += len(lowered) + 1
+
+        self._domains = DomainTrie()
+        for entry in domains:
+            domain = entry.lower()
+            if domain.startswith('*.'):
+                self._domains.add(domain[2:], entry, include_subdomains=True)
+            else:
+                self._domains.add(domain, entry)
+
+    @classmethod
+    def from_config(cls, allowlist):
+        """
+        Compile an allowlist dict.
+
+        Args:
+            allowlist (dict): Shaped like config.ALLOWLIST ('senders', 'domains')
+
+        Returns:
+            AllowlistIndex: Compiled index
+        """
+        return cls(allowlist.get('senders', []), allowlist.get('domains', []))
+
+    def match(self, sender_email):
+        """
+        Find the allowlist entry that protects a sender.
+
+        Args:
+            sender_email (str): Email address to check
+
+        Returns:
+            str: The matching entry as written in the config, or None
+        """
+        sender = sender_email.lower()
+
+        entry = self._exact.get(sender)
+        if entry is not None:
+            return entry
+
+        if '@' in sender:
+            entry = self._domains.match(sender.rsplit('@', 1)[1])
+            if entry is not None:
+                return entry
+
+        if not self._partials:
+            return None
+
+        # Entry contained in the sender address
+        if self._automaton is not None:
+            position = self._automaton.first(sender)
+            if position is not None:
+                return self._partials[position]
+        else:
+            for position, lowered in enumerate(self._lowered):
+                if lowered in sender:
+                    return self._partials[position]
+
+        # Sender address contained in an entry
+        if _SEPARATOR not in sender:
+            found = self._haystack.find(sender)
+            if found >= 0:
+                return self._partials[bisect_right(self._offsets, found) - 1]
+
+        return None
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Measure the Lambda cold-start cost of lambda_handler.py
+
+Every run uses a fresh interpreter, as a cold container does, and times:
+  import   - `import lambda_handler` (what the Lambda runtime does at init)
+  deps     - modules a cold invocation then imports on first use
+             (boto3, google.oauth2.credentials, googleapiclient.discovery)
+  build    - building the Gmail service from the local discovery document
+
+The heaviest top-level imports of the first run (from python -X importtime)
+are listed so a regression can be traced to the module that caused it.
+
+Usage:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --runs 10 --max-import-ms 100
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+COLD_START = """
+import time
+start = time.perf_counter()
+import lambda_handler
+imported = time.perf_counter()
+import boto3
+from google.oauth2.credentials import Credentials
+import googleapiclient.discovery
+deps = time.perf_counter()
+lambda_handler.build_gmail_service(Credentials(token='cold-start-benchmark'))
+built = time.perf_counter()
+print(imported - start, deps - imported, built - deps)
+"""
+
+PHASES = ('import', 'deps', 'build')
+
+
+def run_once():
+    """
+    Time one cold start in a new interpreter.
+
+    Returns:
+        tuple: (timings: dict of phase -> seconds, importtime: stderr text)
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', COLD_START],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    timings = dict(zip(PHASES, (float(value) for value in result.stdout.split())))
+    return timings, result.stderr
+
+
+def heaviest_imports(importtime, limit):
+    """
+    Pick the top-level modules with the largest cumulative import time.
+
+    Args:
+        importtime (str): stderr of python -X importtime
+        limit (int): Number of modules to return
+
+    Returns:
+        list: (module, microseconds) tuples, heaviest first
+    """
+    modules = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Nested imports are indented under the module that triggered them
+        if name.startswith('  ') or not name.strip():
+            continue
+        modules.append((name.strip(), int(cumulative)))
+    return sorted(modules, key=lambda module: module[1], reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5, help='Cold starts to measure (default: 5)')
+    parser.add_argument('--top', type=int, default=10, help='Heaviest imports to list (default: 10)')
+    parser.add_argument('--max-import-ms', type=float, metavar='MS',
+                        help='Exit with status 1 if the median import time exceeds MS')
+    args = parser.parse_args()
+
+    results = []
+    importtime = None
+    for _ in range(max(1, args.runs)):
+        timings, stderr = run_once()
+        results.append(timings)
+        importtime = importtime or stderr
+
+    print(f"Cold start of lambda_handler, median of {len(results)} runs:")
+    medians = {}
+    for phase in PHASES:
+        medians[phase] = statistics.median(timings[phase] for timings in results) * 1000
+        print(f"  {phase:<8} {medians[phase]:8.1f} ms")
+    print(f"  {'total':<8} {sum(medians.values()):8.1f} ms")
+
+    print(f"\nHeaviest top-level imports (first run):")
+    for name, micros in heaviest_imports(importtime, args.top):
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    if args.max_import_ms is not None and medians['import'] > args.max_import_ms:
+        print(f"\n✗ Import took {medians['import']:.1f} ms (limit {args.max_import_ms:.1f} ms)")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
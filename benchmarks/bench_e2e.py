@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of search_and_cleanup against a simulated mailbox
+
+Each scenario generates a fresh synthetic mailbox (benchmarks/fake_gmail.py),
+serves it from this process and runs one cleanup in a child interpreter
+pointed at it with GMAIL_API_ROOT, so peak RSS belongs to the cleanup alone.
+Targets:
+  email_cleanup  - GmailCleanup.search_and_cleanup (--execute, no cache)
+  lambda         - LambdaGmailCleanup.search_and_cleanup
+
+Reported per scenario: wall time, messages per second, Gmail calls per
+message (batch parts counted individually), bytes sent and received, peak RSS
+and time spent in each stage:
+  list      - messages.list pages
+  fetch     - batch messages.get
+  decode    - reading and decoding From/Subject headers
+  classify  - allowlist and rule checks (excluding decode)
+  trash     - batchModify
+Stage times are summed across threads, and the cleanup's own console output
+is discarded. Gmail quota pacing is off unless --quota is given.
+
+Results can be written as JSON and compared with a stored baseline: a metric
+more than --tolerance worse than the baseline counts as a regression and
+makes the script exit with status 1.
+
+Usage:
+    python benchmarks/bench_e2e.py
+    python benchmarks/bench_e2e.py --sizes 1000 10000 --targets lambda --output results.json
+    python benchmarks/bench_e2e.py --sizes 1000 10000 --update-baseline
+    python benchmarks/bench_e2e.py --latency 0.02 --throttle-rate 0.01
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+
+TARGETS = ('email_cleanup', 'lambda')
+STAGES = ('list', 'fetch', 'decode', 'classify', 'trash')
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_BASELINE = os.path.join(HERE, 'e2e_baseline.json')
+
+# Metrics compared with the baseline (all lower-is-better)
+COMPARED_METRICS = ('wall_seconds', 'api_calls_per_message', 'bytes_per_message', 'peak_rss_mb')
+
+
+class StageTimer:
+    """Thread-safe accumulator of time spent per pipeline stage."""
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self._lock = threading.Lock()
+
+    def add(self, stage, elapsed):
+        with self._lock:
+            self.seconds[stage] += elapsed
+
+    def wrap(self, stage, func):
+        """Return func, timed into stage."""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_generator(self, stage, func):
+        """Return generator function func, timing each step into stage."""
+        def timed(*args, **kwargs):
+            iterator = iter(func(*args, **kwargs))
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+                yield item
+        return timed
+
+
+def peak_rss_mb():
+    """float: Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_child(target, api_root, quota):
+    """
+    Run one cleanup in this (fresh) interpreter and print its measurements.
+
+    Args:
+        target (str): One of TARGETS
+        api_root (str): URL of the fake Gmail server
+        quota (bool): Keep Gmail quota pacing on
+    """
+    os.environ['GMAIL_API_ROOT'] = api_root
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    from fake_gmail import fake_credentials, StaticCredentialCache
+    from gmail_pipeline import build_service
+
+    timer = StageTimer()
+    if target == 'email_cleanup':
+        import email_cleanup as module
+        if not quota:
+            module.GMAIL_QUOTA_UNITS_PER_SECOND = None
+        cls = module.GmailCleanup
+        module.iter_message_pages = timer.wrap_generator('list', module.iter_message_pages)
+    else:
+        import lambda_handler as module
+        cls = module.LambdaGmailCleanup
+        cls._search_pages = timer.wrap_generator('list', cls._search_pages)
+    module.batch_get_messages = timer.wrap('fetch', module.batch_get_messages)
+    module.batch_trash_messages = timer.wrap('trash', module.batch_trash_messages)
+
+    # classify is measured around the whole decision and decode subtracted below
+    cls._get_sender_and_subject = timer.wrap('decode', cls._get_sender_and_subject)
+    cls._classify_message = timer.wrap('classify', cls._classify_message)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if target == 'email_cleanup':
+            cleanup = cls(
+                dry_run=False, max_messages=None, use_cache=False, plan_file=None,
+                creds=fake_credentials()
+            )
+        else:
+            service = build_service(fake_credentials(), root_url=api_root)
+            cleanup = cls(
+                credential_cache=StaticCredentialCache(fake_credentials(), service),
+                quota_units_per_second=module.GMAIL_USER_QUOTA_PER_SECOND if quota else None
+            )
+        start = time.perf_counter()
+        stats = cleanup.search_and_cleanup()
+        wall = time.perf_counter() - start
+
+    stages = dict(timer.seconds)
+    stages['classify'] = max(0.0, stages['classify'] - stages['decode'])
+    print(json.dumps({
+        'wall_seconds': wall,
+        'stages': stages,
+        'stats': stats,
+        'peak_rss_mb': peak_rss_mb(),
+    }))
+
+
+def run_scenario(target, size, args):
+    """
+    Benchmark one target against a fresh mailbox of the given size.
+
+    Returns:
+        dict: Measurements for the results file
+    """
+    sys.path.insert(0, HERE)
+    from fake_gmail import SyntheticMailbox, FakeGmailServer
+
+    mailbox = SyntheticMailbox(size, seed=args.seed)
+    server = FakeGmailServer(
+        mailbox, latency=args.latency, jitter=args.jitter,
+        throttle_rate=args.throttle_rate, seed=args.seed
+    )
+    command = [sys.executable, os.path.abspath(__file__), '--child', target, '--api-root', server.url]
+    if args.quota:
+        command.append('--quota')
+    with server, tempfile.TemporaryDirectory() as workdir:
+        # Run where stray state files (e.g. sync_state.json) can't touch the repo
+        result = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{target} run failed:\n{result.stderr or result.stdout}")
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+
+    calls = sum(server.stats['calls'].values())
+    transferred = server.stats['bytes_sent'] + server.stats['bytes_received']
+    return {
+        'target': target,
+        'messages': size,
+        'wall_seconds': round(child['wall_seconds'], 3),
+        'messages_per_second': round(size / child['wall_seconds'], 1),
+        'api_calls': dict(server.stats['calls']),
+        'api_calls_per_message': round(calls / size, 4),
+        'http_requests': server.stats['http_requests'],
+        'throttled': server.stats['throttled'],
+        'bytes_sent': server.stats['bytes_sent'],
+        'bytes_received': server.stats['bytes_received'],
+        'bytes_per_message': round(transferred / size, 1),
+        'peak_rss_mb': round(child['peak_rss_mb'], 1),
+        'stages': {stage: round(seconds, 3) for stage, seconds in child['stages'].items()},
+        'stats': child['stats'],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline document.
+
+    Returns:
+        list: (target, messages, metric, baseline, current) for every regression
+    """
+    previous = {(r['target'], r['messages']): r for r in baseline.get('results', [])}
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created', 'unknown date')}:")
+    for result in results:
+        old = previous.get((result['target'], result['messages']))
+        if old is None:
+            print(f"  {result['target']:<14} {result['messages']:>7}  (not in baseline)")
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            if not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric]
+            marker = ' ✗' if change > tolerance else ''
+            changes.append(f"{metric} {change:+.1%}{marker}")
+            if change > tolerance:
+                regressions.append((result['target'], result['messages'], metric,
+                                    old[metric], result[metric]))
+        print(f"  {result['target']:<14} {result['messages']:>7}  " + ', '.join(changes))
+    return regressions
+
+
+def print_results(results):
+    header = (f"{'target':<14} {'messages':>8} {'wall s':>8} {'msg/s':>8} {'calls/msg':>9} "
+              f"{'bytes/msg':>9} {'RSS MB':>7}  " + ' '.join(f"{stage:>8}" for stage in STAGES))
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        stages = ' '.join(f"{r['stages'][stage]:>8.2f}" for stage in STAGES)
+        print(f"{r['target']:<14} {r['messages']:>8} {r['wall_seconds']:>8.2f} "
+              f"{r['messages_per_second']:>8.0f} {r['api_calls_per_message']:>9.3f} "
+              f"{r['bytes_per_message']:>9.0f} {r['peak_rss_mb']:>7.1f}  {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='Mailbox sizes (default: 1000 10000 100000)')
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS),
+                        help='What to benchmark (default: both)')
+    parser.add_argument('--seed', type=int, default=0, help='Mailbox seed (default: 0)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds of simulated latency per HTTP request (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random latency, up to seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of calls answered with 429 (default: 0)')
+    parser.add_argument('--quota', action='store_true', help='Keep Gmail quota pacing on')
+    parser.add_argument('--output', metavar='PATH', help='Write results as JSON')
+    parser.add_argument('--baseline', metavar='PATH', default=DEFAULT_BASELINE,
+                        help='Baseline to compare with (default: benchmarks/e2e_baseline.json)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Save these results as the baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Allowed slowdown before a metric counts as a regression (default: 0.10)')
+    parser.add_argument('--child', choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument('--api-root', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.api_root, args.quota)
+        return
+
+    results = []
+    for size in args.sizes:
+        for target in args.targets:
+            print(f"Running {target} against {size} messages...", flush=True)
+            results.append(run_scenario(target, size, args))
+
+    document = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'seed': args.seed, 'latency': args.latency, 'jitter': args.jitter,
+            'throttle_rate': args.throttle_rate, 'quota': args.quota
+        },
+        'results': results,
+    }
+
+    print()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"✓ Baseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; save one with --update-baseline")
+        return
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != document['settings']:
+        print("\n⚠ Baseline was recorded with different settings; comparison may be misleading")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n✗ {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}:")
+        for target, messages, metric, old, new in regressions:
+            print(f"  {target} @ {messages}: {metric} {old} -> {new}")
+        sys.exit(1)
+    print(f"\n✓ No regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark subject keyword matching strategies
+
+Compares, at 10, 100, 1,000 and 10,000 keywords:
+  loop       - the original "for keyword in keywords: if keyword.lower() in subject.lower()"
+  literals   - the same loop over pre-lowercased keywords, subject lowercased once
+               (rules.SubjectKeywordMatcher below aho_corasick.AUTOMATON_MIN_KEYWORDS)
+  regex      - one combined lookahead regex over all keywords
+  automaton  - Aho-Corasick (aho_corasick.KeywordAutomaton, large lists)
+
+Usage:
+    python benchmarks/bench_keywords.py
+    python benchmarks/bench_keywords.py --subjects 5000 --sizes 10 100
+"""
+
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aho_corasick import KeywordAutomaton  # noqa: E402
+
+WORDS = [
+    "weekly", "digest", "sale", "offer", "your", "order", "invoice", "meeting", "update",
+    "newsletter", "account", "reminder", "exclusive", "deal", "save", "today", "news",
+    "report", "summary", "welcome", "confirm", "shipping", "event", "webinar", "free",
+]
+
+
+def make_keywords(count, rng):
+    """Synthetic brand names and campaign tags, plus the default config keywords."""
+    keywords = ["newsletter", "unsubscribe", "promotional", "promotion", "unsubscribe here"]
+    while len(keywords) < count:
+        length = rng.randint(5, 12)
+        keywords.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+    return keywords[:count]
+
+
+def make_subjects(count, keywords, rng, hit_rate=0.3):
+    """Subjects of 4-10 words; hit_rate of them contain a random keyword."""
+    subjects = []
+    for _ in range(count):
+        words = [rng.choice(WORDS).title() for _ in range(rng.randint(4, 10))]
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(keywords).title())
+        subjects.append(' '.join(words))
+    return subjects
+
+
+def loop_matcher(keywords):
+    def match(subject):
+        for keyword in keywords:
+            if keyword.lower() in subject.lower():
+                return keyword
+        return None
+    return match
+
+
+def literals_matcher(keywords):
+    lowered = [keyword.lower() for keyword in keywords]
+
+    def match(subject):
+        subject = subject.lower()
+        for position, keyword in enumerate(lowered):
+            if keyword in subject:
+                return keywords[position]
+        return None
+    return match
+
+
+def regex_matcher(keywords):
+    index = {}
+    for position, keyword in enumerate(keywords):
+        index.setdefault(keyword.lower(), position)
+    regex = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in index) + '))')
+
+    def match(subject):
+        best = None
+        for hit in regex.finditer(subject.lower()):
+            position = index[hit.group(1)]
+            if best is None or position < best:
+                best = position
+        return None if best is None else keywords[best]
+    return match
+
+
+def automaton_matcher(keywords):
+    automaton = KeywordAutomaton([keyword.lower() for keyword in keywords])
+
+    def match(subject):
+        position = automaton.first(subject.lower())
+        return None if position is None else keywords[position]
+    return match
+
+
+STRATEGIES = [
+    ('loop', loop_matcher),
+    ('literals', literals_matcher),
+    ('regex', regex_matcher),
+    ('automaton', automaton_matcher),
+]
+
+
+def bench(match, subjects, min_time=0.2):
+    """Return (microseconds per subject, results) for the fastest of 3 timed passes."""
+    results = [match(subject) for subject in subjects]
+    best = None
+    for _ in range(3):
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            for subject in subjects:
+                match(subject)
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_subject = elapsed / (runs * len(subjects)) * 1e6
+        best = per_subject if best is None else min(best, per_subject)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark subject keyword matchers')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--subjects', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'keywords':>9} {'strategy':>10} {'build ms':>9} {'us/subject':>11} {'speedup':>8}")
+    print("-" * 52)
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        keywords = make_keywords(size, rng)
+        subjects = make_subjects(args.subjects, keywords, rng)
+        baseline = None
+        reference = None
+        for name, factory in STRATEGIES:
+            start = time.perf_counter()
+            match = factory(keywords)
+            build_ms = (time.perf_counter() - start) * 1000
+            per_subject, results = bench(match, subjects)
+            if reference is None:
+                baseline, reference = per_subject, results
+            elif results != reference:
+                print(f"✗ {name} disagrees with loop at {size} keywords")
+                sys.exit(1)
+            print(f"{size:>9} {name:>10} {build_ms:>9.1f} {per_subject:>11.2f} {baseline / per_subject:>7.1f}x")
+        print()
+
+
+if __name__ == '__main__':
+    main()
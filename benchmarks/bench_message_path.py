@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the per-message CPU path of GmailCleanup
+
+Every fetched message goes through
+    _get_sender_and_subject -> _decode_header -> _is_allowlisted -> _matches_rules
+and this script times each step on its own over realistic inputs:
+  decode_header   - plain ASCII and RFC 2047 encoded subjects and display names
+                    (UTF-8, ISO-8859-1, Shift_JIS, KOI8-R, GB2312; B and Q
+                    encoding; multi-word folded headers)
+  sender_subject  - header extraction from metadata (2 headers) and full
+                    (~15 headers) messages
+  allowlist       - allowlists of 4 (config default) to 10,000 entries mixing
+                    addresses, partial names, domains and *.domains
+  rules           - subject keyword lists of 5 (config default) to 10,000
+                    keywords, plus the no-reply and category rules
+
+For each case it reports operations per second and the memory allocated per
+operation (peak traced by tracemalloc while one operation runs, averaged
+over a sample; CPython does not expose a cumulative allocation count).
+
+Usage:
+    python benchmarks/bench_message_path.py
+    python benchmarks/bench_message_path.py --only allowlist rules --output micro.json
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from email.header import Header
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+from allowlist import AllowlistIndex  # noqa: E402
+from config import UNWANTED_RULES, ALLOWLIST  # noqa: E402
+from email_cleanup import GmailCleanup  # noqa: E402
+from fake_gmail import DEFAULT_SENDERS, ENCODED_SUBJECTS, SUBJECTS  # noqa: E402
+from rules import RuleSet  # noqa: E402
+
+BENCHMARKS = ('decode_header', 'sender_subject', 'allowlist', 'rules')
+ALLOWLIST_SIZES = (4, 100, 1000, 10000)
+KEYWORD_SIZES = (5, 100, 1000, 10000)
+
+# Extra headers of a typical message in the 'full' format
+FULL_HEADERS = [
+    'Delivered-To', 'Received', 'X-Received', 'ARC-Seal', 'ARC-Message-Signature',
+    'Return-Path', 'Received-SPF', 'Authentication-Results', 'DKIM-Signature',
+    'MIME-Version', 'Date', 'Message-ID', 'To', 'Content-Type', 'List-Unsubscribe',
+]
+
+
+def make_cleanup(rules=UNWANTED_RULES, allowlist=ALLOWLIST):
+    """GmailCleanup with compiled rules and allowlist but no Gmail service."""
+    cleanup = GmailCleanup.__new__(GmailCleanup)
+    cleanup.rules = RuleSet.from_config(rules)
+    cleanup.allowlist = AllowlistIndex.from_config(allowlist)
+    return cleanup
+
+
+def encoded(rng, number):
+    charset, template = rng.choice(ENCODED_SUBJECTS)
+    return Header(template.format(n=number), charset).encode()
+
+
+def header_corpus(rng, count):
+    """Header values by kind: plain, encoded (single word) and folded multi-word."""
+    plain = [rng.choice(rng.choice(list(SUBJECTS.values()))).format(n=i) for i in range(count)]
+    single = [encoded(rng, i) for i in range(count)]
+    folded = [
+        Header(ENCODED_SUBJECTS[i % len(ENCODED_SUBJECTS)][1].format(n=i) * 4,
+               ENCODED_SUBJECTS[i % len(ENCODED_SUBJECTS)][0]).encode()
+        for i in range(count)
+    ]
+    names = []
+    for i in range(count):
+        name, _, address = rng.choice(DEFAULT_SENDERS)[0].partition(' <')
+        names.append(f"{Header(name + ' ✉', 'utf-8').encode()} <{address}")
+    return {'plain': plain, 'encoded': single, 'folded': folded, 'display_name': names}
+
+
+def message_corpus(rng, count, full):
+    """Gmail message resources with From/Subject (and the usual extras if full)."""
+    messages = []
+    for i in range(count):
+        sender = rng.choice(DEFAULT_SENDERS)[0]
+        if rng.random() < 0.2:
+            name, _, address = sender.partition(' <')
+            sender = f"\"{name}, Team\" <{address}"
+        subject = encoded(rng, i) if rng.random() < 0.2 else f"Weekly newsletter {i}"
+        headers = [{'name': 'From', 'value': sender}, {'name': 'Subject', 'value': subject}]
+        if full:
+            headers = [{'name': name, 'value': f"value {i}"} for name in FULL_HEADERS[:8]] + \
+                headers + [{'name': name, 'value': f"value {i}"} for name in FULL_HEADERS[8:]]
+        messages.append({'id': f"{i:016x}", 'payload': {'headers': headers}, 'labelIds': []})
+    return messages
+
+
+def random_word(rng, low=5, high=12):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def make_allowlist(rng, size):
+    """Allowlist of size entries: 40% addresses, 20% partial names, 40% domains."""
+    if size <= len(ALLOWLIST['senders']):
+        return dict(ALLOWLIST)
+    senders, domains = [], []
+    for i in range(size):
+        kind = i % 5
+        if kind < 2:
+            senders.append(f"{random_word(rng)}.{random_word(rng)}@{random_word(rng)}.com")
+        elif kind == 2:
+            senders.append(f"{random_word(rng)} {random_word(rng)}")
+        elif kind == 3:
+            domains.append(f"{random_word(rng)}.org")
+        else:
+            domains.append(f"*.{random_word(rng)}.net")
+    return {'senders': senders, 'domains': domains}
+
+
+def sender_corpus(rng, allowlist, count, hit_rate=0.3):
+    """Sender addresses; hit_rate of them are covered by the allowlist."""
+    senders = []
+    for _ in range(count):
+        if rng.random() < hit_rate and (allowlist['senders'] or allowlist['domains']):
+            entry = rng.choice(allowlist['senders'] + allowlist['domains'])
+            if entry.startswith('*.'):
+                sender = f"news@mail.{entry[2:]}"
+            elif '@' in entry:
+                sender = entry
+            elif '.' in entry and ' ' not in entry:
+                sender = f"billing@{entry}"
+            else:
+                sender = f"{entry.replace(' ', '.')}@example.com"
+        else:
+            sender = f"{random_word(rng)}@{random_word(rng)}.com"
+        senders.append(sender)
+    return senders
+
+
+def make_rules(rng, keyword_count):
+    rules = json.loads(json.dumps(UNWANTED_RULES))
+    keywords = list(rules['subject_keywords']['keywords'])
+    while len(keywords) < keyword_count:
+        keywords.append(random_word(rng))
+    rules['subject_keywords']['keywords'] = keywords[:keyword_count]
+    return rules, keywords[:keyword_count]
+
+
+def rule_corpus(rng, keywords, count, hit_rate=0.3):
+    """(sender, subject, labels) triples; hit_rate of subjects contain a keyword."""
+    cases = []
+    words = [random_word(rng, 3, 8) for _ in range(200)]
+    for _ in range(count):
+        subject = [rng.choice(words).title() for _ in range(rng.randint(4, 10))]
+        if rng.random() < hit_rate:
+            subject.insert(rng.randrange(len(subject) + 1), rng.choice(keywords).title())
+        sender = rng.choice(DEFAULT_SENDERS)[0].partition('<')[2].rstrip('>')
+        labels = ['INBOX', rng.choice(['CATEGORY_PERSONAL', 'CATEGORY_UPDATES', 'CATEGORY_PROMOTIONS'])]
+        cases.append((sender, ' '.join(subject), labels))
+    return cases
+
+
+def measure(operation, inputs, min_time, sample=200):
+    """
+    Time operation over inputs and sample its memory allocation.
+
+    Args:
+        operation (callable): Called with one input at a time
+        inputs (list): Inputs, cycled through
+        min_time (float): Seconds each of 3 timed passes runs at least
+        sample (int): Inputs used for the allocation measurement
+
+    Returns:
+        dict: ops_per_second (best of 3 passes) and bytes_per_op
+    """
+    best = None
+    for _ in range(3):
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            for item in inputs:
+                operation(item)
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        rate = runs * len(inputs) / elapsed
+        best = rate if best is None else max(best, rate)
+
+    tracemalloc.start()
+    total = 0
+    sampled = inputs[:sample]
+    for item in sampled:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        operation(item)
+        total += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return {'ops_per_second': round(best), 'bytes_per_op': round(total / len(sampled))}
+
+
+def run(selected, count, min_time, seed):
+    """
+    Run the selected benchmarks.
+
+    Returns:
+        list: Result dicts (benchmark, case, ops_per_second, bytes_per_op)
+    """
+    results = []
+
+    def record(benchmark, case, operation, inputs):
+        result = {'benchmark': benchmark, 'case': case}
+        result.update(measure(operation, inputs, min_time))
+        results.append(result)
+        print(f"{benchmark:<15} {case:<22} {result['ops_per_second']:>12,} "
+              f"{1e6 / result['ops_per_second']:>9.2f} {result['bytes_per_op']:>9,}", flush=True)
+
+    cleanup = make_cleanup()
+
+    if 'decode_header' in selected:
+        rng = random.Random(seed)
+        for kind, values in header_corpus(rng, count).items():
+            record('decode_header', kind, cleanup._decode_header, values)
+
+    if 'sender_subject' in selected:
+        rng = random.Random(seed)
+        for fmt in ('metadata', 'full'):
+            record('sender_subject', fmt, cleanup._get_sender_and_subject,
+                   message_corpus(rng, count, fmt == 'full'))
+
+    if 'allowlist' in selected:
+        for size in ALLOWLIST_SIZES:
+            rng = random.Random(seed)
+            allowlist = make_allowlist(rng, size)
+            start = time.perf_counter()
+            checker = make_cleanup(allowlist=allowlist)
+            build_ms = (time.perf_counter() - start) * 1000
+            record('allowlist', f"{size} entries", checker._is_allowlisted,
+                   sender_corpus(rng, allowlist, count))
+            results[-1]['build_ms'] = round(build_ms, 2)
+
+    if 'rules' in selected:
+        for size in KEYWORD_SIZES:
+            rng = random.Random(seed)
+            rules, keywords = make_rules(rng, size)
+            checker = make_cleanup(rules=rules)
+            cases = rule_corpus(rng, keywords, count)
+            record('rules', f"{size} keywords",
+                   lambda case: checker._matches_rules(case[0], case[1], {'labelIds': case[2]}),
+                   cases)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help='Benchmarks to run (default: all)')
+    parser.add_argument('--inputs', type=int, default=2000, help='Inputs per case (default: 2000)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Seconds per timed pass (default: 0.2)')
+    parser.add_argument('--seed', type=int, default=42, help='Corpus seed (default: 42)')
+    parser.add_argument('--output', metavar='PATH', help='Write results as JSON')
+    args = parser.parse_args()
+
+    print(f"{'benchmark':<15} {'case':<22} {'ops/sec':>12} {'us/op':>9} {'bytes/op':>9}")
+    print('-' * 71)
+    results = run(args.only, args.inputs, args.min_time, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'seed': args.seed, 'inputs': args.inputs, 'results': results}, f, indent=2)
+        print(f"\n✓ Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
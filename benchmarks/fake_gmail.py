@@ -0,0 +1,967 @@
+#!/usr/bin/env python3
+"""
+In-process stand-in for the Gmail API, for benchmarking without a real account
+
+SyntheticMailbox generates a seeded, reproducible mailbox: senders drawn from
+a weighted distribution (newsletters, no-reply senders, allowlisted contacts,
+a long tail of personal senders), Gmail category and system labels, and a
+share of RFC 2047 encoded subjects and display names in several charsets.
+
+FakeGmailServer serves it over HTTP on localhost, implementing the calls the
+cleanup pipeline makes:
+
+  GET  users/me/messages              messages.list (paging, maxResults, labelIds, q)
+  GET  users/me/messages/{id}         messages.get (minimal, metadata, full, raw)
+  POST users/me/messages/{id}/trash   messages.trash
+  POST users/me/messages/batchModify  messages.batchModify
+  GET  users/me/history               history.list
+  GET  users/me/profile               getProfile
+  GET  users/me/labels                labels.list
+  POST batch                          batch requests (up to 100 calls)
+
+Every HTTP request can be delayed (latency, jitter) and every call, including
+each part of a batch, can be refused with 429 rateLimitExceeded at a given
+rate. The q parser understands from:, to:, subject:, category:, label:, in:,
+is:, older_than:, newer_than:, before:, after:, bare words, quoted phrases,
+OR, - and parentheses. Terms match as case-insensitive substrings, which is
+looser than Gmail's word matching; the client-side rules still decide.
+
+Pointing the cleanup classes at a running server:
+
+    with FakeGmailServer(SyntheticMailbox(10000)) as server:
+        cleanup = GmailCleanup(creds=fake_credentials(), api_root=server.url)
+        service = build_service(fake_credentials(), root_url=server.url)
+        lambda_cleanup = LambdaGmailCleanup(
+            credential_cache=StaticCredentialCache(fake_credentials(), service),
+            api_root=server.url
+        )
+
+or run it standalone and set GMAIL_API_ROOT=http://127.0.0.1:PORT/ for the
+process under test.
+
+Usage:
+    python benchmarks/fake_gmail.py --messages 10000 --port 8025
+    python benchmarks/fake_gmail.py --messages 1000 --latency 0.05 --throttle-rate 0.02
+"""
+
+import argparse
+import base64
+import bisect
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.header import Header, decode_header, make_header
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# (From header, relative weight, Gmail category label)
+DEFAULT_SENDERS = [
+    ("Deals Team <no-reply@shop.example.com>", 12, 'CATEGORY_PROMOTIONS'),
+    ("The Weekly Digest <newsletter@news.example.org>", 10, 'CATEGORY_PROMOTIONS'),
+    ("Store Promotions <promo@store.example>", 6, 'CATEGORY_PROMOTIONS'),
+    ("GitHub <noreply@github.com>", 8, 'CATEGORY_UPDATES'),
+    ("Bank Alerts <no-reply@alerts.bank.example>", 5, 'CATEGORY_UPDATES'),
+    ("Windsor Metro West <no-reply@windsormetrowest.example>", 2, 'CATEGORY_UPDATES'),
+    ("Social Network <notifications@social.example.com>", 8, 'CATEGORY_SOCIAL'),
+    ("Community Forum <digest@forum.example.net>", 4, 'CATEGORY_FORUMS'),
+    ("Texas Oncology <appointments@texasoncology.example>", 2, 'CATEGORY_PERSONAL'),
+    ("Kelvin Guerra <kelvin.guerra@example.com>", 3, 'CATEGORY_PERSONAL'),
+    ("Alice Smith <alice@example.com>", 10, 'CATEGORY_PERSONAL'),
+    ("Bob Jones <bob.jones@work.example>", 8, 'CATEGORY_PERSONAL'),
+]
+
+# Subject templates by category; {n} is a running number
+SUBJECTS = {
+    'CATEGORY_PROMOTIONS': [
+        "{n}% off everything this weekend",
+        "Promotional offer just for you",
+        "Last chance: the sale ends tonight",
+        "The Weekly Newsletter - issue {n}",
+        "Your digest for this week (unsubscribe anytime)",
+    ],
+    'CATEGORY_UPDATES': [
+        "Your order #{n} has shipped",
+        "Security alert for your account",
+        "[repo] Pull request #{n} merged",
+        "Statement {n} is ready",
+    ],
+    'CATEGORY_SOCIAL': [
+        "Someone mentioned you in a comment",
+        "You have {n} new notifications",
+    ],
+    'CATEGORY_FORUMS': [
+        "Re: [list] thread {n}",
+        "[list] Weekly summary {n}",
+    ],
+    'CATEGORY_PERSONAL': [
+        "Lunch on Thursday?",
+        "Re: project notes {n}",
+        "Meeting follow-up",
+        "Photos from the weekend",
+        "Appointment reminder {n}",
+    ],
+}
+
+# (charset, text) pairs used for RFC 2047 encoded subjects
+ENCODED_SUBJECTS = [
+    ('utf-8', "Résumé de la newsletter n°{n} ✓"),
+    ('iso-8859-1', "Promoción especial número {n}"),
+    ('shift_jis', "ニュースレター 第{n}号"),
+    ('koi8-r', "Рассылка новостей {n}"),
+    ('gb2312', "促销活动 第{n}期"),
+]
+
+# Probability that a message carries each label (the category comes from the sender)
+DEFAULT_LABEL_MIX = {'INBOX': 0.85, 'UNREAD': 0.4, 'IMPORTANT': 0.1, 'STARRED': 0.03}
+
+BODY_TEXT = (
+    "Hello,\n\nThis is a synthetic message generated for benchmarking the email "
+    "cleanup pipeline. It has no meaning beyond taking up a realistic number of "
+    "bytes on the wire.\n\nBest regards,\nThe benchmark\n"
+)
+
+# Gmail methods by route, named as in rate_limiter.QUOTA_UNITS
+_ROUTES = [
+    ('GET', re.compile(r'^/gmail/v1/users/[^/]+/messages$'), 'messages.list'),
+    ('POST', re.compile(r'^/gmail/v1/users/[^/]+/messages/batchModify$'), 'messages.batchModify'),
+    ('GET', re.compile(r'^/gmail/v1/users/[^/]+/messages/([^/]+)$'), 'messages.get'),
+    ('POST', re.compile(r'^/gmail/v1/users/[^/]+/messages/([^/]+)/trash$'), 'messages.trash'),
+    ('GET', re.compile(r'^/gmail/v1/users/[^/]+/history$'), 'history.list'),
+    ('GET', re.compile(r'^/gmail/v1/users/[^/]+/profile$'), 'getProfile'),
+    ('GET', re.compile(r'^/gmail/v1/users/[^/]+/labels$'), 'labels.list'),
+]
+
+_BATCH_PATHS = ('/batch', '/batch/gmail/v1')
+
+# historyTypes values -> record keys
+_HISTORY_TYPES = {
+    'messageAdded': 'messagesAdded',
+    'messageDeleted': 'messagesDeleted',
+    'labelAdded': 'labelsAdded',
+    'labelRemoved': 'labelsRemoved',
+}
+
+GMAIL_MAX_BATCH_CALLS = 100
+
+
+class FakeGmailError(Exception):
+    """Error response in Gmail's JSON error format."""
+
+    def __init__(self, status, message, reason):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+    def body(self):
+        return {
+            'error': {
+                'code': self.status,
+                'message': str(self),
+                'errors': [{'message': str(self), 'domain': 'global', 'reason': self.reason}]
+            }
+        }
+
+
+_BLANK_LINE = re.compile(rb'\r?\n\r?\n')
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def _split_head(data):
+    """Split HTTP-style data into (head, body) at the first blank line."""
+    match = _BLANK_LINE.search(data)
+    if match is None:
+        return data, b''
+    return data[:match.start()], data[match.end():]
+
+
+def _split_multipart(content_type, body):
+    """
+    Split a multipart/mixed body without the email package (too slow for 100k).
+
+    Returns:
+        list: (headers dict with lowercase names, payload bytes) per part, or
+            None if content_type is not multipart with a boundary
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not content_type.startswith('multipart/') or match is None:
+        return None
+    delimiter = b'--' + match.group(1).encode('latin-1')
+    parts = []
+    for chunk in body.split(delimiter)[1:]:
+        if chunk.startswith(b'--'):
+            break
+        head, payload = _split_head(chunk.lstrip(b'\r\n'))
+        headers = {}
+        for line in head.decode('latin-1').splitlines():
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        parts.append((headers, payload.rstrip(b'\r\n')))
+    return parts
+
+
+def _decode(value):
+    """Decode an RFC 2047 header value for searching."""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+# ---------------------------------------------------------------------------
+# Search query subset
+# ---------------------------------------------------------------------------
+
+_TOKEN = re.compile(r'\(|\)|-(?=[^\s)])|[^\s()"]*"[^"]*"|[^\s()]+')
+_SPAM_TRASH_SCOPES = {'in:trash', 'in:spam', 'in:anywhere', 'label:trash', 'label:spam'}
+_AGE_UNITS = {'d': 86400, 'm': 30 * 86400, 'y': 365 * 86400}
+
+
+def _date_ms(value):
+    """Parse before:/after: values (YYYY/MM/DD, YYYY-MM-DD or epoch seconds) to ms."""
+    if value.isdigit():
+        return int(value) * 1000
+    date = datetime.strptime(value.replace('-', '/'), '%Y/%m/%d').replace(tzinfo=timezone.utc)
+    return int(date.timestamp() * 1000)
+
+
+def _term(token, now_ms):
+    """Compile one search term into a predicate over stored messages."""
+    operator, _, value = token.partition(':')
+    if not value:
+        operator, value = '', token
+    operator = operator.lower()
+    value = value.strip('"').lower()
+
+    if operator == 'from':
+        return lambda m: value in m['search_from']
+    if operator == 'to':
+        return lambda m: value in m['search_to']
+    if operator == 'subject':
+        return lambda m: value in m['search_subject']
+    if operator == 'category':
+        label = 'CATEGORY_PERSONAL' if value == 'primary' else f"CATEGORY_{value.upper()}"
+        return lambda m: label in m['labelIds']
+    if operator in ('label', 'in'):
+        if value == 'anywhere':
+            return lambda m: True
+        label = value.replace('-', '_')
+        return lambda m: any(candidate.lower() == label for candidate in m['labelIds'])
+    if operator == 'is':
+        if value == 'read':
+            return lambda m: 'UNREAD' not in m['labelIds']
+        return lambda m: value.upper() in m['labelIds']
+    if operator in ('older_than', 'newer_than'):
+        cutoff = now_ms - int(value[:-1]) * _AGE_UNITS[value[-1]] * 1000
+        if operator == 'older_than':
+            return lambda m: m['internalDate'] < cutoff
+        return lambda m: m['internalDate'] >= cutoff
+    if operator in ('before', 'after'):
+        cutoff = _date_ms(value)
+        if operator == 'before':
+            return lambda m: m['internalDate'] < cutoff
+        return lambda m: m['internalDate'] >= cutoff
+    text = token.strip('"').lower()
+    return lambda m: text in m['search_text']
+
+
+def compile_query(query, now_ms):
+    """
+    Compile a Gmail q string into a predicate.
+
+    Args:
+        query (str): Search query (empty = match everything)
+        now_ms (int): Reference time for older_than:/newer_than:, in epoch ms
+
+    Returns:
+        tuple: (predicate(message) -> bool, scopes_spam_trash) where the flag is
+            True if the query names in:trash, in:spam or in:anywhere
+
+    Raises:
+        FakeGmailError: If the query cannot be parsed
+    """
+    tokens = _TOKEN.findall(query or '')
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def conjunction():
+        terms = []
+        while peek() not in (None, ')'):
+            terms.append(disjunction())
+        return lambda m: all(term(m) for term in terms)
+
+    def disjunction():
+        terms = [unary()]
+        while peek() == 'OR':
+            take()
+            terms.append(unary())
+        if len(terms) == 1:
+            return terms[0]
+        return lambda m: any(term(m) for term in terms)
+
+    def unary():
+        token = take()
+        if token == '-':
+            inner = unary()
+            return lambda m: not inner(m)
+        if token == '(':
+            inner = conjunction()
+            if peek() != ')':
+                raise FakeGmailError(400, f"Invalid query: {query}", 'invalidArgument')
+            take()
+            return inner
+        if token == ')':
+            raise FakeGmailError(400, f"Invalid query: {query}", 'invalidArgument')
+        return _term(token, now_ms)
+
+    try:
+        predicate = conjunction()
+    except (ValueError, KeyError, IndexError):
+        raise FakeGmailError(400, f"Invalid query: {query}", 'invalidArgument')
+    if position != len(tokens):
+        raise FakeGmailError(400, f"Invalid query: {query}", 'invalidArgument')
+    scoped = any(token.lower() in _SPAM_TRASH_SCOPES for token in tokens)
+    return predicate, scoped
+
+
+# ---------------------------------------------------------------------------
+# Mailbox
+# ---------------------------------------------------------------------------
+
+class SyntheticMailbox:
+    """Seeded synthetic mailbox with labels and a Gmail-style change history."""
+
+    def __init__(self, size=1000, seed=0, senders=None, long_tail=200, label_mix=None,
+                 encoded_rate=0.1, days=365, now=None, email_address='me@example.com'):
+        """
+        Args:
+            size (int): Messages to generate
+            seed (int): Random seed; the same arguments give the same mailbox
+            senders (list): (From header, weight, category label) tuples
+                (default: DEFAULT_SENDERS)
+            long_tail (int): Extra one-off personal senders, sharing a quarter
+                of the total sender weight
+            label_mix (dict): Label -> probability a message carries it
+                (default: DEFAULT_LABEL_MIX)
+            encoded_rate (float): Share of subjects and display names that are
+                RFC 2047 encoded
+            days (int): Messages are spread evenly over this many past days
+            now (float): Reference time in epoch seconds (default: current time)
+            email_address (str): Address returned by getProfile
+        """
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.email_address = email_address
+        self.now_ms = int((now if now is not None else time.time()) * 1000)
+        self.days = days
+        self.encoded_rate = encoded_rate
+        self.label_mix = DEFAULT_LABEL_MIX if label_mix is None else label_mix
+
+        senders = list(DEFAULT_SENDERS if senders is None else senders)
+        if long_tail:
+            tail_weight = sum(weight for _, weight, _ in senders) / 3 / long_tail
+            senders += [
+                (f"Person {k} <person{k}@mail{k % 17}.example>", tail_weight, 'CATEGORY_PERSONAL')
+                for k in range(long_tail)
+            ]
+        self._senders = senders
+        self._sender_weights = [weight for _, weight, _ in senders]
+
+        self.messages = {}
+        self._order = []
+        self._next_id = self._random.getrandbits(48) << 8
+        self.history_id = 100000
+        self._history = []
+        self._history_ids = []
+        # Search results by (query, labels, spam/trash, history_id); paging
+        # through a result list would otherwise rescan the mailbox per page
+        self._search_cache = {}
+        self._generate(size, spread=True)
+        # History before the initial mailbox is not available, as after expiry
+        self.min_history_id = self.history_id
+
+    def _encode(self, text):
+        charset, template = self._random.choice(ENCODED_SUBJECTS)
+        return Header(template.format(n=text), charset).encode()
+
+    def _new_message(self, internal_date):
+        header, _, category = self._random.choices(self._senders, self._sender_weights)[0]
+        number = self._random.randint(1, 999)
+        if self._random.random() < self.encoded_rate:
+            subject = self._encode(number)
+        else:
+            subject = self._random.choice(SUBJECTS[category]).format(n=number)
+        sender = header
+        if self._random.random() < self.encoded_rate and '<' in header:
+            name, _, address = header.partition(' <')
+            sender = f"{Header(name + ' ✉', 'utf-8').encode()} <{address}"
+
+        labels = [category]
+        labels += [label for label, share in self.label_mix.items() if self._random.random() < share]
+
+        self._next_id += self._random.randint(1, 255)
+        self.history_id += 1
+        message_id = f"{self._next_id:016x}"
+        date = datetime.fromtimestamp(internal_date / 1000, timezone.utc)
+        headers = [
+            {'name': 'Date', 'value': date.strftime('%a, %d %b %Y %H:%M:%S +0000')},
+            {'name': 'From', 'value': sender},
+            {'name': 'To', 'value': self.email_address},
+            {'name': 'Subject', 'value': subject},
+            {'name': 'Message-ID', 'value': f"<{message_id}@synthetic.example>"},
+            {'name': 'Content-Type', 'value': 'text/plain; charset="UTF-8"'},
+        ]
+        if category == 'CATEGORY_PROMOTIONS':
+            headers.append({'name': 'List-Unsubscribe', 'value': '<mailto:unsubscribe@example.com>'})
+        body = BODY_TEXT.encode('utf-8')
+        decoded_subject = _decode(subject).lower()
+        return {
+            'id': message_id,
+            'threadId': message_id,
+            'labelIds': labels,
+            'internalDate': internal_date,
+            'historyId': self.history_id,
+            'headers': headers,
+            'body': body,
+            'snippet': BODY_TEXT[:100].replace('\n', ' ').strip(),
+            'sizeEstimate': sum(len(h['name']) + len(h['value']) + 4 for h in headers) + len(body),
+            'search_from': _decode(sender).lower() + ' ' + sender.lower(),
+            'search_to': self.email_address,
+            'search_subject': decoded_subject,
+            'search_text': f"{decoded_subject} {_decode(sender).lower()} {BODY_TEXT.lower()}",
+        }
+
+    def _generate(self, count, spread):
+        span_ms = self.days * 86400 * 1000
+        created = []
+        for i in range(count):
+            if spread:
+                internal_date = self.now_ms - span_ms + (span_ms * (i + 1)) // max(1, count)
+            else:
+                internal_date = self.now_ms
+            message = self._new_message(internal_date)
+            self.messages[message['id']] = message
+            created.append(message)
+        # messages.list returns the newest mail first
+        self._order[:0] = [message['id'] for message in reversed(created)]
+        return created
+
+    def _record(self, kind, message, labels=None):
+        """Append a history record for a change (call with the lock held)."""
+        self.history_id += 1
+        message['historyId'] = self.history_id
+        stub = {'id': message['id'], 'threadId': message['threadId'],
+                'labelIds': list(message['labelIds'])}
+        record = {'id': self.history_id, 'messages': [dict(stub)]}
+        if kind == 'messagesAdded':
+            record[kind] = [{'message': stub}]
+        else:
+            record[kind] = [{'message': stub, 'labelIds': labels}]
+        self._history.append(record)
+        self._history_ids.append(self.history_id)
+
+    def add_messages(self, count):
+        """
+        Deliver new mail, recorded in the history as messagesAdded.
+
+        Args:
+            count (int): Messages to add
+
+        Returns:
+            list: IDs of the new messages
+        """
+        with self._lock:
+            self.now_ms = max(self.now_ms, int(time.time() * 1000))
+            created = self._generate(count, spread=False)
+            for message in created:
+                self._record('messagesAdded', message)
+            return [message['id'] for message in created]
+
+    def modify(self, message_ids, add=(), remove=()):
+        """
+        Change labels on existing messages (unknown IDs are ignored).
+
+        Args:
+            message_ids (list): Messages to change
+            add (list): Label IDs to add
+            remove (list): Label IDs to remove
+
+        Returns:
+            int: Messages changed
+        """
+        changed = 0
+        with self._lock:
+            for message_id in message_ids:
+                message = self.messages.get(message_id)
+                if message is None:
+                    continue
+                added = [label for label in add if label not in message['labelIds']]
+                removed = [label for label in remove if label in message['labelIds']]
+                message['labelIds'] = [l for l in message['labelIds'] if l not in removed] + added
+                if added:
+                    self._record('labelsAdded', message, added)
+                if removed:
+                    self._record('labelsRemoved', message, removed)
+                changed += 1
+        return changed
+
+    def get(self, message_id):
+        """Return the stored message or raise a 404 FakeGmailError."""
+        message = self.messages.get(message_id)
+        if message is None:
+            raise FakeGmailError(404, 'Requested entity was not found.', 'notFound')
+        return message
+
+    def labels(self):
+        """Return every label ID carried by a message, sorted."""
+        with self._lock:
+            return sorted({label for message in self.messages.values() for label in message['labelIds']})
+
+    def search(self, query='', label_ids=(), include_spam_trash=False):
+        """
+        List matching message IDs, newest first.
+
+        Args:
+            query (str): Gmail q string (see compile_query)
+            label_ids (list): Labels every result must carry
+            include_spam_trash (bool): Also return messages in SPAM and TRASH
+
+        Returns:
+            list: Message IDs
+        """
+        with self._lock:
+            key = (query, tuple(label_ids), include_spam_trash, self.history_id)
+            if key in self._search_cache:
+                return self._search_cache[key]
+            order = list(self._order)
+        predicate, scoped = compile_query(query, self.now_ms)
+        hide = set() if include_spam_trash or scoped else {'SPAM', 'TRASH'}
+        results = []
+        for message_id in order:
+            message = self.messages[message_id]
+            labels = message['labelIds']
+            if hide and hide.intersection(labels):
+                continue
+            if label_ids and not all(label in labels for label in label_ids):
+                continue
+            if predicate(message):
+                results.append(message_id)
+        with self._lock:
+            if key[-1] != self.history_id:
+                return results
+            if len(self._search_cache) >= 16 or any(
+                    cached[-1] != key[-1] for cached in self._search_cache):
+                self._search_cache.clear()
+            self._search_cache[key] = results
+        return results
+
+    def history(self, start_history_id):
+        """
+        Return history records after start_history_id.
+
+        Raises:
+            FakeGmailError: 404 if start_history_id is older than the kept history
+        """
+        if start_history_id < self.min_history_id:
+            raise FakeGmailError(404, 'Requested entity was not found.', 'notFound')
+        with self._lock:
+            return self._history[bisect.bisect_right(self._history_ids, start_history_id):]
+
+    def render(self, message, fmt='full', metadata_headers=None):
+        """
+        Shape a stored message like a messages.get response.
+
+        Args:
+            message (dict): Stored message
+            fmt (str): minimal, metadata, full or raw
+            metadata_headers (list): Headers returned by the metadata format
+                (default: all)
+
+        Returns:
+            dict: Gmail Message resource
+        """
+        resource = {
+            'id': message['id'],
+            'threadId': message['threadId'],
+            'labelIds': list(message['labelIds']),
+            'snippet': message['snippet'],
+            'sizeEstimate': message['sizeEstimate'],
+            'historyId': str(message['historyId']),
+            'internalDate': str(message['internalDate']),
+        }
+        if fmt == 'minimal':
+            return resource
+        if fmt == 'raw':
+            head = ''.join(f"{h['name']}: {h['value']}\r\n" for h in message['headers'])
+            resource['raw'] = _b64url(head.encode('utf-8') + b'\r\n' + message['body'])
+            return resource
+
+        headers = message['headers']
+        if fmt == 'metadata':
+            if metadata_headers:
+                wanted = {name.lower() for name in metadata_headers}
+                headers = [h for h in headers if h['name'].lower() in wanted]
+            resource['payload'] = {'partId': '', 'mimeType': 'text/plain', 'filename': '',
+                                   'headers': headers}
+            return resource
+        if fmt != 'full':
+            raise FakeGmailError(400, f"Invalid format: {fmt}", 'invalidArgument')
+        resource['payload'] = {
+            'partId': '',
+            'mimeType': 'text/plain',
+            'filename': '',
+            'headers': headers,
+            'body': {'size': len(message['body']), 'data': _b64url(message['body'])},
+        }
+        return resource
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+
+class FakeGmailServer:
+    """Serve a SyntheticMailbox over HTTP with injectable latency and throttling."""
+
+    def __init__(self, mailbox, latency=0.0, jitter=0.0, throttle_rate=0.0, seed=0,
+                 host='127.0.0.1', port=0):
+        """
+        Args:
+            mailbox (SyntheticMailbox): Mailbox to serve
+            latency (float): Seconds added to every HTTP request
+            jitter (float): Extra random delay of up to this many seconds
+            throttle_rate (float): Share of calls (and batch parts) answered
+                with 429 rateLimitExceeded
+            seed (int): Seed for jitter and throttling decisions
+            host (str): Address to bind
+            port (int): Port to bind (0 = any free port)
+        """
+        self.mailbox = mailbox
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.reset_stats()
+
+    @property
+    def url(self):
+        """str: API root to pass as api_root or GMAIL_API_ROOT."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def reset_stats(self):
+        """Zero the request counters."""
+        with self._lock:
+            self.stats = {
+                'http_requests': 0,
+                'calls': {},
+                'statuses': {},
+                'throttled': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+            }
+
+    def _count(self, key, name, amount=1):
+        with self._lock:
+            self.stats[key][name] = self.stats[key].get(name, 0) + amount
+
+    def start(self):
+        """Serve requests on a background thread."""
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name='fake-gmail', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _delay(self):
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _throttle(self):
+        if not self.throttle_rate:
+            return False
+        with self._lock:
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.stats['throttled'] += 1
+        return throttled
+
+    def call(self, method, path, query, body):
+        """
+        Run one Gmail call.
+
+        Args:
+            method (str): HTTP method
+            path (str): URL path, e.g. /gmail/v1/users/me/messages
+            query (dict): Parsed query string (name -> list of values)
+            body (bytes): Request body
+
+        Returns:
+            tuple: (status, JSON-serializable response or None for no content)
+        """
+        for route_method, pattern, name in _ROUTES:
+            match = pattern.match(path)
+            if match and route_method == method:
+                break
+        else:
+            return 404, FakeGmailError(404, f"No route for {method} {path}", 'notFound').body()
+
+        self._count('calls', name)
+        try:
+            if self._throttle():
+                raise FakeGmailError(429, 'Too many concurrent requests for user.',
+                                     'rateLimitExceeded')
+            status, response = 200, getattr(self, '_' + name.replace('.', '_'))(
+                match, query, body
+            )
+            if response is None:
+                status = 204
+        except FakeGmailError as e:
+            status, response = e.status, e.body()
+        self._count('statuses', str(status))
+        return status, response
+
+    def _messages_list(self, match, query, body):
+        page_size = min(int(query.get('maxResults', ['100'])[0]), 500)
+        offset = int(query.get('pageToken', ['0'])[0])
+        ids = self.mailbox.search(
+            query.get('q', [''])[0], query.get('labelIds', []),
+            query.get('includeSpamTrash', ['false'])[0] == 'true'
+        )
+        page = ids[offset:offset + page_size]
+        response = {'resultSizeEstimate': len(ids)}
+        if page:
+            response['messages'] = [
+                {'id': message_id, 'threadId': self.mailbox.messages[message_id]['threadId']}
+                for message_id in page
+            ]
+        if offset + page_size < len(ids):
+            response['nextPageToken'] = str(offset + page_size)
+        return response
+
+    def _messages_get(self, match, query, body):
+        message = self.mailbox.get(match.group(1))
+        return self.mailbox.render(
+            message, query.get('format', ['full'])[0], query.get('metadataHeaders')
+        )
+
+    def _messages_trash(self, match, query, body):
+        message = self.mailbox.get(match.group(1))
+        self.mailbox.modify([message['id']], add=['TRASH'], remove=['INBOX'])
+        return self.mailbox.render(message, 'minimal')
+
+    def _messages_batchModify(self, match, query, body):
+        request = json.loads(body or b'{}')
+        ids = request.get('ids', [])
+        if len(ids) > 1000:
+            raise FakeGmailError(400, 'Too many ids: at most 1000 are allowed.', 'invalidArgument')
+        self.mailbox.modify(ids, request.get('addLabelIds', []), request.get('removeLabelIds', []))
+        return None
+
+    def _history_list(self, match, query, body):
+        if 'startHistoryId' not in query:
+            raise FakeGmailError(400, 'startHistoryId is required.', 'invalidArgument')
+        page_size = min(int(query.get('maxResults', ['100'])[0]), 500)
+        offset = int(query.get('pageToken', ['0'])[0])
+        kinds = {_HISTORY_TYPES.get(kind, kind) for kind in query.get('historyTypes', [])}
+        records = self.mailbox.history(int(query['startHistoryId'][0]))
+        if kinds:
+            records = [record for record in records if kinds.intersection(record)]
+        response = {'historyId': str(self.mailbox.history_id)}
+        page = records[offset:offset + page_size]
+        if page:
+            response['history'] = [dict(record, id=str(record['id'])) for record in page]
+        if offset + page_size < len(records):
+            response['nextPageToken'] = str(offset + page_size)
+        return response
+
+    def _getProfile(self, match, query, body):
+        return {
+            'emailAddress': self.mailbox.email_address,
+            'messagesTotal': len(self.mailbox.messages),
+            'threadsTotal': len(self.mailbox.messages),
+            'historyId': str(self.mailbox.history_id),
+        }
+
+    def _labels_list(self, match, query, body):
+        # Every synthetic label is a system label, whose name is its ID
+        return {'labels': [
+            {'id': label, 'name': label, 'type': 'system'} for label in self.mailbox.labels()
+        ]}
+
+    def batch(self, content_type, body):
+        """
+        Run a multipart/mixed batch request.
+
+        Returns:
+            tuple: (status, content type, response body bytes)
+        """
+        parts = _split_multipart(content_type, body)
+        if parts is None:
+            error = FakeGmailError(400, 'Batch request is not multipart/mixed.', 'invalidArgument')
+            return 400, 'application/json', json.dumps(error.body()).encode('utf-8')
+        if len(parts) > GMAIL_MAX_BATCH_CALLS:
+            error = FakeGmailError(
+                400, f"Too many requests in batch: at most {GMAIL_MAX_BATCH_CALLS}.",
+                'invalidArgument'
+            )
+            return 400, 'application/json', json.dumps(error.body()).encode('utf-8')
+
+        boundary = f"batch_{self._random.getrandbits(64):016x}"
+        chunks = []
+        for part_headers, payload in parts:
+            head, part_body = _split_head(payload)
+            request_line = head.split(b'\n', 1)[0].decode('latin-1').strip()
+            method, target = request_line.split(' ')[:2]
+            url = urlsplit(target)
+            status, response = self.call(method, url.path, parse_qs(url.query), part_body)
+            content = b'' if response is None else json.dumps(response).encode('utf-8')
+            content_id = part_headers.get('content-id', '<item>').strip('<>')
+            reason = {200: 'OK', 204: 'No Content'}.get(status, 'Error')
+            chunks.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n"
+                f"Content-Length: {len(content)}\r\n\r\n".encode('utf-8') + content + b"\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n".encode('utf-8'))
+        return 200, f"multipart/mixed; boundary={boundary}", b''.join(chunks)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately; don't let Nagle's
+            # algorithm hold the body back for a delayed ACK
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, status, content_type, content):
+                self.send_response(status)
+                if content:
+                    self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+                with server._lock:
+                    server.stats['bytes_sent'] += len(content)
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with server._lock:
+                    server.stats['http_requests'] += 1
+                    server.stats['bytes_received'] += len(body)
+                server._delay()
+
+                url = urlsplit(self.path)
+                if method == 'POST' and url.path in _BATCH_PATHS:
+                    self._respond(*server.batch(self.headers.get('Content-Type', ''), body))
+                    return
+                status, response = server.call(method, url.path, parse_qs(url.query), body)
+                content = b'' if response is None else json.dumps(response).encode('utf-8')
+                self._respond(status, 'application/json; charset=UTF-8', content)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+        return Handler
+
+
+# ---------------------------------------------------------------------------
+# Client helpers
+# ---------------------------------------------------------------------------
+
+def fake_credentials():
+    """Return credentials with a dummy, never-expiring access token."""
+    from google.oauth2.credentials import Credentials
+    return Credentials(token='fake-gmail-token')
+
+
+class StaticCredentialCache:
+    """Stand-in for lambda_handler.CredentialCache that returns fixed objects."""
+
+    def __init__(self, creds, service):
+        self.creds = creds
+        self.service = service
+
+    def needs_secret(self):
+        return False
+
+    def get(self, secret_string=None):
+        return self.creds, self.service, True
+
+    def invalidate(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--messages', type=int, default=1000, help='Mailbox size (default: 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--port', type=int, default=8025, help='Port to listen on (default: 8025)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay, up to seconds')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Share of calls answered with 429 (default: 0)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    mailbox = SyntheticMailbox(args.messages, seed=args.seed)
+    print(f"Generated {args.messages} messages in {time.perf_counter() - start:.1f}s")
+    server = FakeGmailServer(
+        mailbox, latency=args.latency, jitter=args.jitter,
+        throttle_rate=args.throttle_rate, seed=args.seed, port=args.port
+    )
+    print(f"Serving fake Gmail API at {server.url} (Ctrl-C to stop)")
+    print(f"  GMAIL_API_ROOT={server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+        print(f"\n{server.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Cleanup plans: review a dry run, then apply exactly what it found
+
+A dry run writes the emails it would trash to a plan file: their message IDs
+grouped by the rule that matched, plus a fingerprint of the configuration
+that produced the decisions. `email_cleanup.py --apply-plan` then trashes
+those IDs with batchModify without searching or fetching anything, and
+refuses to run if UNWANTED_RULES, ALLOWLIST or SEARCH_FILTERS have changed
+since the plan was written.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+PLAN_VERSION = 1
+
+
+class PlanError(Exception):
+    """Plan file is missing, unreadable or does not match the current configuration."""
+
+
+def config_fingerprint(rules, allowlist, filters):
+    """
+    Hash the configuration that decides which emails are trashed.
+
+    Args:
+        rules (dict): Shaped like config.UNWANTED_RULES
+        allowlist (dict): Shaped like config.ALLOWLIST
+        filters (dict): Shaped like config.SEARCH_FILTERS
+
+    Returns:
+        str: Hex SHA-256 of the canonical JSON form of the three settings
+    """
+    canonical = json.dumps(
+        {'rules': rules, 'allowlist': allowlist, 'filters': filters},
+        sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class CleanupPlan:
+    """Message IDs to trash, grouped by rule, tied to a configuration fingerprint."""
+
+    def __init__(self, fingerprint, trash, history_id=None, created=None):
+        """
+        Args:
+            fingerprint (str): config_fingerprint() of the configuration used
+            trash (dict): rule name -> list of message IDs
+            history_id (str): Incremental sync checkpoint taken by the dry run
+            created (str): ISO 8601 creation time (default: now)
+        """
+        self.fingerprint = fingerprint
+        self.trash = trash
+        self.history_id = history_id
+        self.created = created or datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+    @classmethod
+    def from_emails(cls, emails_to_trash, fingerprint, history_id=None):
+        """
+        Build a plan from the emails a dry run would trash.
+
+        Args:
+            emails_to_trash (list): Dicts with 'id' and 'rule' keys
+            fingerprint (str): config_fingerprint() of the configuration used
+            history_id (str): Incremental sync checkpoint, if any
+
+        Returns:
+            CleanupPlan: The plan
+        """
+        trash = {}
+        for email in emails_to_trash:
+            trash.setdefault(email['rule'], []).append(email['id'])
+        return cls(fingerprint, trash, history_id)
+
+    @property
+    def message_ids(self):
+        """list: Every message ID in the plan."""
+        return [message_id for ids in self.trash.values() for message_id in ids]
+
+    def check(self, fingerprint):
+        """
+        Make sure the plan was made with the current configuration.
+
+        Args:
+            fingerprint (str): config_fingerprint() of the current configuration
+
+        Raises:
+            PlanError: If the configuration has changed since the plan was written
+        """
+        if fingerprint != self.fingerprint:
+            raise PlanError(
+                "Rules, allowlist or search filters changed since the plan was made; "
+                "run a new dry run to refresh it"
+            )
+
+    def save(self, path):
+        """
+        Write the plan atomically.
+
+        Args:
+            path (str): JSON file to write
+        """
+        document = {
+            'version': PLAN_VERSION,
+            'created': self.created,
+            'config_hash': self.fingerprint,
+            'history_id': self.history_id,
+            'trash': self.trash
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a plan written by save().
+
+        Args:
+            path (str): JSON file to read
+
+        Returns:
+            CleanupPlan: The plan
+
+        Raises:
+            PlanError: If the file is missing, malformed or from another version
+        """
+        try:
+            with open(path, 'r') as f:
+                document = json.load(f)
+        except FileNotFoundError:
+            raise PlanError(f"Plan file {path} not found; run a dry run first")
+        except ValueError as e:
+            raise PlanError(f"Plan file {path} is not valid JSON: {e}")
+
+        if not isinstance(document, dict) or document.get('version') != PLAN_VERSION:
+            raise PlanError(f"Plan file {path} has an unsupported format")
+        return cls(
+            document['config_hash'], document.get('trash', {}),
+            document.get('history_id'), document.get('created')
+        )
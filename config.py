@@ -39,16 +39,64 @@ ALLOWLIST = {
     ],
     "domains": [
         # Add entire domains here to whitelist all senders from them
+        # Prefix with "*." to also cover subdomains (e.g. mail.company.com)
         # Examples:
         # "company.com",
-        # "important-vendor.com"
+        # "*.important-vendor.com"
     ]
 }
 
+# SEARCH FILTERS
+# Applied by Gmail when searching, so filtered-out emails are never fetched.
+# Dates use Gmail search syntax: older_than/newer_than take e.g. "30d", "6m", "1y";
+# before/after take "YYYY/MM/DD". Leave empty to search the whole mailbox.
+SEARCH_FILTERS = {
+    "older_than": "",
+    "newer_than": "",
+    "before": "",
+    "after": "",
+    "include_labels": [],   # e.g. ["INBOX"] to only clean the inbox
+    "exclude_labels": []    # e.g. ["STARRED", "IMPORTANT"]
+}
+
 # DRY RUN MODE
 # When True, script will only print what it would trash (no actual deletion)
 # Set to False to actually move emails to trash
 DRY_RUN = True
 
+# FETCH MODE
+# "metadata" fetches only the headers the enabled rules read (fast, low bandwidth)
+# "full" always downloads complete messages, including bodies and attachments
+FETCH_MODE = "metadata"
+
+# CONCURRENCY
+# Number of threads that fetch and classify emails in parallel (0 = sequential).
+# Each thread uses its own connection; the report is identical either way.
+FETCH_WORKERS = 0
+
+# API QUOTA
+# Gmail allows each user 250 quota units per second (a message fetch costs 5,
+# a bulk trash 50). Requests are paced to stay under this budget, which is
+# lowered automatically while Gmail responds with rate-limit errors.
+# None disables pacing (usage is still reported).
+GMAIL_QUOTA_UNITS_PER_SECOND = 250
+
+# INCREMENTAL SYNC
+# File where --incremental runs keep the last processed Gmail historyId
+SYNC_STATE_FILE = 'sync_state.json'
+
+# MESSAGE CACHE
+# Sender, subject and labels of fetched emails are cached locally so a dry run
+# followed by --execute doesn't fetch everything twice (disable with --no-cache)
+MESSAGE_CACHE_FILE = 'message_cache.sqlite3'
+MESSAGE_CACHE_MAX_ENTRIES = 100000     # Least recently used entries are evicted
+MESSAGE_CACHE_LABEL_TTL_HOURS = 24     # How long cached labels (categories) are trusted
+
+# CLEANUP PLAN
+# Dry runs save the emails they would trash here; --apply-plan trashes exactly
+# those emails without searching again (refused if the rules have changed)
+CLEANUP_PLAN_FILE = 'cleanup_plan.json'
+
 # EMAIL SEARCH LIMITS
-MAX_RESULTS_PER_SEARCH = 100  # Gmail API pagination limit
+MAX_RESULTS_PER_SEARCH = 100  # Messages per list page (Gmail API allows up to 500)
+MAX_TOTAL_MESSAGES = None     # Optional cap across all pages (None = follow every page)
@@ -10,12 +10,25 @@ Usage:
     python email_cleanup.py                    # Run with default config
     python email_cleanup.py --dry-run          # Simulate without trashing (default)
     python email_cleanup.py --execute          # Actually move emails to trash
+    python email_cleanup.py --max-messages 500 # Stop after 500 matching emails
+    python email_cleanup.py --workers 8        # Fetch and classify on 8 threads
+    python email_cleanup.py --async            # Use the asyncio backend (needs httpx)
+    python email_cleanup.py --execute --incremental  # Only process mail added since last run
+    python email_cleanup.py --no-cache         # Ignore the local message cache
+    python email_cleanup.py --apply-plan       # Trash what the last dry run found
+    python email_cleanup.py --metrics-json     # Print the run's metrics as a JSON line
 """
 
 import os
 import sys
+import json
+import time
 import argparse
 import pickle
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -23,7 +36,29 @@ from googleapiclient.errors import HttpError
 import base64
 import re
 
-from config import UNWANTED_RULES, ALLOWLIST, DRY_RUN, MAX_RESULTS_PER_SEARCH
+from config import (
+    UNWANTED_RULES, ALLOWLIST, DRY_RUN, MAX_RESULTS_PER_SEARCH, MAX_TOTAL_MESSAGES,
+    FETCH_MODE, FETCH_WORKERS, SYNC_STATE_FILE, SEARCH_FILTERS,
+    MESSAGE_CACHE_FILE, MESSAGE_CACHE_MAX_ENTRIES, MESSAGE_CACHE_LABEL_TTL_HOURS,
+    CLEANUP_PLAN_FILE, GMAIL_QUOTA_UNITS_PER_SECOND
+)
+from gmail_pipeline import (
+    iter_message_pages, batch_get_messages, batch_trash_messages, fetch_spec_for_rules,
+    get_current_history_id, get_label_ids, changed_message_ids, build_service, rest_base_url,
+    HistoryPager, HistoryExpiredError, MeteredHttp, DEFAULT_BATCH_SIZE, GMAIL_API_ROOT
+)
+from sync_state import FileStateStore
+from rules import RuleSet
+from allowlist import AllowlistIndex
+from query_planner import plan_queries, iter_plan_pages, compile_filter
+from message_cache import MessageCache
+from rate_limiter import RateLimiter
+from metrics import RunMetrics
+from cleanup_plan import CleanupPlan, PlanError, config_fingerprint
+from gmail_async import (
+    AsyncGmailClient, AsyncTrasher, GmailAPIError, iter_message_pages_async,
+    iter_plan_pages_async, classify_pages_async, DEFAULT_CONCURRENCY
+)
 
 # Gmail API scope - allows reading and modifying emails
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
@@ -34,15 +69,59 @@ TOKEN_FILE = 'token.pickle'
 class GmailCleanup:
     """Main class for Gmail email cleanup operations."""
     
-    def __init__(self, dry_run=True):
+    def __init__(self, dry_run=True, max_messages=MAX_TOTAL_MESSAGES, workers=FETCH_WORKERS,
+                 max_in_flight=None, incremental=False, state_store=None, use_cache=True,
+                 plan_file=CLEANUP_PLAN_FILE, creds=None, api_root=GMAIL_API_ROOT,
+                 emit_metrics=False):
         """
         Initialize Gmail cleanup service.
         
         Args:
             dry_run (bool): If True, only print what would be deleted. If False, actually delete.
+            max_messages (int): Stop after this many matching emails (None = all pages)
+            workers (int): Threads that fetch and classify messages (0 = sequential)
+            max_in_flight (int): Batch requests queued or running at once
+                (default: 2 x workers)
+            incremental (bool): Only process mail added since the last run's historyId
+            state_store: Object with load()/save() for the historyId checkpoint
+                (default: FileStateStore(SYNC_STATE_FILE))
+            use_cache (bool): Serve already-seen messages from the local SQLite cache
+            plan_file (str): Where dry runs save their plan and apply_plan reads it
+                (None = don't save plans)
+            creds: Ready-to-use credentials, skipping token.pickle and the OAuth
+                flow (e.g. a dummy token for benchmarks/fake_gmail.py)
+            api_root (str): Gmail API root URL (default: GMAIL_API_ROOT)
+            emit_metrics (bool): Print the run's stats and metrics as one JSON
+                line when it ends
         """
         self.service = None
+        self.creds = creds
+        self.api_root = api_root
         self.dry_run = dry_run
+        self.max_messages = max_messages
+        self.workers = max(0, workers)
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.incremental = incremental
+        self.plan_file = plan_file
+        self.emit_metrics = emit_metrics
+        self.state_store = state_store or FileStateStore(SYNC_STATE_FILE)
+        self.rules = RuleSet.from_config(UNWANTED_RULES)
+        self.allowlist = AllowlistIndex.from_config(ALLOWLIST)
+        # One quota budget shared by every Gmail call of this run (all threads)
+        self.limiter = RateLimiter(GMAIL_QUOTA_UNITS_PER_SECOND)
+        # Stage timings and rule hits; API usage is recorded by the limiter
+        self.metrics = RunMetrics()
+        # SEARCH_FILTERS checked client-side when messages don't come from a search
+        self.message_filter = None
+        # Mailbox historyId that labels fetched this run are current as of
+        self.cache_history_id = None
+        self.cache = None
+        if use_cache:
+            self.cache = MessageCache(
+                MESSAGE_CACHE_FILE,
+                max_entries=MESSAGE_CACHE_MAX_ENTRIES,
+                label_ttl=MESSAGE_CACHE_LABEL_TTL_HOURS * 3600
+            )
         self.stats = {
             'total_checked': 0,
             'total_trashed': 0,
@@ -52,6 +131,10 @@ class GmailCleanup:
     
     def _authenticate(self):
         """Authenticate with Gmail API using OAuth 2.0."""
+        if self.creds is not None:
+            self.service = build_service(self.creds, root_url=self.api_root, http=self._new_http())
+            return
+        
         try:
             creds = None
             
@@ -73,9 +156,8 @@ class GmailCleanup:
                 with open(TOKEN_FILE, 'wb') as token:
                     pickle.dump(creds, token)
             
-            from google.auth.transport.requests import Request
-            from googleapiclient.discovery import build
-            self.service = build('gmail', 'v1', credentials=creds)
+            self.creds = creds
+            self.service = build_service(creds, root_url=self.api_root, http=self._new_http())
             print("✓ Successfully authenticated with Gmail API")
             
         except FileNotFoundError:
@@ -87,6 +169,23 @@ class GmailCleanup:
             print(f"✗ Authentication failed: {e}")
             sys.exit(1)
     
+    def _new_http(self):
+        """
+        Create a dedicated authorized http object for a worker thread.
+        
+        httplib2 connections are not thread-safe, so each background thread
+        needs its own instead of sharing the one inside self.service. The
+        bytes it receives are counted in self.limiter.
+        
+        Returns:
+            google_auth_httplib2.AuthorizedHttp: New authorized http object
+        """
+        import google_auth_httplib2
+        from googleapiclient.http import build_http
+        return google_auth_httplib2.AuthorizedHttp(
+            self.creds, http=MeteredHttp(build_http(), self.limiter)
+        )
+    
     def _is_allowlisted(self, sender_email):
         """
         Check if sender is in the allowlist.
@@ -97,19 +196,22 @@ class GmailCleanup:
         Returns:
             bool: True if sender is allowlisted, False otherwise
         """
-        sender_lower = sender_email.lower()
-        
-        # Check exact matches or partial matches in senders
-        for allowed in ALLOWLIST.get('senders', []):
-            if allowed.lower() in sender_lower or sender_lower in allowed.lower():
-                return True
+        return self._allowlist_entry(sender_email) is not None
+    
+    def _allowlist_entry(self, sender_email):
+        """
+        Find which allowlist entry protects a sender.
         
-        # Check domain allowlist
-        for domain in ALLOWLIST.get('domains', []):
-            if sender_lower.endswith(f"@{domain.lower()}"):
-                return True
+        The allowlist is compiled once in __init__ (see allowlist.py), so this
+        is a few hash lookups rather than a scan of every entry.
         
-        return False
+        Args:
+            sender_email (str): Email address to check
+            
+        Returns:
+            str: Matching sender or domain entry from ALLOWLIST, or None
+        """
+        return self.allowlist.match(sender_email)
     
     def _decode_header(self, data):
         """
@@ -171,53 +273,344 @@ class GmailCleanup:
         
         return sender, subject
     
-    def _matches_rules(self, sender, subject, message_id):
+    def _matches_rules(self, sender, subject, message):
         """
         Check if email matches any unwanted rules.
         
         Args:
             sender (str): Sender email address
             subject (str): Email subject
-            message_id (str): Gmail message ID (for category check)
+            message (dict): Gmail message already fetched by search_and_cleanup
+                (only 'labelIds' is read, for the category check)
             
         Returns:
             tuple: (matches_rules: bool, matched_rule: str)
         """
-        # Rule 1: Check for no-reply senders
-        if UNWANTED_RULES.get('no_reply_senders', {}).get('enabled', False):
-            if 'no-reply@' in sender.lower():
-                return True, "no-reply sender"
+        # Rules are compiled once in __init__ (see rules.py)
+        return self.rules.match(sender, subject, message.get('labelIds', []))
+    
+    def _classify_message(self, message_id, msg):
+        """
+        Decide what to do with a fetched message.
+        
+        Only reads the message and configuration, so it is safe to call from
+        worker threads.
+        
+        Args:
+            message_id (str): Gmail message ID
+            msg (dict): Gmail message returned by messages().get
+            
+        Returns:
+            dict: id, sender, subject, action ('skip', 'blocked', 'trash' or 'keep'),
+                rule (audit label) and rule_name (config key of the matching rule)
+        """
+        start = time.perf_counter()
+        sender, subject = self._get_sender_and_subject(msg)
+        decision = self._classify_fields(
+            message_id, sender, subject, msg.get('labelIds', []), msg.get('internalDate')
+        )
+        self.metrics.classified(time.perf_counter() - start)
+        return decision
+    
+    def _classify_fields(self, message_id, sender, subject, label_ids, internal_date=None):
+        """
+        Decide what to do with a message from its extracted fields.
+        
+        Args:
+            message_id (str): Gmail message ID
+            sender (str): Sender email address
+            subject (str): Email subject
+            label_ids (list): Gmail labelIds of the message
+            internal_date (str): Gmail internalDate of the message
+            
+        Returns:
+            dict: id, sender, subject, action ('skip', 'blocked', 'trash' or 'keep'),
+                rule (audit label) and rule_name (config key of the matching rule);
+                'skip' means the message is outside SEARCH_FILTERS
+        """
+        decision = {'id': message_id, 'sender': sender, 'subject': subject,
+                    'action': 'keep', 'rule': None, 'rule_name': None}
         
-        # Rule 2: Check subject keywords
-        if UNWANTED_RULES.get('subject_keywords', {}).get('enabled', False):
-            keywords = UNWANTED_RULES['subject_keywords'].get('keywords', [])
-            for keyword in keywords:
-                if keyword.lower() in subject.lower():
-                    return True, f"subject keyword '{keyword}'"
+        # Messages from the History API were not narrowed down by the search filters
+        if self.message_filter is not None and not self.message_filter.matches(label_ids, internal_date):
+            decision['action'] = 'skip'
+            return decision
         
-        # Rule 3: Check Gmail Promotions category
-        if UNWANTED_RULES.get('gmail_category_promotions', {}).get('enabled', False):
+        # Check if sender is allowlisted
+        entry = self._allowlist_entry(sender)
+        if entry is not None:
+            decision['action'] = 'blocked'
+            decision['rule'] = f"allowlist '{entry}'"
+            return decision
+        
+        # Check if matches any rule (compiled once in __init__, see rules.py)
+        rule_name, label = self.rules.match_rule(sender, subject, label_ids)
+        if rule_name is not None:
+            decision['action'] = 'trash'
+            decision['rule'] = label
+            decision['rule_name'] = rule_name
+        
+        return decision
+    
+    def _classify_cached(self, cached):
+        """
+        Classify a message from the cache, if the cached fields are enough.
+        
+        Headers never change, so they are always usable. Labels older than the
+        cache's label TTL are only a problem when the search filters check
+        labels, or when no header rule or allowlist entry decides the outcome
+        and a rule reads labels; then None is returned so the message is
+        fetched again.
+        
+        Args:
+            cached (CachedMessage): Cache entry for the message
+            
+        Returns:
+            dict: Decision as from _classify_fields, or None to re-fetch
+        """
+        start = time.perf_counter()
+        labels_fresh = cached.labels_fresh(self.cache.label_ttl)
+        if not labels_fresh and self.message_filter is not None and self.message_filter.uses_labels:
+            decision = None
+        elif self.rules.uses_labels and not labels_fresh:
+            decision = self._classify_fields(
+                cached.id, cached.sender, cached.subject, [], cached.internal_date
+            )
+            if decision['action'] == 'keep':
+                decision = None
+        else:
+            decision = self._classify_fields(
+                cached.id, cached.sender, cached.subject, cached.label_ids, cached.internal_date
+            )
+        self.metrics.classified(time.perf_counter() - start)
+        return decision
+    
+    def _validate_cache(self):
+        """
+        Expire cached labels that changed in Gmail since they were fetched.
+        
+        Reads the History API from the oldest historyId among cached entries
+        whose labels are still trusted (a couple of quota units per page of
+        changes) and expires the labels of every message reported as
+        relabelled or deleted. If that history has expired, no cached labels
+        are trusted this run. The mailbox's current historyId is kept in
+        cache_history_id, so labels fetched this run can be validated from
+        it next time. Skipped when nothing reads labels.
+        """
+        if not (self.rules.uses_labels or
+                (self.message_filter is not None and self.message_filter.uses_labels)):
+            return
+        
+        start_history_id = self.cache.label_checkpoint()
+        if start_history_id is None:
+            self.cache_history_id = get_current_history_id(self.service, self.limiter)
+            return
+        
+        try:
+            changed, self.cache_history_id = changed_message_ids(
+                self.service, start_history_id, self.limiter
+            )
+        except HistoryExpiredError:
+            self.cache_history_id = get_current_history_id(self.service, self.limiter)
+            expired = self.cache.expire_labels()
+            print(f"Message Cache: history since {start_history_id} has expired, "
+                  f"re-fetching labels of {expired} cached emails\n")
+            return
+        
+        expired = self.cache.expire_labels(changed)
+        self.cache.mark_validated(self.cache_history_id)
+        if expired:
+            print(f"Message Cache: labels changed on {expired} cached emails since they were fetched\n")
+    
+    def _fetch_and_classify(self, message_ids, fetch_format, metadata_headers, http=None):
+        """
+        Batch-fetch a group of messages and classify each one.
+        
+        Messages already in the local cache are classified without being
+        fetched (unless the rules need full message bodies), and newly
+        fetched ones are added to it.
+        
+        Args:
+            message_ids (list): Gmail message IDs to process
+            fetch_format (str): messages().get format
+            metadata_headers (list): Headers to request for format='metadata'
+            http: Authorized http object to use (None = self.service's own)
+            
+        Returns:
+            list: (decision, error) tuples in the order of message_ids
+        """
+        results = {}
+        to_fetch = message_ids
+        
+        if self.cache is not None and fetch_format != 'full':
+            cached = self.cache.get_many(message_ids)
+            to_fetch = []
+            for message_id in message_ids:
+                decision = self._classify_cached(cached[message_id]) if message_id in cached else None
+                if decision is None:
+                    to_fetch.append(message_id)
+                else:
+                    results[message_id] = (decision, None)
+            self.cache.record_served(len(results))
+        
+        new_entries = []
+        fetched = batch_get_messages(
+            self.service, to_fetch,
+            format=fetch_format, metadata_headers=metadata_headers, http=http,
+            limiter=self.limiter
+        ) if to_fetch else []
+        for message_id, msg, error in fetched:
+            if error is None:
+                try:
+                    start = time.perf_counter()
+                    sender, subject = self._get_sender_and_subject(msg)
+                    results[message_id] = (
+                        self._classify_fields(
+                            message_id, sender, subject,
+                            msg.get('labelIds', []), msg.get('internalDate')
+                        ),
+                        None
+                    )
+                    self.metrics.classified(time.perf_counter() - start)
+                    new_entries.append((message_id, sender, subject, msg))
+                    continue
+                except Exception as e:
+                    error = e
+            results[message_id] = (None, error)
+        
+        if self.cache is not None:
+            self.cache.put_many(new_entries, self.cache_history_id)
+        
+        return [results[message_id] for message_id in message_ids]
+    
+    def _message_pages(self, plan):
+        """
+        Choose where this run's message IDs come from.
+        
+        A normal run pages through the search results. In incremental mode,
+        the History API is used instead to read only messages added since the
+        saved historyId, and SEARCH_FILTERS are checked on each fetched
+        message since no search narrowed them down; if there is no checkpoint
+        yet or it has expired, a full sweep runs and the mailbox's current
+        historyId becomes the next checkpoint.
+        
+        Args:
+            plan (QueryPlan): Search queries for a full sweep
+            
+        Returns:
+            tuple: (pages, checkpoint) where checkpoint() returns the historyId
+                to save after a successful run (None when not incremental)
+        """
+        search_pages = lambda: iter_plan_pages(
+            plan,
+            lambda query: iter_message_pages(
+                self.service, query,
+                page_size=MAX_RESULTS_PER_SEARCH,
+                max_total=self.max_messages,
+                http_factory=self._new_http if self.creds else None,
+                limiter=self.limiter
+            ),
+            max_total=self.max_messages
+        )
+        
+        if not self.incremental:
+            return search_pages(), None
+        
+        start_history_id = self.state_store.load().get('history_id')
+        if start_history_id:
             try:
-                msg = self.service.users().messages().get(
-                    userId='me', id=message_id, format='metadata'
-                ).execute()
-                labels = msg.get('labelIds', [])
-                
-                # CATEGORY_PROMOTIONS is the label ID for Gmail's Promotions category
-                if 'CATEGORY_PROMOTIONS' in labels:
-                    return True, "Gmail Promotions category"
-            except Exception as e:
-                # Silently skip if we can't check categories
-                pass
+                pager = HistoryPager(self.service, start_history_id, limiter=self.limiter)
+                print(f"Incremental Sync: processing changes since historyId {start_history_id}")
+                self.message_filter = self._compile_search_filters()
+                if self.message_filter is not None:
+                    print("Incremental Sync: search filters are checked on each message")
+                print()
+                return pager, lambda: pager.history_id
+            except HistoryExpiredError:
+                print(f"Incremental Sync: historyId {start_history_id} has expired, running a full sweep\n")
+        else:
+            print("Incremental Sync: no checkpoint yet, running a full sweep\n")
         
-        return False, None
+        # Capture the checkpoint before listing so nothing arriving mid-run is missed
+        history_id = get_current_history_id(self.service, self.limiter)
+        return search_pages(), lambda: history_id
     
-    def search_and_cleanup(self):
+    def _compile_search_filters(self):
         """
-        Search for unwanted emails and move them to trash.
+        Build the client-side version of SEARCH_FILTERS.
+        
+        Label filters are written with label names, but messages carry label
+        IDs, so the mailbox's labels are looked up first when any are used.
         
         Returns:
-            dict: Statistics on emails found and trashed
+            MessageFilter: Filter to apply, or None if no filter is set
+        """
+        label_ids = None
+        if SEARCH_FILTERS.get('include_labels') or SEARCH_FILTERS.get('exclude_labels'):
+            label_ids = get_label_ids(self.service, self.limiter)
+        return compile_filter(SEARCH_FILTERS, label_ids)
+    
+    def _iter_classified(self, pages, fetch_format, metadata_headers):
+        """
+        Fetch and classify every listed message, sequentially or on a thread pool.
+        
+        With workers enabled, each page is split into batch-sized chunks that
+        run on a ThreadPoolExecutor, each worker thread using its own http
+        object. At most max_in_flight chunks are queued or running at once,
+        and results are yielded in listing order so the report and stats are
+        identical to a sequential run.
+        
+        Args:
+            pages (iterable): Pages of message stubs from iter_message_pages
+            fetch_format (str): messages().get format
+            metadata_headers (list): Headers to request for format='metadata'
+            
+        Yields:
+            tuple: (page_header, results) where page_header is (page_num, page_size)
+                for the first chunk of each page and None otherwise
+        """
+        if not self.workers:
+            for page_num, messages in enumerate(pages, 1):
+                message_ids = [message['id'] for message in messages]
+                yield (page_num, len(message_ids)), self._fetch_and_classify(
+                    message_ids, fetch_format, metadata_headers
+                )
+            return
+        
+        local = threading.local()
+        
+        def work(message_ids):
+            if not hasattr(local, 'http'):
+                local.http = self._new_http()
+            return self._fetch_and_classify(
+                message_ids, fetch_format, metadata_headers, http=local.http
+            )
+        
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='gmail-fetch')
+        in_flight = deque()
+        try:
+            for page_num, messages in enumerate(pages, 1):
+                message_ids = [message['id'] for message in messages]
+                for start in range(0, len(message_ids), DEFAULT_BATCH_SIZE):
+                    if len(in_flight) >= self.max_in_flight:
+                        page_header, future = in_flight.popleft()
+                        yield page_header, future.result()
+                    page_header = (page_num, len(message_ids)) if start == 0 else None
+                    chunk = message_ids[start:start + DEFAULT_BATCH_SIZE]
+                    in_flight.append((page_header, executor.submit(work, chunk)))
+            
+            while in_flight:
+                page_header, future = in_flight.popleft()
+                yield page_header, future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _plan_run(self):
+        """
+        Print the run banner and work out the search query and fetch format.
+        
+        Returns:
+            tuple: (plan, fetch_format, metadata_headers), or None if no rules are enabled
         """
         print("\n" + "="*70)
         print("EMAIL CLEANUP PROCESS STARTED")
@@ -225,121 +618,345 @@ class GmailCleanup:
         print(f"Dry Run Mode: {'YES (no emails will be trashed)' if self.dry_run else 'NO (emails will be moved to trash)'}")
         print()
         
-        try:
-            # Build search query for all active rules
-            queries = []
+        # Push as much of the rules and allowlist as possible into the search
+        plan = plan_queries(UNWANTED_RULES, ALLOWLIST, SEARCH_FILTERS)
+        
+        if not plan:
+            print("✗ No rules are enabled. Nothing to clean up.")
+            return None
+        
+        if len(plan.queries) == 1:
+            print(f"Search Query: {plan.queries[0]}")
+        else:
+            print(f"Search Queries ({len(plan.queries)}, results de-duplicated):")
+            for query in plan.queries:
+                print(f"  {query}")
+        if plan.client_side:
+            print("Client-side Checks:")
+            for predicate in plan.client_side:
+                print(f"  {predicate}")
+        
+        # Only pull the headers the enabled rules actually read
+        fetch_format, metadata_headers = fetch_spec_for_rules(UNWANTED_RULES, FETCH_MODE)
+        if metadata_headers:
+            print(f"Fetch Format: {fetch_format} ({', '.join(metadata_headers)})\n")
+        else:
+            print(f"Fetch Format: {fetch_format}\n")
+        
+        return plan, fetch_format, metadata_headers
+    
+    def _record_result(self, idx, decision, error, emails_to_trash):
+        """
+        Print one message's outcome and update stats.
+        
+        Args:
+            idx (int): 1-based position of the message in this run
+            decision (dict): Result of _classify_message (None if error is set)
+            error (Exception): Fetch or classification error, if any
+            emails_to_trash (list): Collects emails that matched a rule
+        """
+        if error is not None:
+            print(f"  [{idx}] Error processing message: {error}")
+            return
+        
+        if decision['action'] == 'skip':
+            return
+        
+        self.stats['total_checked'] += 1
+        sender = decision['sender']
+        subject = decision['subject']
+        
+        if decision['action'] == 'blocked':
+            self.stats['blocked_by_allowlist'] += 1
+            print(f"  [{idx}] BLOCKED (allowlisted): {sender}")
+            print(f"        Subject: {subject[:60]}...")
+            print()
+        elif decision['action'] == 'trash':
+            self.metrics.rule_hit(decision['rule_name'])
+            emails_to_trash.append({
+                'id': decision['id'],
+                'sender': sender,
+                'subject': subject,
+                'rule': decision['rule']
+            })
             
-            if UNWANTED_RULES.get('no_reply_senders', {}).get('enabled', False):
-                queries.append('from:no-reply@')
+            print(f"  [{idx}] TRASH ({decision['rule']}): {sender}")
+            print(f"        Subject: {subject[:60]}...")
+            print()
+    
+    def _finish_run(self, emails_to_trash, trash):
+        """
+        Trash matched emails (unless dry run) and print the summary.
+        
+        Args:
+            emails_to_trash (list): Emails that matched a rule
+            trash (callable): trash(message_ids) -> (trashed_ids, failed_dict)
+        """
+        print("-" * 70)
+        print()
+        
+        # Move emails to trash
+        if emails_to_trash:
+            print(f"Ready to move {len(emails_to_trash)} emails to Trash.")
             
-            if UNWANTED_RULES.get('subject_keywords', {}).get('enabled', False):
-                keywords = UNWANTED_RULES['subject_keywords'].get('keywords', [])
-                subject_query = ' OR '.join([f'subject:{kw}' for kw in keywords])
-                queries.append(f'({subject_query})')
+            if self.dry_run:
+                print(f"[DRY RUN] Would trash {len(emails_to_trash)} emails (no action taken)")
+                self.stats['total_trashed'] = len(emails_to_trash)
+            else:
+                print(f"Moving {len(emails_to_trash)} emails to Trash...")
+                trashed, failed = trash([email['id'] for email in emails_to_trash])
+                self.stats['total_trashed'] += len(trashed)
+                for email in emails_to_trash:
+                    if email['id'] in failed:
+                        print(f"Error trashing email from {email['sender']}: {failed[email['id']]}")
+                print(f"✓ Successfully trashed {self.stats['total_trashed']} emails")
+        else:
+            print("No emails needed to be trashed (all were allowlisted).")
+        
+        print()
+        print("="*70)
+        print("SUMMARY")
+        print("="*70)
+        print(f"Total emails checked: {self.stats['total_checked']}")
+        print(f"Allowlisted (protected): {self.stats['blocked_by_allowlist']}")
+        print(f"Moved to Trash: {self.stats['total_trashed']}")
+        if self.cache is not None and self.cache.lookups:
+            print(f"Served from cache: {self.cache.served} of {self.cache.lookups}")
+        self._print_quota()
+        print("="*70)
+    
+    def _print_quota(self):
+        """Print the Gmail quota units and retries of this run."""
+        usage = self.limiter.summary()
+        by_method = ', '.join(
+            f"{method} {units}" for method, units in sorted(usage['units_by_method'].items())
+        )
+        print(f"Quota units used: {usage['quota_units']}" + (f" ({by_method})" if by_method else ""))
+        if usage['retries']:
+            print(f"Retries: {usage['retries']} ({usage['throttled']} rate limited)")
+    
+    def _report_metrics(self):
+        """Add the run's metrics to self.stats, printing them as a JSON line if enabled."""
+        self.stats.update(self.metrics.report(self.limiter, self.cache))
+        if self.emit_metrics:
+            print(json.dumps({'metrics': 'email_cleanup', **self.stats}))
+    
+    def _write_plan(self, emails_to_trash, history_id=None):
+        """
+        Save a dry run's decisions so --apply-plan can trash them without re-fetching.
+        
+        Args:
+            emails_to_trash (list): Emails that matched a rule
+            history_id (str): Incremental sync checkpoint to save when the plan is applied
+        """
+        if not self.dry_run or not self.plan_file:
+            return
+        
+        fingerprint = config_fingerprint(UNWANTED_RULES, ALLOWLIST, SEARCH_FILTERS)
+        CleanupPlan.from_emails(emails_to_trash, fingerprint, history_id).save(self.plan_file)
+        print(f"✓ Plan saved to {self.plan_file} ({len(emails_to_trash)} emails). "
+              f"Apply it with --apply-plan")
+    
+    def apply_plan(self):
+        """
+        Trash the emails listed in the plan file written by a dry run.
+        
+        No search or message fetch is made: the planned IDs are trashed with
+        batchModify. The plan is refused if the rules, allowlist or search
+        filters changed after it was written.
+        
+        Returns:
+            dict: Statistics on emails trashed
+        """
+        print("\n" + "="*70)
+        print("APPLYING CLEANUP PLAN")
+        print("="*70)
+        print(f"Dry Run Mode: {'YES (no emails will be trashed)' if self.dry_run else 'NO (emails will be moved to trash)'}")
+        print()
+        
+        try:
+            plan = CleanupPlan.load(self.plan_file)
+            plan.check(config_fingerprint(UNWANTED_RULES, ALLOWLIST, SEARCH_FILTERS))
+        except PlanError as error:
+            print(f"✗ {error}")
+            sys.exit(1)
+        
+        message_ids = plan.message_ids
+        print(f"Plan: {self.plan_file} (created {plan.created})")
+        for rule, ids in plan.trash.items():
+            print(f"  {rule}: {len(ids)} emails")
+        print()
+        
+        try:
+            if not message_ids:
+                print("No emails needed to be trashed.")
+            elif self.dry_run:
+                print(f"[DRY RUN] Would trash {len(message_ids)} emails (no action taken)")
+                self.stats['total_trashed'] = len(message_ids)
+            else:
+                print(f"Moving {len(message_ids)} emails to Trash...")
+                trashed, failed = batch_trash_messages(self.service, message_ids, limiter=self.limiter)
+                self.stats['total_trashed'] += len(trashed)
+                for message_id, error in failed.items():
+                    print(f"Error trashing email {message_id}: {error}")
+                print(f"✓ Successfully trashed {self.stats['total_trashed']} emails")
             
-            if UNWANTED_RULES.get('gmail_category_promotions', {}).get('enabled', False):
-                queries.append('category:promotions')
+            # The dry run's checkpoint only becomes valid once its plan is applied
+            if plan.history_id and not self.dry_run:
+                state = self.state_store.load()
+                state['history_id'] = plan.history_id
+                self.state_store.save(state)
             
-            if not queries:
-                print("✗ No rules are enabled. Nothing to clean up.")
+        except HttpError as error:
+            print(f"✗ Gmail API error: {error}")
+            sys.exit(1)
+        
+        print()
+        print("="*70)
+        print("SUMMARY")
+        print("="*70)
+        print(f"Moved to Trash: {self.stats['total_trashed']}")
+        self._print_quota()
+        print("="*70)
+        
+        self._report_metrics()
+        return self.stats
+    
+    def search_and_cleanup(self):
+        """
+        Search for unwanted emails and move them to trash.
+        
+        Returns:
+            dict: Statistics on emails found and trashed
+        """
+        try:
+            plan = self._plan_run()
+            if plan is None:
+                self._report_metrics()
                 return self.stats
+            plan, fetch_format, metadata_headers = plan
+            
+            # Stream matching emails page by page (next page is prefetched)
+            pages, checkpoint = self._message_pages(plan)
             
-            full_query = ' OR '.join(queries)
-            print(f"Search Query: {full_query}\n")
+            if self.cache is not None and fetch_format != 'full':
+                self._validate_cache()
             
-            # Search for matching emails
-            results = self.service.users().messages().list(
-                userId='me', q=full_query, maxResults=MAX_RESULTS_PER_SEARCH
-            ).execute()
+            emails_to_trash = []
+            idx = 0
             
-            messages = results.get('messages', [])
+            for page_header, results in self._iter_classified(pages, fetch_format, metadata_headers):
+                if page_header:
+                    page_num, page_size = page_header
+                    print(f"Page {page_num}: {page_size} emails matching unwanted rules.")
+                    print("-" * 70)
+                
+                for decision, error in results:
+                    idx += 1
+                    self._record_result(idx, decision, error, emails_to_trash)
             
-            if not messages:
+            if idx == 0:
                 print("✓ No unwanted emails found.")
-                return self.stats
+            else:
+                self._finish_run(
+                    emails_to_trash,
+                    lambda message_ids: batch_trash_messages(
+                        self.service, message_ids, limiter=self.limiter
+                    )
+                )
             
-            print(f"Found {len(messages)} emails matching unwanted rules.\n")
-            print("-" * 70)
+            if self.dry_run:
+                self._write_plan(emails_to_trash, checkpoint() if checkpoint else None)
             
-            emails_to_trash = []
+            if self.cache is not None:
+                self.cache.evict()
             
-            # Process each matching email
-            for idx, message in enumerate(messages, 1):
-                try:
-                    msg = self.service.users().messages().get(
-                        userId='me', id=message['id'], format='full'
-                    ).execute()
-                    
-                    sender, subject = self._get_sender_and_subject(msg)
-                    self.stats['total_checked'] += 1
-                    
-                    # Check if sender is allowlisted
-                    if self._is_allowlisted(sender):
-                        self.stats['blocked_by_allowlist'] += 1
-                        print(f"  [{idx}] BLOCKED (allowlisted): {sender}")
-                        print(f"        Subject: {subject[:60]}...")
-                        print()
-                        continue
-                    
-                    # Check if matches any rule
-                    matches, rule_name = self._matches_rules(sender, subject, message['id'])
-                    
-                    if matches:
-                        emails_to_trash.append({
-                            'id': message['id'],
-                            'sender': sender,
-                            'subject': subject,
-                            'rule': rule_name
-                        })
-                        
-                        print(f"  [{idx}] TRASH ({rule_name}): {sender}")
-                        print(f"        Subject: {subject[:60]}...")
-                        print()
-                
-                except Exception as e:
-                    print(f"  [{idx}] Error processing message: {e}")
-                    continue
+            # A dry run must not advance the checkpoint, or --execute would skip its mail
+            if checkpoint and not self.dry_run:
+                state = self.state_store.load()
+                state['history_id'] = checkpoint()
+                self.state_store.save(state)
             
-            print("-" * 70)
-            print()
+        except HttpError as error:
+            print(f"✗ Gmail API error: {error}")
+            sys.exit(1)
+        except Exception as e:
+            print(f"✗ Unexpected error: {e}")
+            sys.exit(1)
+        
+        self._report_metrics()
+        return self.stats
+    
+    async def search_and_cleanup_async(self, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Same as search_and_cleanup, using the asyncio backend in gmail_async.
+        
+        Listing, fetching and trashing overlap on one event loop: the next page
+        is listed while the current one is fetched, messages are fetched
+        concurrently, and batchModify calls start as soon as 1000 matches are
+        queued. The printed report is in the same order as a sequential run.
+        Incremental mode is not supported here; this always runs a full sweep.
+        
+        Args:
+            concurrency (int): Maximum Gmail API requests in flight
+        
+        Returns:
+            dict: Statistics on emails found and trashed
+        """
+        try:
+            plan = self._plan_run()
+            if plan is None:
+                self._report_metrics()
+                return self.stats
+            plan, fetch_format, metadata_headers = plan
             
-            # Move emails to trash
-            if emails_to_trash:
-                print(f"Ready to move {len(emails_to_trash)} emails to Trash.")
+            async with AsyncGmailClient(
+                self.creds, concurrency=concurrency, base_url=rest_base_url(self.api_root),
+                limiter=self.limiter
+            ) as client:
+                pages = iter_plan_pages_async(
+                    plan,
+                    lambda query: iter_message_pages_async(
+                        client, query,
+                        page_size=MAX_RESULTS_PER_SEARCH, max_total=self.max_messages
+                    ),
+                    max_total=self.max_messages
+                )
+                trasher = None if self.dry_run else AsyncTrasher(client)
+                emails_to_trash = []
+                idx = 0
                 
-                if self.dry_run:
-                    print(f"[DRY RUN] Would trash {len(emails_to_trash)} emails (no action taken)")
-                    self.stats['total_trashed'] = len(emails_to_trash)
-                else:
-                    print(f"Moving {len(emails_to_trash)} emails to Trash...")
-                    for email in emails_to_trash:
-                        try:
-                            self.service.users().messages().trash(
-                                userId='me', id=email['id']
-                            ).execute()
-                            self.stats['total_trashed'] += 1
-                        except Exception as e:
-                            print(f"Error trashing email from {email['sender']}: {e}")
-                    print(f"✓ Successfully trashed {self.stats['total_trashed']} emails")
-            else:
-                print("No emails needed to be trashed (all were allowlisted).")
+                async for page_num, results in classify_pages_async(
+                    client, pages, self._classify_message, fetch_format, metadata_headers
+                ):
+                    print(f"Page {page_num}: {len(results)} emails matching unwanted rules.")
+                    print("-" * 70)
+                    
+                    for decision, error in results:
+                        idx += 1
+                        self._record_result(idx, decision, error, emails_to_trash)
+                        if trasher and decision and decision['action'] == 'trash':
+                            trasher.add(decision['id'])
+                
+                if idx == 0:
+                    print("✓ No unwanted emails found.")
+                    self._write_plan([])
+                    self._report_metrics()
+                    return self.stats
+                
+                trash_result = await trasher.drain() if trasher else ([], {})
             
-            print()
-            print("="*70)
-            print("SUMMARY")
-            print("="*70)
-            print(f"Total emails checked: {self.stats['total_checked']}")
-            print(f"Allowlisted (protected): {self.stats['blocked_by_allowlist']}")
-            print(f"Moved to Trash: {self.stats['total_trashed']}")
-            print("="*70)
+            self._finish_run(emails_to_trash, lambda message_ids: trash_result)
+            self._write_plan(emails_to_trash)
             
-        except HttpError as error:
+        except (HttpError, GmailAPIError) as error:
             print(f"✗ Gmail API error: {error}")
             sys.exit(1)
         except Exception as e:
             print(f"✗ Unexpected error: {e}")
             sys.exit(1)
         
+        self._report_metrics()
         return self.stats
 
 
@@ -353,6 +970,11 @@ Examples:
   python email_cleanup.py                    # Dry-run (default)
   python email_cleanup.py --dry-run          # Explicit dry-run
   python email_cleanup.py --execute          # Actually trash emails
+  python email_cleanup.py --max-messages 500 # Cap how many emails are processed
+  python email_cleanup.py --workers 8        # Fetch and classify on 8 threads
+  python email_cleanup.py --async            # Use the asyncio backend (needs httpx)
+  python email_cleanup.py --apply-plan       # Trash exactly what the last dry run found
+  python email_cleanup.py --metrics-json     # Also print the run's metrics as JSON
         """
     )
     
@@ -368,18 +990,85 @@ Examples:
         help='Only print what would be deleted (default behavior)'
     )
     
+    parser.add_argument(
+        '--max-messages',
+        type=int,
+        default=MAX_TOTAL_MESSAGES,
+        metavar='N',
+        help='Stop after N matching emails (default: process every page)'
+    )
+    
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=FETCH_WORKERS,
+        metavar='N',
+        help='Fetch and classify emails on N threads (default: sequential)'
+    )
+    
+    parser.add_argument(
+        '--async',
+        dest='use_async',
+        action='store_true',
+        help='Use the asyncio backend (requires httpx)'
+    )
+    
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Only process mail added since the last --execute run (Gmail History API)'
+    )
+    
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Fetch every email from Gmail instead of using the local message cache'
+    )
+    
+    parser.add_argument(
+        '--apply-plan',
+        action='store_true',
+        help='Trash the emails saved by the last dry run without searching again'
+    )
+    
+    parser.add_argument(
+        '--plan-file',
+        default=CLEANUP_PLAN_FILE,
+        metavar='PATH',
+        help=f'Plan file written by dry runs and read by --apply-plan (default: {CLEANUP_PLAN_FILE})'
+    )
+    
+    parser.add_argument(
+        '--metrics-json',
+        action='store_true',
+        help='Print stage timings, API calls, rule hits and cache use as one JSON line at the end'
+    )
+    
     args = parser.parse_args()
     
-    # Determine dry-run mode
-    dry_run = not args.execute
+    # Determine dry-run mode (applying a reviewed plan is the execute step)
+    dry_run = not (args.execute or (args.apply_plan and not args.dry_run))
     
     if args.execute and args.dry_run:
         print("✗ Error: Cannot use both --execute and --dry-run")
         sys.exit(1)
     
+    if args.use_async and args.incremental:
+        print("✗ Error: --incremental is not supported with --async")
+        sys.exit(1)
+    
     # Run the cleanup
-    cleanup = GmailCleanup(dry_run=dry_run)
-    cleanup.search_and_cleanup()
+    cleanup = GmailCleanup(
+        dry_run=dry_run, max_messages=args.max_messages, workers=args.workers,
+        incremental=args.incremental, use_cache=not args.no_cache, plan_file=args.plan_file,
+        emit_metrics=args.metrics_json
+    )
+    if args.apply_plan:
+        cleanup.apply_plan()
+    elif args.use_async:
+        asyncio.run(cleanup.search_and_cleanup_async())
+    else:
+        cleanup.search_and_cleanup()
 
 
 if __name__ == '__main__':
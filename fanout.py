@@ -0,0 +1,178 @@
+"""
+Fan-out of a mailbox sweep across parallel Lambda invocations
+
+A coordinator invocation lists the matching message IDs, splits them into
+shards and invokes a worker for each shard (the same Lambda function with a
+"worker" event). Workers classify and bulk-trash their shard and return their
+stats, which the coordinator adds up.
+
+Gmail's per-user quota is shared by every worker of a mailbox, so each worker
+is given an equal slice of it; fan-out spreads the CPU, network and timeout
+budget across invocations but cannot exceed the mailbox quota in total.
+Workers that run out of time hand back the IDs they did not reach, and those
+are dispatched again while the coordinator still has time (unless the worker
+made no progress at all).
+
+LocalInvoker runs workers in-process so the whole flow can be tested without
+AWS.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+DEFAULT_SHARD_SIZE = 500
+DEFAULT_MAX_WORKERS = 8
+
+
+class FanOutError(Exception):
+    """A worker invocation failed."""
+
+
+def partition(items, shard_size):
+    """
+    Split a list into consecutive shards.
+
+    Args:
+        items (list): Items to split
+        shard_size (int): Largest shard
+
+    Returns:
+        list: Lists of at most shard_size items
+    """
+    shard_size = max(1, shard_size)
+    return [items[start:start + shard_size] for start in range(0, len(items), shard_size)]
+
+
+class LambdaInvoker:
+    """Invoke a Lambda function synchronously and return its response."""
+
+    def __init__(self, function_name, client):
+        """
+        Args:
+            function_name (str): Function to invoke (usually this function itself)
+            client: boto3 Lambda client with a read timeout longer than the
+                function's timeout and retries disabled, so a long-running
+                worker is neither abandoned nor invoked twice
+        """
+        self.function_name = function_name
+        self.client = client
+
+    def invoke(self, event):
+        """
+        Run one worker.
+
+        Args:
+            event (dict): Worker event
+
+        Returns:
+            dict: The handler's response ({'statusCode': ..., 'body': ...})
+
+        Raises:
+            FanOutError: If the function raised or its response is unreadable
+        """
+        response = self.client.invoke(
+            FunctionName=self.function_name,
+            InvocationType='RequestResponse',
+            Payload=json.dumps(event).encode('utf-8')
+        )
+        try:
+            payload = json.loads(response['Payload'].read())
+        except ValueError as e:
+            raise FanOutError(f"Unreadable worker response: {e}")
+        if response.get('FunctionError'):
+            raise FanOutError(payload.get('errorMessage', 'Worker invocation failed'))
+        return payload
+
+
+class LocalInvoker:
+    """
+    Stand-in for LambdaInvoker that calls a handler in this process.
+
+    Workers run one at a time because they share the container's Gmail
+    service object, which is not thread-safe; run the coordinator with
+    max_workers=1 so each worker gets the whole quota and its deadline is
+    checked when it actually starts.
+    """
+
+    def __init__(self, handler):
+        """
+        Args:
+            handler (callable): handler(event, context), e.g. lambda_handler
+        """
+        self.handler = handler
+        self._lock = threading.Lock()
+
+    def invoke(self, event):
+        """Run one worker in-process (the event is round-tripped through JSON)."""
+        with self._lock:
+            return self.handler(json.loads(json.dumps(event)), None)
+
+
+def run_coordinator(message_ids, invoker, make_event, shard_size=DEFAULT_SHARD_SIZE,
+                    max_workers=DEFAULT_MAX_WORKERS, deadline=None):
+    """
+    Dispatch shards of message IDs to workers and aggregate their results.
+
+    Args:
+        message_ids (list): Every message ID to process
+        invoker: Object with invoke(event) -> handler response
+        make_event (callable): make_event(shard) -> worker event
+        shard_size (int): Message IDs per worker invocation
+        max_workers (int): Worker invocations running at once
+        deadline (float): time.monotonic() value after which no shard is dispatched
+
+    Returns:
+        dict: stats (summed worker stats), quota_units, shards (invocations
+            made), failed_shards, and unprocessed (IDs no worker finished)
+    """
+    shards = deque(partition(message_ids, shard_size))
+    result = {'stats': {}, 'quota_units': 0, 'shards': 0, 'failed_shards': 0, 'unprocessed': 0}
+
+    def out_of_time():
+        return deadline is not None and time.monotonic() >= deadline
+
+    def collect(shard, future):
+        try:
+            response = future.result()
+            body = json.loads(response['body'])
+            if response.get('statusCode') != 200:
+                raise FanOutError(body.get('error', 'Worker returned an error'))
+        except Exception as e:
+            print(f"✗ Worker for {len(shard)} emails failed: {e}")
+            result['failed_shards'] += 1
+            result['unprocessed'] += len(shard)
+            return
+
+        for key, value in body.get('stats', {}).items():
+            result['stats'][key] = result['stats'].get(key, 0) + value
+        result['quota_units'] += body.get('quota', {}).get('quota_units', 0)
+        remaining = body.get('remaining', [])
+        if remaining and len(remaining) < len(shard):
+            # The worker ran out of time; hand its leftovers to another worker
+            shards.append(remaining)
+        elif remaining:
+            # It had no time to start; another worker would not either
+            result['unprocessed'] += len(remaining)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='fanout')
+    in_flight = {}
+    try:
+        while shards or in_flight:
+            while shards and len(in_flight) < max_workers and not out_of_time():
+                shard = shards.popleft()
+                in_flight[executor.submit(invoker.invoke, make_event(shard))] = shard
+                result['shards'] += 1
+
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(in_flight.pop(future), future)
+    finally:
+        executor.shutdown(wait=True)
+
+    result['unprocessed'] += sum(len(shard) for shard in shards)
+    return result
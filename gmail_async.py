@@ -0,0 +1,365 @@
+"""
+asyncio backend for the Gmail cleanup pipeline
+
+AsyncGmailClient talks to the Gmail REST API directly over a pooled httpx
+connection (HTTP keep-alive), so hundreds of requests can be in flight on one
+event loop without a thread per request. The helpers below overlap listing,
+fetching and trashing; GmailCleanup and LambdaGmailCleanup expose them through
+their search_and_cleanup_async methods.
+
+Requires httpx (pip install httpx).
+"""
+
+import asyncio
+import time
+from collections import deque
+
+from gmail_pipeline import (
+    GMAIL_MAX_PAGE_SIZE, GMAIL_MAX_MODIFY_IDS, RETRYABLE_STATUSES, RETRYABLE_REASONS,
+    THROTTLE_REASONS, backoff_delay, rest_base_url
+)
+from rate_limiter import RateLimiter
+
+GMAIL_API_URL = rest_base_url()
+
+# Requests allowed in flight at once on one client
+DEFAULT_CONCURRENCY = 50
+
+
+class GmailAPIError(Exception):
+    """Error response from the Gmail REST API."""
+
+    def __init__(self, status, content):
+        super().__init__(f"Gmail API returned HTTP {status}: {content[:200]}")
+        self.status = status
+        self.content = content
+
+    @property
+    def retryable(self):
+        """bool: True for rate limiting and server-side errors."""
+        if self.status in RETRYABLE_STATUSES:
+            return True
+        return self.status == 403 and any(reason in self.content for reason in RETRYABLE_REASONS)
+
+    @property
+    def throttled(self):
+        """bool: True if Gmail is rate limiting this user."""
+        if self.status == 429:
+            return True
+        return self.status == 403 and any(reason in self.content for reason in THROTTLE_REASONS)
+
+
+class AsyncGmailClient:
+    """Minimal async Gmail API client with connection pooling and retries."""
+
+    def __init__(self, creds, concurrency=DEFAULT_CONCURRENCY, base_url=GMAIL_API_URL,
+                 max_retries=3, timeout=30.0, limiter=None):
+        """
+        Create the client. Use it as an async context manager to close the pool.
+
+        Args:
+            creds: google.oauth2 credentials (refreshed automatically when expired)
+            concurrency (int): Maximum requests in flight (also the pool size)
+            base_url (str): Gmail API root, overridable for local testing
+            max_retries (int): Retries for transient (429/5xx) errors
+            timeout (float): Per-request timeout in seconds
+            limiter (RateLimiter): Shared quota budget (None = count usage only)
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("The async backend requires httpx: pip install httpx")
+
+        self.creds = creds
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.limiter = limiter or RateLimiter(None)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._refresh_lock = asyncio.Lock()
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            )
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close pooled connections."""
+        await self._http.aclose()
+
+    async def _ensure_token(self, force=False):
+        """Refresh the access token if it is missing or expired."""
+        if self.creds is None:
+            return
+        async with self._refresh_lock:
+            if force or not self.creds.valid:
+                from google.auth.transport.requests import Request
+                await asyncio.to_thread(self.creds.refresh, Request())
+
+    async def _request(self, quota_method, method, path, params=None, json=None):
+        """
+        Send one API request with auth, quota and concurrency limiting, and retries.
+
+        Args:
+            quota_method (str): Gmail method name for quota accounting (see QUOTA_UNITS)
+            method (str): HTTP method
+            path (str): Path below base_url
+            params: Query parameters
+            json: JSON request body
+
+        Returns:
+            dict: Decoded JSON response ({} for empty bodies)
+        """
+        await self._ensure_token()
+        refreshed = False
+        attempt = 0
+        while True:
+            headers = {}
+            if self.creds is not None:
+                headers['Authorization'] = f"Bearer {self.creds.token}"
+            delay = self.limiter.reserve(quota_method)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await self._http.request(
+                        method, f"{self.base_url}{path}", params=params, json=json, headers=headers
+                    )
+                except Exception:
+                    self.limiter.record_response(quota_method, None, time.perf_counter() - start)
+                    raise
+                elapsed = time.perf_counter() - start
+            self.limiter.record_response(quota_method, response.status_code, elapsed)
+            self.limiter.received(len(response.content))
+            if response.status_code < 400:
+                self.limiter.succeeded()
+                return response.json() if response.content else {}
+
+            if response.status_code == 401 and not refreshed:
+                refreshed = True
+                await self._ensure_token(force=True)
+                continue
+
+            error = GmailAPIError(response.status_code, response.text)
+            if error.retryable and attempt < self.max_retries:
+                if error.throttled:
+                    self.limiter.throttled()
+                self.limiter.retried()
+                await asyncio.sleep(backoff_delay(attempt))
+                attempt += 1
+                continue
+            raise error
+
+    async def list_messages(self, query, page_token=None, max_results=100):
+        """
+        Fetch one page of users.messages.list.
+
+        Returns:
+            dict: Response with 'messages' and optionally 'nextPageToken'
+        """
+        params = {'q': query, 'maxResults': max_results}
+        if page_token:
+            params['pageToken'] = page_token
+        return await self._request('messages.list', 'GET', '/users/me/messages', params=params)
+
+    async def get_message(self, message_id, format='full', metadata_headers=None):
+        """
+        Fetch one message with users.messages.get.
+
+        Returns:
+            dict: Gmail message resource
+        """
+        params = [('format', format)]
+        for header in metadata_headers or []:
+            params.append(('metadataHeaders', header))
+        return await self._request(
+            'messages.get', 'GET', f'/users/me/messages/{message_id}', params=params
+        )
+
+    async def batch_modify(self, message_ids, add_label_ids=(), remove_label_ids=()):
+        """Apply label changes to up to 1000 messages with users.messages.batchModify."""
+        body = {
+            'ids': list(message_ids),
+            'addLabelIds': list(add_label_ids),
+            'removeLabelIds': list(remove_label_ids)
+        }
+        return await self._request(
+            'messages.batchModify', 'POST', '/users/me/messages/batchModify', json=body
+        )
+
+    async def trash(self, message_id):
+        """Move a single message to Trash with users.messages.trash."""
+        return await self._request('messages.trash', 'POST', f'/users/me/messages/{message_id}/trash')
+
+
+async def iter_message_pages_async(client, query, page_size=100, max_total=None):
+    """
+    Async counterpart of gmail_pipeline.iter_message_pages.
+
+    The next page is requested as soon as the current one arrives, so listing
+    overlaps with whatever the caller does with each page.
+
+    Yields:
+        list: Message stubs for one page
+    """
+    page_size = max(1, min(page_size, GMAIL_MAX_PAGE_SIZE))
+    remaining = max_total
+    if remaining is not None and remaining <= 0:
+        return
+
+    def next_size():
+        return page_size if remaining is None else min(page_size, remaining)
+
+    task = asyncio.ensure_future(client.list_messages(query, None, next_size()))
+    try:
+        while task is not None:
+            results = await task
+            messages = results.get('messages', [])
+            if remaining is not None:
+                messages = messages[:remaining]
+                remaining -= len(messages)
+
+            page_token = results.get('nextPageToken')
+            task = None
+            if page_token and (remaining is None or remaining > 0):
+                task = asyncio.ensure_future(client.list_messages(query, page_token, next_size()))
+
+            if messages:
+                yield messages
+    finally:
+        if task is not None:
+            task.cancel()
+
+
+async def iter_plan_pages_async(plan, pages_for_query, max_total=None):
+    """
+    Async counterpart of query_planner.iter_plan_pages.
+
+    Args:
+        plan (QueryPlan): Plan from query_planner.plan_queries
+        pages_for_query (callable): pages_for_query(query) -> async iterator of pages
+        max_total (int): Stop after this many unique messages (None = no limit)
+
+    Yields:
+        list: Message stubs not yet seen in an earlier page
+    """
+    seen = set()
+    remaining = max_total
+    for query in plan.queries:
+        pages = pages_for_query(query)
+        try:
+            async for messages in pages:
+                fresh = [message for message in messages if message['id'] not in seen]
+                seen.update(message['id'] for message in fresh)
+                if remaining is not None:
+                    fresh = fresh[:remaining]
+                    remaining -= len(fresh)
+                if fresh:
+                    yield fresh
+                if remaining is not None and remaining <= 0:
+                    return
+        finally:
+            await pages.aclose()
+
+
+async def classify_pages_async(client, pages, classify, format='full', metadata_headers=None):
+    """
+    Fetch every message of each page concurrently and classify it.
+
+    Up to two pages are fetched at once (bounded further by the client's
+    concurrency limit); results are yielded per page in listing order.
+
+    Args:
+        client (AsyncGmailClient): Client used for messages.get
+        pages: Async iterator of message stub pages
+        classify (callable): classify(message_id, message) -> decision
+        format (str): messages.get format
+        metadata_headers (list): Headers to request for format='metadata'
+
+    Yields:
+        tuple: (page_num, results) where results are (decision, error) tuples
+    """
+    async def fetch_one(message_id):
+        try:
+            message = await client.get_message(message_id, format, metadata_headers)
+            return classify(message_id, message), None
+        except Exception as e:
+            return None, e
+
+    async def fetch_page(messages):
+        return await asyncio.gather(*(fetch_one(message['id']) for message in messages))
+
+    in_flight = deque()
+    try:
+        page_num = 0
+        async for messages in pages:
+            page_num += 1
+            in_flight.append((page_num, asyncio.ensure_future(fetch_page(messages))))
+            if len(in_flight) > 1:
+                num, task = in_flight.popleft()
+                yield num, await task
+
+        while in_flight:
+            num, task = in_flight.popleft()
+            yield num, await task
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+
+
+class AsyncTrasher:
+    """Trash messages in the background as soon as a full batchModify chunk is ready."""
+
+    def __init__(self, client, chunk_size=GMAIL_MAX_MODIFY_IDS):
+        self.client = client
+        self.chunk_size = max(1, min(chunk_size, GMAIL_MAX_MODIFY_IDS))
+        self._pending = []
+        self._tasks = []
+
+    def add(self, message_id):
+        """Queue a message; a batchModify starts once chunk_size IDs are queued."""
+        self._pending.append(message_id)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            chunk, self._pending = self._pending, []
+            self._tasks.append(asyncio.ensure_future(self._trash_chunk(chunk)))
+
+    async def _trash_chunk(self, chunk):
+        try:
+            await self.client.batch_modify(chunk, ['TRASH'], ['INBOX'])
+            return chunk, {}
+        except Exception:
+            # Fall back to trashing this chunk one message at a time
+            trashed, failed = [], {}
+            for message_id in chunk:
+                try:
+                    await self.client.trash(message_id)
+                    trashed.append(message_id)
+                except Exception as e:
+                    failed[message_id] = e
+            return trashed, failed
+
+    async def drain(self):
+        """
+        Trash whatever is still queued and wait for every chunk.
+
+        Returns:
+            tuple: (trashed_ids: list, failed: dict of message_id -> error)
+        """
+        self._flush()
+        trashed, failed = [], {}
+        for chunk_trashed, chunk_failed in await asyncio.gather(*self._tasks):
+            trashed.extend(chunk_trashed)
+            failed.update(chunk_failed)
+        self._tasks = []
+        return trashed, failed
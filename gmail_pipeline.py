@@ -0,0 +1,654 @@
+"""
+Gmail API pipeline stages shared by email_cleanup.py and lambda_handler.py
+
+Each stage takes an authenticated Gmail service object and streams its results
+so that later stages (classification, trashing) can start before earlier ones
+have finished. Every stage also accepts a shared rate_limiter.RateLimiter that
+keeps the run within Gmail's per-user quota, counts the units spent and
+records each response's status and latency.
+"""
+
+import json
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.errors import HttpError
+
+from rate_limiter import RateLimiter
+
+# Root URL of the Gmail API. Set GMAIL_API_ROOT to send every request to a
+# stand-in such as benchmarks/fake_gmail.py instead.
+DEFAULT_GMAIL_API_ROOT = 'https://gmail.googleapis.com/'
+GMAIL_API_ROOT = os.environ.get('GMAIL_API_ROOT', DEFAULT_GMAIL_API_ROOT)
+
+# Largest maxResults value accepted by users().messages().list
+GMAIL_MAX_PAGE_SIZE = 500
+
+# Gmail accepts up to 100 calls per batch request, but batches larger than 50
+# are much more likely to have parts rejected with rateLimitExceeded
+GMAIL_MAX_BATCH_SIZE = 100
+DEFAULT_BATCH_SIZE = 50
+
+# Largest number of IDs accepted by a single users().messages().batchModify
+GMAIL_MAX_MODIFY_IDS = 1000
+
+# Headers read by each built-in rule in config.UNWANTED_RULES. The allowlist
+# always needs From; labelIds are returned with every format.
+RULE_HEADERS = {
+    'no_reply_senders': ['From'],
+    'subject_keywords': ['Subject'],
+    'gmail_category_promotions': [],
+}
+ALLOWLIST_HEADERS = ['From']
+
+# Labels that exclude a newly added message from cleanup (matches the default
+# behaviour of Gmail search, which skips Trash and Spam)
+HISTORY_SKIP_LABELS = {'TRASH', 'SPAM', 'DRAFT'}
+
+# HTTP statuses (and 403 reasons) worth retrying rather than reporting
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'backendError')
+THROTTLE_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+class HistoryExpiredError(Exception):
+    """The stored historyId is too old for users().history().list (HTTP 404)."""
+
+
+def rest_base_url(root_url=GMAIL_API_ROOT):
+    """str: Base URL of the Gmail v1 REST resources below root_url (for gmail_async)."""
+    return root_url.rstrip('/') + '/gmail/v1'
+
+
+class MeteredHttp:
+    """
+    Wrap an httplib2.Http so the response bytes it reads are counted.
+
+    Use it as the inner http of an AuthorizedHttp; every other attribute is
+    passed through to the wrapped object.
+    """
+
+    def __init__(self, http, limiter):
+        """
+        Args:
+            http (httplib2.Http): Connection object to wrap
+            limiter (RateLimiter): Limiter whose bytes_received is incremented
+        """
+        self.http = http
+        self.limiter = limiter
+
+    def request(self, *args, **kwargs):
+        response, content = self.http.request(*args, **kwargs)
+        self.limiter.received(len(content or b''))
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def build_service(creds, document=None, root_url=GMAIL_API_ROOT, http=None):
+    """
+    Build the Gmail v1 service object.
+
+    Args:
+        creds: google.oauth2 credentials
+        document (str): Discovery document JSON (None = fetch or use the copy
+            shipped with google-api-python-client)
+        root_url (str): Gmail API root; anything but the real one rewrites the
+            discovery document so that single and batch requests both go there
+        http: Authorized http object for the service to use instead of
+            creating one from creds (e.g. wrapping a MeteredHttp)
+
+    Returns:
+        Resource: Gmail v1 service
+    """
+    from googleapiclient.discovery import build, build_from_document
+
+    if root_url != DEFAULT_GMAIL_API_ROOT:
+        if document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+            document = get_static_doc('gmail', 'v1')
+        document = json.loads(document)
+        document['rootUrl'] = document['baseUrl'] = root_url.rstrip('/') + '/'
+        document.pop('mtlsRootUrl', None)
+    auth = {'http': http} if http is not None else {'credentials': creds}
+    if document is None:
+        return build('gmail', 'v1', **auth)
+    return build_from_document(document, **auth)
+
+
+def fetch_spec_for_rules(rules, fetch_mode='metadata'):
+    """
+    Work out the cheapest messages().get format that can evaluate the rules.
+
+    Built-in rules only need a few headers, so messages are fetched with
+    format='metadata' and metadataHeaders limited to what the enabled rules
+    read. Custom rules may declare "headers": [...] to join the whitelist, or
+    "needs_body": True to escalate to format='full'. A custom rule that
+    declares neither is assumed to need the full message.
+
+    Args:
+        rules (dict): Rule definitions shaped like config.UNWANTED_RULES
+        fetch_mode (str): 'metadata' to derive the format, 'full' to force it
+
+    Returns:
+        tuple: (format, metadata_headers) where metadata_headers is None for 'full'
+    """
+    if fetch_mode == 'full':
+        return 'full', None
+
+    headers = list(ALLOWLIST_HEADERS)
+    for name, rule in rules.items():
+        if not rule.get('enabled', False):
+            continue
+        if rule.get('needs_body', False):
+            return 'full', None
+        if 'headers' in rule:
+            rule_headers = rule['headers']
+        elif name in RULE_HEADERS:
+            rule_headers = RULE_HEADERS[name]
+        else:
+            return 'full', None
+        for header in rule_headers:
+            if header not in headers:
+                headers.append(header)
+
+    return 'metadata', headers
+
+
+def iter_message_pages(service, query, page_size=100, max_total=None, http_factory=None,
+                       limiter=None):
+    """
+    Yield pages of message stubs for a search query, following nextPageToken.
+
+    As soon as a page arrives, the request for the next page is started on a
+    background thread so the caller can classify page N while page N+1 is
+    still in flight. httplib2 connections are not thread-safe, so prefetching
+    only happens when http_factory is given to supply a dedicated connection.
+
+    Args:
+        service: Authenticated Gmail API service object
+        query (str): Gmail search query
+        page_size (int): Messages requested per list call (capped at 500)
+        max_total (int): Stop after this many messages (None = no limit)
+        http_factory (callable): Returns a new authorized http object for the
+            prefetch thread. If None, pages are fetched sequentially.
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+    Yields:
+        list: Message stubs ({'id': ..., 'threadId': ...}) for one page
+    """
+    page_size = max(1, min(page_size, GMAIL_MAX_PAGE_SIZE))
+    remaining = max_total
+
+    def fetch_page(page_token, size, http=None):
+        request = service.users().messages().list(
+            userId='me', q=query, maxResults=size, pageToken=page_token
+        )
+        return execute_request(request, 'messages.list', limiter, http=http)
+
+    def next_size():
+        return page_size if remaining is None else min(page_size, remaining)
+
+    if remaining is not None and remaining <= 0:
+        return
+
+    if http_factory is None:
+        page_token = None
+        while True:
+            results = fetch_page(page_token, next_size())
+            messages = results.get('messages', [])
+            if remaining is not None:
+                messages = messages[:remaining]
+                remaining -= len(messages)
+            if messages:
+                yield messages
+            page_token = results.get('nextPageToken')
+            if not page_token or (remaining is not None and remaining <= 0):
+                return
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gmail-list')
+    http = http_factory()
+    try:
+        future = executor.submit(fetch_page, None, next_size(), http)
+        while future is not None:
+            results = future.result()
+            messages = results.get('messages', [])
+            if remaining is not None:
+                messages = messages[:remaining]
+                remaining -= len(messages)
+
+            # Kick off the next page before handing this one to the caller
+            page_token = results.get('nextPageToken')
+            future = None
+            if page_token and (remaining is None or remaining > 0):
+                future = executor.submit(fetch_page, page_token, next_size(), http)
+
+            if messages:
+                yield messages
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def is_retryable_error(error):
+    """
+    Check whether a Gmail API error is transient and worth retrying.
+
+    Args:
+        error (Exception): Error raised by, or passed back from, a request
+
+    Returns:
+        bool: True for rate limiting and server-side errors
+    """
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRYABLE_STATUSES:
+        return True
+    if status == 403:
+        content = error.content
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        return any(reason in content for reason in RETRYABLE_REASONS)
+    return False
+
+
+def is_throttle_error(error):
+    """
+    Check whether an error means Gmail is rate limiting this user.
+
+    Args:
+        error (Exception): Error raised by, or passed back from, a request
+
+    Returns:
+        bool: True for HTTP 429 and 403 rateLimitExceeded responses
+    """
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    if error.resp.status == 403:
+        content = error.content
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', 'replace')
+        return any(reason in content for reason in THROTTLE_REASONS)
+    return False
+
+
+def error_status(error):
+    """int: HTTP status of an API error (None if no response was received)."""
+    if isinstance(error, HttpError):
+        return error.resp.status
+    return None
+
+
+def backoff_delay(attempt, base=1.0, cap=32.0):
+    """
+    Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): Retry number, starting at 0
+        base (float): Delay for the first retry in seconds
+        cap (float): Upper bound for any single delay
+
+    Returns:
+        float: Seconds to sleep before the next attempt
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def execute_request(request, method, limiter=None, max_retries=3, http=None):
+    """
+    Execute one API request within the quota budget, retrying transient errors.
+
+    Args:
+        request: googleapiclient HttpRequest
+        method (str): Gmail method name used for quota accounting (see QUOTA_UNITS)
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+        max_retries (int): Retries for rate limiting and server-side errors
+        http: Authorized http object to execute with (None = service default)
+
+    Returns:
+        dict: Decoded response
+
+    Raises:
+        Exception: The last error, once retries are exhausted or it is not transient
+    """
+    limiter = limiter or RateLimiter(None)
+    for attempt in range(max_retries + 1):
+        limiter.wait(method)
+        start = time.perf_counter()
+        try:
+            response = request.execute(http=http) if http is not None else request.execute()
+        except Exception as e:
+            limiter.record_response(method, error_status(e), time.perf_counter() - start)
+            if not is_retryable_error(e) or attempt == max_retries:
+                raise
+            if is_throttle_error(e):
+                limiter.throttled()
+            limiter.retried()
+            time.sleep(backoff_delay(attempt))
+            continue
+        limiter.record_response(method, 200, time.perf_counter() - start)
+        limiter.succeeded()
+        return response
+
+
+def batch_get_messages(service, message_ids, format='full', metadata_headers=None,
+                       batch_size=DEFAULT_BATCH_SIZE, max_retries=5, http=None, limiter=None):
+    """
+    Fetch messages using Gmail batch requests instead of one round trip each.
+
+    IDs are grouped into batch requests of up to batch_size calls. Parts that
+    fail with a transient error are re-queued and retried together (with
+    backoff) in a later round; other failures are reported per message. Each
+    batch waits until its calls fit in the limiter's quota budget.
+
+    Args:
+        service: Authenticated Gmail API service object
+        message_ids (list): Gmail message IDs to fetch
+        format (str): messages().get format ('full', 'metadata', 'minimal')
+        metadata_headers (list): Headers to return when format='metadata'
+        batch_size (int): Calls per batch request (capped at 100)
+        max_retries (int): Retry rounds for transiently failing parts
+        http: Authorized http object to execute with (None = service default)
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+    Returns:
+        list: (message_id, message, error) tuples in the order of message_ids.
+            Exactly one of message and error is None.
+    """
+    batch_size = max(1, min(batch_size, GMAIL_MAX_BATCH_SIZE))
+    limiter = limiter or RateLimiter(None)
+    get_kwargs = {'userId': 'me', 'format': format}
+    if metadata_headers:
+        get_kwargs['metadataHeaders'] = list(metadata_headers)
+
+    fetched = {}
+    errors = {}
+    pending = list(dict.fromkeys(message_ids))
+
+    for attempt in range(max_retries + 1):
+        retry = []
+        throttled = []
+        final_attempt = attempt == max_retries
+
+        def callback(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response
+                return
+            failed_parts.append(error_status(exception))
+            if is_throttle_error(exception):
+                throttled.append(exception)
+            if is_retryable_error(exception) and not final_attempt:
+                retry.append(request_id)
+            else:
+                errors[request_id] = exception
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for message_id in chunk:
+                batch.add(
+                    service.users().messages().get(id=message_id, **get_kwargs),
+                    request_id=message_id
+                )
+            limiter.wait('messages.get', len(chunk))
+            throttled.clear()
+            failed_parts = []
+            start = time.perf_counter()
+            try:
+                batch.execute(http=http)
+            except Exception as e:
+                if is_throttle_error(e):
+                    throttled.append(e)
+                # The whole batch failed; retry or fail each part it contained
+                for message_id in chunk:
+                    if message_id in fetched or message_id in errors or message_id in retry:
+                        continue
+                    failed_parts.append(error_status(e))
+                    if is_retryable_error(e) and not final_attempt:
+                        retry.append(message_id)
+                    else:
+                        errors[message_id] = e
+            # Every part's status is counted, but the batch request has one latency
+            statuses = Counter(failed_parts)
+            statuses[200] += len(chunk) - len(failed_parts)
+            elapsed = time.perf_counter() - start
+            for status, count in statuses.items():
+                if count:
+                    limiter.record_response('messages.get', status, elapsed, count)
+                    elapsed = None
+            if throttled:
+                limiter.throttled()
+            else:
+                limiter.succeeded()
+
+        if not retry:
+            break
+        pending = retry
+        limiter.retried(len(retry))
+        time.sleep(backoff_delay(attempt))
+
+    return [
+        (message_id, fetched.get(message_id), errors.get(message_id))
+        for message_id in message_ids
+    ]
+
+
+def batch_trash_messages(service, message_ids, chunk_size=GMAIL_MAX_MODIFY_IDS,
+                         max_retries=3, http=None, limiter=None):
+    """
+    Move messages to Trash with batchModify instead of one trash() call each.
+
+    Each chunk of up to 1000 IDs gets the TRASH label added and INBOX removed
+    in a single call. A chunk that still fails after max_retries transient
+    errors (or fails outright) falls back to individual trash() calls, so
+    only the IDs that genuinely cannot be trashed are reported.
+
+    Args:
+        service: Authenticated Gmail API service object
+        message_ids (list): Gmail message IDs to trash
+        chunk_size (int): IDs per batchModify call (capped at 1000)
+        max_retries (int): Retries per chunk for transient errors
+        http: Authorized http object to execute with (None = service default)
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+    Returns:
+        tuple: (trashed_ids: list, failed: dict of message_id -> error)
+    """
+    chunk_size = max(1, min(chunk_size, GMAIL_MAX_MODIFY_IDS))
+    message_ids = list(dict.fromkeys(message_ids))
+    trashed = []
+    failed = {}
+
+    for start in range(0, len(message_ids), chunk_size):
+        chunk = message_ids[start:start + chunk_size]
+        body = {'ids': chunk, 'addLabelIds': ['TRASH'], 'removeLabelIds': ['INBOX']}
+
+        try:
+            execute_request(
+                service.users().messages().batchModify(userId='me', body=body),
+                'messages.batchModify', limiter, max_retries=max_retries, http=http
+            )
+            trashed.extend(chunk)
+        except Exception:
+            # Fall back to trashing this chunk one message at a time
+            for message_id in chunk:
+                try:
+                    execute_request(
+                        service.users().messages().trash(userId='me', id=message_id),
+                        'messages.trash', limiter, max_retries=max_retries, http=http
+                    )
+                    trashed.append(message_id)
+                except Exception as trash_error:
+                    failed[message_id] = trash_error
+
+    return trashed, failed
+
+
+def get_current_history_id(service, limiter=None):
+    """
+    Read the mailbox's current historyId from users().getProfile.
+
+    Args:
+        service: Authenticated Gmail API service object
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+    Returns:
+        str: Latest historyId for the authenticated mailbox
+    """
+    profile = execute_request(service.users().getProfile(userId='me'), 'getProfile', limiter)
+    return str(profile['historyId'])
+
+
+def get_label_ids(service, limiter=None):
+    """
+    Map the mailbox's label names to label IDs with users().labels().list.
+
+    Args:
+        service: Authenticated Gmail API service object
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+    Returns:
+        dict: Lowercased label name (and lowercased ID) -> label ID
+    """
+    results = execute_request(service.users().labels().list(userId='me'), 'labels.list', limiter)
+    label_ids = {}
+    for label in results.get('labels', []):
+        label_ids[label['id'].lower()] = label['id']
+        label_ids[label.get('name', label['id']).lower()] = label['id']
+    return label_ids
+
+
+def changed_message_ids(service, start_history_id, limiter=None):
+    """
+    Collect the messages whose labels changed, or that were deleted, since a historyId.
+
+    Args:
+        service: Authenticated Gmail API service object
+        start_history_id (str): historyId to read changes from
+        limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+    Returns:
+        tuple: (message_ids, history_id) where message_ids is a set and
+            history_id is the mailbox's historyId the changes are current to
+
+    Raises:
+        HistoryExpiredError: If Gmail no longer has history that far back
+    """
+    message_ids = set()
+    history_id = str(start_history_id)
+    page_token = None
+    while True:
+        request = service.users().history().list(
+            userId='me', startHistoryId=str(start_history_id),
+            historyTypes=['labelAdded', 'labelRemoved', 'messageDeleted'],
+            maxResults=GMAIL_MAX_PAGE_SIZE, pageToken=page_token
+        )
+        try:
+            results = execute_request(request, 'history.list', limiter)
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise HistoryExpiredError(f"historyId {start_history_id} has expired") from e
+            raise
+
+        for record in results.get('history', []):
+            for key in ('labelsAdded', 'labelsRemoved', 'messagesDeleted'):
+                for change in record.get(key, []):
+                    message_id = change.get('message', {}).get('id')
+                    if message_id:
+                        message_ids.add(message_id)
+        if results.get('historyId'):
+            history_id = str(results['historyId'])
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return message_ids, history_id
+
+
+class HistoryPager:
+    """
+    Iterate over messages added or relabelled since a stored historyId.
+
+    Only messagesAdded and labelsAdded events are read, so a daily run costs
+    API calls proportional to new mail rather than to mailbox size. The first
+    history page is requested on construction, so an expired historyId raises
+    HistoryExpiredError before any work is done and the caller can fall back
+    to a full sweep. After iterating, history_id holds the checkpoint to save;
+    if iteration stops early, processed_history_id is the historyId up to which
+    every yielded page has been handled, so a later run can resume from it.
+    """
+
+    def __init__(self, service, start_history_id, page_size=GMAIL_MAX_PAGE_SIZE, limiter=None):
+        """
+        Args:
+            service: Authenticated Gmail API service object
+            start_history_id (str): historyId saved by the previous run
+            page_size (int): History records requested per call (max 500)
+            limiter (RateLimiter): Shared quota budget (None = unlimited)
+
+        Raises:
+            HistoryExpiredError: If Gmail no longer has history that far back
+        """
+        self.service = service
+        self.start_history_id = str(start_history_id)
+        self.history_id = self.start_history_id
+        self.processed_history_id = self.start_history_id
+        self.page_size = max(1, min(page_size, GMAIL_MAX_PAGE_SIZE))
+        self.limiter = limiter
+        self._first_page = self._fetch(None)
+
+    def _fetch(self, page_token):
+        request = self.service.users().history().list(
+            userId='me', startHistoryId=self.start_history_id,
+            historyTypes=['messageAdded', 'labelAdded'],
+            maxResults=self.page_size, pageToken=page_token
+        )
+        try:
+            return execute_request(request, 'history.list', self.limiter)
+        except HttpError as e:
+            if e.resp.status == 404:
+                raise HistoryExpiredError(
+                    f"historyId {self.start_history_id} has expired"
+                ) from e
+            raise
+
+    def __iter__(self):
+        """
+        Yields:
+            list: Message stubs ({'id': ..., 'threadId': ...}) for one history page,
+                each message appearing at most once per run
+        """
+        seen = set()
+        results = self._first_page
+        while True:
+            messages = []
+            for record in results.get('history', []):
+                for change in record.get('messagesAdded', []) + record.get('labelsAdded', []):
+                    message = change.get('message', {})
+                    message_id = message.get('id')
+                    if not message_id or message_id in seen:
+                        continue
+                    if HISTORY_SKIP_LABELS.intersection(message.get('labelIds', [])):
+                        continue
+                    seen.add(message_id)
+                    messages.append({'id': message_id, 'threadId': message.get('threadId')})
+
+            if results.get('historyId'):
+                self.history_id = str(results['historyId'])
+            if messages:
+                yield messages
+
+            # The caller asked for more, so every record so far has been handled
+            records = results.get('history', [])
+            if records:
+                self.processed_history_id = str(records[-1]['id'])
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+            results = self._fetch(page_token)
@@ -9,24 +9,385 @@ To deploy:
 2. Package this code with dependencies
 3. Create Lambda function with this code
 4. Set EventBridge rule to trigger on schedule (e.g., daily at 9 AM)
+
+Cold starts are kept short: boto3, google-auth, googleapiclient.discovery and
+asyncio are imported only when first needed, the Gmail service is built from
+a bundled discovery document, and AWS clients, credentials and the service
+object are kept at module scope so warm invocations reuse them (measure with
+benchmarks/bench_cold_start.py).
+
+Sweeps larger than one invocation are split up: each invocation stops
+DEADLINE_MARGIN seconds before its timeout and saves the search page token it
+would have listed next, and the next invocation continues from that token.
+Gmail page tokens behave like offsets into the current result list, and
+trashed mail drops out of that list, so a resumed invocation skips as many
+matching messages as the previous invocation trashed. When nearly every
+result is trashed, that is about half of the backlog per sweep. Skipped mail
+still matches the search and is cleaned by a later sweep (one that starts
+from the first page); dry runs never save a cursor. Restarting the query on
+every invocation instead would not progress through mailboxes with more
+kept matches than one invocation can process.
+
+At the end of every invocation, throughput, Gmail API latency, quota use and
+a duration breakdown are printed as CloudWatch Embedded Metric Format records,
+which CloudWatch turns into metrics without any extra API call.
 """
 
 import json
 import os
 import base64
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-import boto3
 import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from gmail_pipeline import (
+    batch_get_messages, batch_trash_messages, get_current_history_id, execute_request,
+    build_service, rest_base_url, error_status, HistoryPager, HistoryExpiredError,
+    GMAIL_MAX_MODIFY_IDS, GMAIL_API_ROOT
+)
+from rate_limiter import RateLimiter, GMAIL_USER_QUOTA_PER_SECOND
+from metrics import RunMetrics, Histogram, STAGES, emf_document
+from rules import RuleSet
+from allowlist import AllowlistIndex
+
+SEARCH_QUERY = '(from:no-reply@ OR subject:newsletter OR subject:unsubscribe OR subject:promotional OR category:promotions)'
+
+# The Lambda rules only read the sender and subject
+FETCH_HEADERS = ['From', 'Subject']
+
+# Messages listed per search page; the resume cursor is saved between pages
+PAGE_SIZE = 100
+
+# Seconds before the Lambda timeout at which no new page is started, leaving
+# time to trash pending matches and save the resume cursor
+DEADLINE_MARGIN = float(os.environ.get('DEADLINE_MARGIN', '10'))
+
+# Share of a coordinator's time budget spent listing message IDs; the rest is
+# left for dispatching shards to workers
+COORDINATOR_LIST_FRACTION = 0.25
+
+# Rules used by the Lambda, compiled once per container
+LAMBDA_RULES = RuleSet.from_config({
+    'no_reply_senders': {'enabled': True, 'pattern': 'no-reply@'},
+    'subject_keywords': {
+        'enabled': True,
+        'keywords': ["newsletter", "unsubscribe", "promotional", "promotion"]
+    }
+})
+
+# Senders the Lambda never trashes, indexed once per container
+LAMBDA_ALLOWLIST = AllowlistIndex(
+    senders=["windsor metro west", "texas oncology", "kelvin.guerra", "princess.martin"]
+)
+
+# SSM parameter holding incremental sync state (last processed historyId)
+STATE_PARAMETER = os.environ.get('STATE_PARAMETER', '/email-cleanup/sync-state')
+
+# Gmail discovery document bundled with the deployment package (see
+# LAMBDA_SETUP.md), so building the service never needs a network round trip
+DISCOVERY_DOC_PATH = os.environ.get(
+    'GMAIL_DISCOVERY_DOC',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gmail.v1.json')
+)
+
+# Secrets Manager secret holding the authorized-user Gmail credentials
+GMAIL_SECRET_ID = os.environ.get('GMAIL_SECRET_ID', 'gmail-credentials')
+GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
+
+# How long a warm container trusts the secret before reading it again (picks
+# up rotated credentials), and how close to expiry the access token is refreshed
+SECRET_CACHE_TTL = int(os.environ.get('SECRET_CACHE_TTL', '3600'))
+TOKEN_REFRESH_MARGIN = 300
+
+# Multi-account mode: account "alice@example.com" reads its credentials from
+# the secret "gmail-credentials/alice@example.com" and keeps its sync state
+# under STATE_PARAMETER/alice_example.com
+ACCOUNT_SECRET_PREFIX = os.environ.get('ACCOUNT_SECRET_PREFIX', f"{GMAIL_SECRET_ID}/")
+
+# Mailboxes processed at once in multi-account mode (each has its own quota)
+ACCOUNT_CONCURRENCY = int(os.environ.get('ACCOUNT_CONCURRENCY', '4'))
+
+# Secrets Manager returns at most 20 secrets per BatchGetSecretValue call
+SECRETS_BATCH_SIZE = 20
+
+# CloudWatch namespace of the EMF metrics printed at the end of each invocation
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'EmailCleanup')
+EMIT_METRICS = os.environ.get('EMIT_METRICS', 'true').lower() == 'true'
+
+# Fan-out workers are invoked synchronously and may run up to Lambda's
+# 15-minute limit, so the invoke call must wait that long for a response
+# (botocore's default of 60 s would time out and retry, running a shard twice)
+LAMBDA_INVOKE_READ_TIMEOUT = 15 * 60 + 10
+
+# boto3 clients by service name, created once per container
+_aws_clients = {}
+
+# True until this container's first invocation has finished
+_cold_start = True
+
+
+def aws_client(service_name):
+    """Return a boto3 client for service_name, reused across warm invocations."""
+    client = _aws_clients.get(service_name)
+    if client is None:
+        import boto3
+        options = {}
+        if service_name == 'lambda':
+            from botocore.config import Config
+            # Never retry an invoke: the first worker may still be running
+            options['config'] = Config(
+                read_timeout=LAMBDA_INVOKE_READ_TIMEOUT, retries={'max_attempts': 0}
+            )
+        client = _aws_clients[service_name] = boto3.client(service_name, **options)
+    return client
+
+
+def load_discovery_doc():
+    """
+    Read the Gmail v1 discovery document from disk.
+    
+    Uses the copy at DISCOVERY_DOC_PATH, falling back to the one shipped with
+    google-api-python-client.
+    
+    Returns:
+        str: Discovery document JSON, or None if neither copy exists
+    """
+    try:
+        with open(DISCOVERY_DOC_PATH, 'r') as f:
+            return f.read()
+    except OSError:
+        from googleapiclient.discovery_cache import get_static_doc
+        return get_static_doc('gmail', 'v1')
+
+
+def build_gmail_service(creds):
+    """
+    Build the Gmail API service object from the local discovery document.
+    
+    Args:
+        creds: google.oauth2 credentials
+    
+    Returns:
+        Resource: Gmail v1 service (fetches the discovery document only if no
+            local copy is available)
+    """
+    return build_service(creds, load_discovery_doc())
+
+
+class CredentialCache:
+    """Gmail credentials and service object shared by warm invocations."""
+    
+    def __init__(self, secret_id=GMAIL_SECRET_ID, ttl=SECRET_CACHE_TTL, clock=time.time):
+        """
+        Args:
+            secret_id (str): Secrets Manager secret with the Gmail credentials
+            ttl (float): Seconds before the secret is read again
+            clock (callable): Time source
+        """
+        self.secret_id = secret_id
+        self.ttl = ttl
+        self._clock = clock
+        self.creds = None
+        self.service = None
+        self.loaded_at = None
+    
+    def _load(self, secret_string=None):
+        """
+        Build fresh credentials and a service object.
+        
+        Args:
+            secret_string (str): Secret value already fetched by fetch_secrets()
+                (default: read the secret now)
+        """
+        from google.oauth2.credentials import Credentials
+        
+        if secret_string is None:
+            secret_response = aws_client('secretsmanager').get_secret_value(SecretId=self.secret_id)
+            secret_string = secret_response['SecretString']
+        credentials_json = json.loads(secret_string)
+        self.creds = Credentials.from_authorized_user_info(credentials_json, scopes=GMAIL_SCOPES)
+        self.service = build_gmail_service(self.creds)
+        self.loaded_at = self._clock()
+    
+    def _token_expiring(self):
+        """bool: True if there is no access token or it expires within the margin."""
+        if not self.creds.token:
+            return True
+        if self.creds.expiry is None:
+            return False
+        # google-auth keeps expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return self.creds.expiry - now < timedelta(seconds=TOKEN_REFRESH_MARGIN)
+    
+    def _refresh_token(self):
+        """Get a new access token with the refresh token (no Secrets Manager call)."""
+        import google_auth_httplib2
+        import httplib2
+        
+        self.creds.refresh(google_auth_httplib2.Request(httplib2.Http()))
+    
+    def needs_secret(self):
+        """bool: True if the next get() has to read the secret (cold or expired)."""
+        return self.creds is None or self._clock() - self.loaded_at >= self.ttl
+    
+    def get(self, secret_string=None):
+        """
+        Return credentials with a usable access token and the Gmail service.
+        
+        The secret is only read on a cold start, once the TTL has passed, or
+        when the cached refresh token no longer works.
+        
+        Args:
+            secret_string (str): Prefetched secret value to use if the secret
+                has to be read
+        
+        Returns:
+            tuple: (creds, service, reused) where reused is True on a warm start
+        """
+        from google.auth.exceptions import RefreshError
+        
+        reused = True
+        if self.needs_secret():
+            self._load(secret_string)
+            reused = False
+        
+        if self._token_expiring():
+            try:
+                self._refresh_token()
+            except RefreshError:
+                if not reused:
+                    raise
+                # The refresh token may have been rotated; read the secret again
+                self._load()
+                reused = False
+                if self._token_expiring():
+                    self._refresh_token()
+        
+        return self.creds, self.service, reused
+    
+    def invalidate(self):
+        """Forget the cached credentials so the next get() reads the secret again."""
+        self.creds = None
+        self.service = None
+        self.loaded_at = None
+
+
+def is_auth_error(error):
+    """bool: True if error means the Gmail credentials were rejected."""
+    from google.auth.exceptions import RefreshError
+    from googleapiclient.errors import HttpError
+    
+    if isinstance(error, RefreshError):
+        return True
+    return isinstance(error, HttpError) and error.resp.status == 401
+
+
+# Credentials and service kept across warm invocations of this container
+_credential_cache = CredentialCache()
+
+# Per-account credential caches for multi-account mode, by secret ID
+_account_credentials = {}
+
+
+def account_credential_cache(account):
+    """Return the CredentialCache for an account, reused across warm invocations."""
+    secret_id = f"{ACCOUNT_SECRET_PREFIX}{account}"
+    cache = _account_credentials.get(secret_id)
+    if cache is None:
+        cache = _account_credentials[secret_id] = CredentialCache(secret_id)
+    return cache
+
+
+def fetch_secrets(secret_ids):
+    """
+    Read several secrets with as few Secrets Manager calls as possible.
+    
+    Args:
+        secret_ids (list): Secret names
+    
+    Returns:
+        tuple: (secrets, errors) - secret name -> SecretString for the secrets
+            that were read, and secret name -> error message for the rest
+    """
+    client = aws_client('secretsmanager')
+    secrets = {}
+    errors = {}
+    for start in range(0, len(secret_ids), SECRETS_BATCH_SIZE):
+        chunk = secret_ids[start:start + SECRETS_BATCH_SIZE]
+        kwargs = {'SecretIdList': chunk}
+        while True:
+            response = client.batch_get_secret_value(**kwargs)
+            for value in response.get('SecretValues', []):
+                secrets[value['Name']] = value['SecretString']
+            for error in response.get('Errors', []):
+                errors[error['SecretId']] = f"{error.get('ErrorCode')}: {error.get('Message')}"
+            if not response.get('NextToken'):
+                break
+            kwargs['NextToken'] = response['NextToken']
+    for secret_id in secret_ids:
+        if secret_id not in secrets and secret_id not in errors:
+            errors[secret_id] = 'Secret not returned'
+    return secrets, errors
+
+
+class SSMStateStore:
+    """Keep run state as a JSON string in an SSM Parameter Store parameter."""
+    
+    def __init__(self, parameter_name=STATE_PARAMETER):
+        self.parameter_name = parameter_name
+        self.client = aws_client('ssm')
+    
+    def load(self):
+        """Return the saved state, or {} if the parameter does not exist yet."""
+        try:
+            response = self.client.get_parameter(Name=self.parameter_name)
+            state = json.loads(response['Parameter']['Value'])
+            return state if isinstance(state, dict) else {}
+        except self.client.exceptions.ParameterNotFound:
+            return {}
+        except ValueError:
+            return {}
+    
+    def save(self, state):
+        """Overwrite the parameter with the given state."""
+        self.client.put_parameter(
+            Name=self.parameter_name, Value=json.dumps(state), Type='String', Overwrite=True
+        )
 
 
 class LambdaGmailCleanup:
     """Gmail cleanup for AWS Lambda."""
     
-    def __init__(self, dry_run=False):
+    def __init__(self, dry_run=False, incremental=False, state_store=None, deadline=None,
+                 quota_units_per_second=GMAIL_USER_QUOTA_PER_SECOND, credential_cache=None,
+                 secret_string=None, api_root=GMAIL_API_ROOT):
+        """
+        Args:
+            dry_run (bool): Count matches without trashing them
+            incremental (bool): Only process mail added since the saved historyId
+            state_store: Object with load()/save() for the checkpoint and resume cursor
+            deadline (float): time.monotonic() value after which no new page is started
+            quota_units_per_second (float): This invocation's share of the Gmail quota
+            credential_cache (CredentialCache): Mailbox credentials (default: the
+                single-account cache for GMAIL_SECRET_ID)
+            secret_string (str): Prefetched secret value for credential_cache
+            api_root (str): Gmail API root for the async backend (the service
+                object comes from credential_cache)
+        """
         self.service = None
+        self.creds = None
         self.dry_run = dry_run
+        self.incremental = incremental
+        self.state_store = state_store
+        self.deadline = deadline
+        self.stopped_early = False
+        self.limiter = RateLimiter(quota_units_per_second)
+        self.metrics = RunMetrics()
+        self.auth_seconds = 0.0
+        self.credential_cache = credential_cache or _credential_cache
+        self._secret_string = secret_string
+        self.api_root = api_root
         self.stats = {
             'total_checked': 0,
             'total_trashed': 0,
@@ -35,21 +396,15 @@ class LambdaGmailCleanup:
         self._authenticate()
     
     def _authenticate(self):
-        """Authenticate using credentials from AWS Secrets Manager."""
+        """Authenticate using credentials from AWS Secrets Manager (cached per container)."""
+        start = time.monotonic()
         try:
-            # Retrieve Gmail credentials from Secrets Manager
-            client = boto3.client('secretsmanager')
-            secret_response = client.get_secret_value(SecretId='gmail-credentials')
-            credentials_json = json.loads(secret_response['SecretString'])
-            
-            # Build credentials object
-            creds = Credentials.from_authorized_user_info(
-                credentials_json,
-                scopes=['https://www.googleapis.com/auth/gmail.modify']
-            )
-            
-            self.service = build('gmail', 'v1', credentials=creds)
-            print("✓ Authenticated with Gmail API (Lambda)")
+            self.creds, self.service, reused = self.credential_cache.get(self._secret_string)
+            self.auth_seconds = time.monotonic() - start
+            if reused:
+                print("✓ Reusing Gmail API credentials (warm start)")
+            else:
+                print("✓ Authenticated with Gmail API (Lambda)")
             
         except Exception as e:
             print(f"✗ Authentication failed: {e}")
@@ -57,14 +412,7 @@ class LambdaGmailCleanup:
     
     def _is_allowlisted(self, sender_email):
         """Check if sender is in allowlist."""
-        allowlist_senders = ["windsor metro west", "texas oncology", "kelvin.guerra", "princess.martin"]
-        sender_lower = sender_email.lower()
-        
-        for allowed in allowlist_senders:
-            if allowed.lower() in sender_lower or sender_lower in allowed.lower():
-                return True
-        
-        return False
+        return LAMBDA_ALLOWLIST.match(sender_email) is not None
     
     def _get_sender_and_subject(self, message):
         """Extract sender and subject from message."""
@@ -87,66 +435,396 @@ class LambdaGmailCleanup:
     
     def _matches_rules(self, sender, subject):
         """Check if email matches unwanted rules."""
-        # Rule 1: no-reply senders
-        if 'no-reply@' in sender.lower():
-            return True, "no-reply sender"
+        return LAMBDA_RULES.match(sender, subject)
+    
+    def _classify_message(self, message_id, msg):
+        """Classify a fetched message as 'blocked', 'trash' or 'keep'."""
+        start = time.perf_counter()
+        sender, subject = self._get_sender_and_subject(msg)
+        if self._is_allowlisted(sender):
+            action = 'blocked'
+        else:
+            matches, rule = self._matches_rules(sender, subject)
+            action = 'trash' if matches else 'keep'
+        self.metrics.classified(time.perf_counter() - start)
+        return {'id': message_id, 'sender': sender, 'subject': subject, 'action': action}
+    
+    def _out_of_time(self, messages=0):
+        """
+        Check whether there is time left for more work.
+        
+        With a small quota (e.g. a fan-out worker's share), fetching a page
+        can take longer than DEADLINE_MARGIN, so the time the limiter needs to
+        allow the next page's messages.get calls is counted as well.
         
-        # Rule 2: Subject keywords
-        keywords = ["newsletter", "unsubscribe", "promotional", "promotion"]
-        for keyword in keywords:
-            if keyword.lower() in subject.lower():
-                return True, f"subject keyword '{keyword}'"
+        Args:
+            messages (int): Messages the next page would fetch
         
-        return False, None
+        Returns:
+            bool: True if the invocation would reach its deadline before
+                those messages' quota is available
+        """
+        if self.deadline is None:
+            return False
+        return time.monotonic() + self.limiter.time_for('messages.get', messages) >= self.deadline
     
-    def search_and_cleanup(self):
-        """Search for and clean up unwanted emails."""
+    def _messages_in_time(self, count):
+        """
+        Shrink a page until its fetches fit before the deadline.
+        
+        Args:
+            count (int): Messages in a full page
+        
+        Returns:
+            int: Messages to process now (0 = out of time)
+        """
+        while count and self._out_of_time(count):
+            count //= 2
+        return count
+    
+    def _search_pages(self, checkpoint=None, page_token=None):
+        """
+        Page through SEARCH_QUERY results.
+        
+        Args:
+            checkpoint (str): historyId to save once the sweep completes
+            page_token (str): Page to start from (None = first page)
+        
+        Yields:
+            tuple: (messages, resume) where resume is the state that makes a
+                later invocation start again at this page (an offset, so
+                trashing earlier pages shifts it; see the module docstring)
+        """
+        while True:
+            results = execute_request(
+                self.service.users().messages().list(
+                    userId='me', q=SEARCH_QUERY, maxResults=PAGE_SIZE, pageToken=page_token
+                ),
+                'messages.list', self.limiter
+            )
+            resume = {'query': SEARCH_QUERY, 'page_token': page_token, 'history_id': checkpoint}
+            yield results.get('messages', []), {'resume': resume}
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def _resumed_pages(self, checkpoint, page_token):
+        """
+        Continue a saved sweep from page_token.
+        
+        Page tokens don't last forever; if Gmail rejects the saved one (HTTP
+        400), a fresh sweep starts instead, so the stale cursor is replaced
+        rather than failing every later invocation.
+        
+        Args:
+            checkpoint (str): historyId to save once the sweep completes
+            page_token (str): Saved page token
+        
+        Yields:
+            tuple: (messages, resume) as from _search_pages
+        """
+        pages = self._search_pages(checkpoint, page_token)
         try:
-            query = '(from:no-reply@ OR subject:newsletter OR subject:unsubscribe OR subject:promotional OR category:promotions)'
+            first = next(pages)
+        except StopIteration:
+            return
+        except Exception as e:
+            if page_token is None or error_status(e) != 400:
+                raise
+            print("Gmail rejected the saved page token; starting a new sweep")
+            yield from self._search_pages(checkpoint)
+            return
+        yield first
+        yield from pages
+    
+    def _message_pages(self, state):
+        """
+        Choose where this invocation's messages come from.
+        
+        An unfinished sweep saved by an earlier invocation is resumed first.
+        Otherwise incremental runs read the History API from the saved
+        historyId, and everything else (or an expired historyId) starts a new
+        search sweep.
+        
+        Args:
+            state (dict): Saved state from the state store
+        
+        Returns:
+            tuple: (pages, done) where pages yields (messages, resume state)
+                and done() returns the state to save once every page is processed
+        """
+        resume = state.get('resume')
+        if resume and resume.get('query') == SEARCH_QUERY:
+            print("Resuming the sweep saved by the previous invocation")
+            checkpoint = resume.get('history_id')
+            return (
+                self._resumed_pages(checkpoint, resume.get('page_token')),
+                lambda: self._sweep_done(checkpoint)
+            )
+        
+        start_history_id = state.get('history_id')
+        if self.incremental and start_history_id:
+            try:
+                pager = HistoryPager(self.service, start_history_id, limiter=self.limiter)
+                print(f"Incremental sync: processing changes since historyId {start_history_id}")
+                # Stopping early saves the historyId of the last fully processed page
+                return (
+                    ((page, {'history_id': pager.processed_history_id}) for page in pager),
+                    lambda: {'resume': None, 'history_id': pager.history_id}
+                )
+            except HistoryExpiredError:
+                print(f"historyId {start_history_id} has expired, running a full sweep")
+        
+        # Capture the checkpoint before listing so nothing arriving mid-sweep is missed
+        checkpoint = get_current_history_id(self.service, self.limiter) if self.incremental else None
+        return self._search_pages(checkpoint), lambda: self._sweep_done(checkpoint)
+    
+    def _sweep_done(self, checkpoint):
+        """
+        State to save once a search sweep has processed every page.
+        
+        Only a sweep that captured a historyId (an incremental run's full
+        sweep) replaces the saved checkpoint; any other sweep leaves it alone,
+        so a run with incremental sync switched off doesn't discard it.
+        
+        Args:
+            checkpoint (str): historyId captured when the sweep started (or None)
+        
+        Returns:
+            dict: Updates for _save_state
+        """
+        if checkpoint is None:
+            return {'resume': None}
+        return {'resume': None, 'history_id': checkpoint}
+    
+    def _save_state(self, state, updates):
+        """Merge updates into the saved state (never on dry runs)."""
+        if self.state_store is None or self.dry_run:
+            return
+        for key, value in updates.items():
+            if value is None:
+                state.pop(key, None)
+            else:
+                state[key] = value
+        self.state_store.save(state)
+    
+    def _trash(self, message_ids):
+        """Trash message IDs (or count them on a dry run) and update stats."""
+        if not message_ids:
+            return
+        if self.dry_run:
+            self.stats['total_trashed'] += len(message_ids)
+            return
+        trashed, failed = batch_trash_messages(self.service, message_ids, limiter=self.limiter)
+        self.stats['total_trashed'] += len(trashed)
+        for message_id, error in failed.items():
+            print(f"Error trashing message {message_id}: {error}")
+    
+    def _process_page(self, message_ids, pending_trash):
+        """
+        Fetch and classify one page of messages, queueing matches for trash.
+        
+        Args:
+            message_ids (list): Gmail message IDs
+            pending_trash (list): Matches not trashed yet
+        
+        Returns:
+            list: The new pending_trash (flushed whenever it reaches a full batchModify)
+        """
+        fetched = batch_get_messages(
+            self.service, message_ids,
+            format='metadata', metadata_headers=FETCH_HEADERS, limiter=self.limiter
+        )
+        
+        for message_id, msg, error in fetched:
+            if error is not None:
+                print(f"Error fetching message {message_id}: {error}")
+                continue
+            
+            decision = self._classify_message(message_id, msg)
+            self.stats['total_checked'] += 1
             
-            results = self.service.users().messages().list(
-                userId='me', q=query, maxResults=100
-            ).execute()
+            if decision['action'] == 'blocked':
+                self.stats['blocked_by_allowlist'] += 1
+            elif decision['action'] == 'trash':
+                pending_trash.append(decision['id'])
+        
+        if len(pending_trash) >= GMAIL_MAX_MODIFY_IDS:
+            self._trash(pending_trash)
+            pending_trash = []
+        return pending_trash
+    
+    def list_message_ids(self, max_total=None):
+        """
+        List matching message IDs for a fan-out coordinator.
+        
+        Args:
+            max_total (int): Stop after this many IDs (None = no limit)
+        
+        Returns:
+            list: Message IDs, cut short if the deadline is reached
+        """
+        message_ids = []
+        for messages, _ in self._search_pages():
+            message_ids.extend(message['id'] for message in messages)
+            if max_total is not None and len(message_ids) >= max_total:
+                return message_ids[:max_total]
+            if self._out_of_time():
+                self.stopped_early = True
+                break
+        return message_ids
+    
+    def process_messages(self, message_ids):
+        """
+        Classify and trash a fixed list of message IDs (one fan-out shard).
+        
+        Args:
+            message_ids (list): Gmail message IDs
+        
+        Returns:
+            list: IDs not reached before the deadline
+        """
+        pending_trash = []
+        remaining = []
+        start = 0
+        try:
+            while start < len(message_ids):
+                # Near the deadline, a smaller page that still fits beats none
+                count = self._messages_in_time(min(PAGE_SIZE, len(message_ids) - start))
+                if not count:
+                    self.stopped_early = True
+                    remaining = message_ids[start:]
+                    break
+                pending_trash = self._process_page(
+                    message_ids[start:start + count], pending_trash
+                )
+                start += count
+        finally:
+            self._trash(pending_trash)
+        return remaining
+    
+    def search_and_cleanup(self):
+        """
+        Search for and clean up unwanted emails.
+        
+        Pages are processed until the invocation is about to time out. Matches
+        are then trashed and a resume cursor (the search page token, or the
+        last processed historyId) is saved so the next invocation carries on
+        where this one stopped.
+        """
+        try:
+            state = self.state_store.load() if self.state_store else {}
+            pages, done = self._message_pages(state)
+            pending_trash = []
+            updates = None
             
-            messages = results.get('messages', [])
+            for messages, resume in pages:
+                if self._out_of_time(len(messages)):
+                    print("Approaching the Lambda timeout; saving progress for the next invocation")
+                    self.stopped_early = True
+                    updates = resume
+                    break
+                if messages:
+                    pending_trash = self._process_page(
+                        [message['id'] for message in messages], pending_trash
+                    )
             
-            if not messages:
+            if self.stats['total_checked'] == 0 and updates is None:
                 print("No unwanted emails found.")
-                return self.stats
             
-            print(f"Found {len(messages)} matching emails.")
-            
-            emails_to_trash = []
+            self._trash(pending_trash)
+            self._save_state(state, updates if updates is not None else done())
+            return self.stats
+        
+        except Exception as e:
+            print(f"Error during cleanup: {e}")
+            raise
+    
+    async def search_and_cleanup_async(self, concurrency=50):
+        """
+        Same as search_and_cleanup, using the asyncio backend.
+        
+        Listing, fetching and trashing overlap on one event loop. The deadline
+        and resume cursor work as in search_and_cleanup: once the deadline is
+        reached no new page is listed, pages already being fetched are
+        finished, and the next page's token is saved for the next invocation.
+        Incremental (History API) runs always use search_and_cleanup.
+        """
+        from gmail_async import (
+            AsyncGmailClient, AsyncTrasher, GmailAPIError, classify_pages_async
+        )
+        
+        try:
+            state = self.state_store.load() if self.state_store else {}
+            resume = state.get('resume')
+            if not (resume and resume.get('query') == SEARCH_QUERY):
+                resume = None
+            checkpoint = resume.get('history_id') if resume else None
+            updates = None
             
-            for message in messages:
-                msg = self.service.users().messages().get(
-                    userId='me', id=message['id'], format='full'
-                ).execute()
+            async with AsyncGmailClient(
+                self.creds, concurrency=concurrency, base_url=rest_base_url(self.api_root),
+                limiter=self.limiter
+            ) as client:
+                async def pages():
+                    nonlocal updates
+                    page_token = saved_token = resume.get('page_token') if resume else None
+                    if resume:
+                        print("Resuming the sweep saved by the previous invocation")
+                    while True:
+                        if self._out_of_time(PAGE_SIZE):
+                            print("Approaching the Lambda timeout; saving progress for the next invocation")
+                            self.stopped_early = True
+                            updates = {'resume': {
+                                'query': SEARCH_QUERY, 'page_token': page_token,
+                                'history_id': checkpoint
+                            }}
+                            return
+                        try:
+                            results = await client.list_messages(SEARCH_QUERY, page_token, PAGE_SIZE)
+                        except GmailAPIError as e:
+                            # As in _resumed_pages, a stale saved token restarts the sweep
+                            if e.status != 400 or page_token is None or page_token != saved_token:
+                                raise
+                            print("Gmail rejected the saved page token; starting a new sweep")
+                            page_token = saved_token = None
+                            continue
+                        yield results.get('messages', [])
+                        page_token = results.get('nextPageToken')
+                        if not page_token:
+                            return
                 
-                sender, subject = self._get_sender_and_subject(msg)
-                self.stats['total_checked'] += 1
+                trasher = None if self.dry_run else AsyncTrasher(client)
+                trash_count = 0
                 
-                if self._is_allowlisted(sender):
-                    self.stats['blocked_by_allowlist'] += 1
-                    continue
+                async for page_num, results in classify_pages_async(
+                    client, pages(), self._classify_message, 'metadata', FETCH_HEADERS
+                ):
+                    for decision, error in results:
+                        if error is not None:
+                            print(f"Error fetching message: {error}")
+                            continue
+                        
+                        self.stats['total_checked'] += 1
+                        if decision['action'] == 'blocked':
+                            self.stats['blocked_by_allowlist'] += 1
+                        elif decision['action'] == 'trash':
+                            trash_count += 1
+                            if trasher:
+                                trasher.add(decision['id'])
                 
-                matches, rule = self._matches_rules(sender, subject)
-                if matches:
-                    emails_to_trash.append({
-                        'id': message['id'],
-                        'sender': sender,
-                        'subject': subject
-                    })
-            
-            if not self.dry_run:
-                for email in emails_to_trash:
-                    self.service.users().messages().trash(
-                        userId='me', id=email['id']
-                    ).execute()
-                    self.stats['total_trashed'] += 1
-            else:
-                self.stats['total_trashed'] = len(emails_to_trash)
+                if self.stats['total_checked'] == 0 and updates is None:
+                    print("No unwanted emails found.")
+                
+                if trasher:
+                    trashed, failed = await trasher.drain()
+                    self.stats['total_trashed'] += len(trashed)
+                    for message_id, error in failed.items():
+                        print(f"Error trashing message {message_id}: {error}")
+                else:
+                    self.stats['total_trashed'] = trash_count
             
+            self._save_state(state, updates if updates is not None else self._sweep_done(checkpoint))
             return self.stats
         
         except Exception as e:
@@ -154,22 +832,400 @@ class LambdaGmailCleanup:
             raise
 
 
+class InvocationMetrics:
+    """Collects the cleanups run by one invocation and reports them as CloudWatch EMF."""
+    
+    def __init__(self, cold_start):
+        """
+        Args:
+            cold_start (bool): Whether this is the container's first invocation
+        """
+        self.cold_start = cold_start
+        self.mode = 'sweep'
+        self.started = time.monotonic()
+        self.cleanups = []
+        self._lock = threading.Lock()
+    
+    def track(self, cleanup):
+        """Include a LambdaGmailCleanup in this invocation's metrics and return it."""
+        with self._lock:
+            self.cleanups.append(cleanup)
+        return cleanup
+    
+    def documents(self):
+        """
+        Build this invocation's EMF records.
+        
+        Durations other than InvocationDuration are summed over requests (and
+        accounts), so they can add up to more than the invocation when work
+        runs concurrently.
+        
+        Returns:
+            list: One record for the invocation, published per function and
+                per function and start type (cold/warm), and one per Gmail
+                method with its call count, errors and latency percentiles
+        """
+        duration = time.monotonic() - self.started
+        function = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+        checked = trashed = quota_units = 0
+        auth_seconds = wait_seconds = 0.0
+        stages = {stage: Histogram() for stage in STAGES}
+        latency = {}
+        statuses = {}
+        for cleanup in self.cleanups:
+            checked += cleanup.stats['total_checked']
+            trashed += cleanup.stats['total_trashed']
+            quota_units += cleanup.limiter.total_units
+            auth_seconds += cleanup.auth_seconds
+            wait_seconds += cleanup.limiter.wait_seconds
+            for stage, histogram in cleanup.metrics.stage_histograms(cleanup.limiter).items():
+                stages[stage].merge(histogram)
+            for method, histogram in cleanup.limiter.latency.items():
+                latency.setdefault(method, Histogram()).merge(histogram)
+            for method, by_status in cleanup.limiter.statuses.items():
+                totals = statuses.setdefault(method, {})
+                for status, count in by_status.items():
+                    totals[status] = totals.get(status, 0) + count
+        
+        api = Histogram()
+        for histogram in latency.values():
+            api.merge(histogram)
+        
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+        
+        def percentiles(histogram):
+            return {
+                f"ApiLatencyP{q}": (ms(histogram.percentile(q)), 'Milliseconds')
+                for q in (50, 90, 99)
+            }
+        
+        metrics = {
+            'MessagesChecked': (checked, 'Count'),
+            'MessagesTrashed': (trashed, 'Count'),
+            'CheckedPerSecond': (checked / duration if duration else None, 'Count/Second'),
+            'TrashedPerSecond': (trashed / duration if duration else None, 'Count/Second'),
+            'QuotaUnits': (quota_units, 'Count'),
+            'ColdStart': (int(self.cold_start), 'Count'),
+            'InvocationDuration': (ms(duration), 'Milliseconds'),
+            'AuthDuration': (ms(auth_seconds), 'Milliseconds'),
+            'QuotaWaitDuration': (ms(wait_seconds), 'Milliseconds'),
+        }
+        for stage, histogram in stages.items():
+            metrics[f"{stage.title()}Duration"] = (ms(histogram.total), 'Milliseconds')
+        metrics.update(percentiles(api))
+        
+        documents = [emf_document(
+            METRICS_NAMESPACE,
+            {'FunctionName': function, 'StartType': 'cold' if self.cold_start else 'warm'},
+            metrics,
+            dimension_sets=[['FunctionName'], ['FunctionName', 'StartType']],
+            properties={'Mode': self.mode, 'Mailboxes': len(self.cleanups)}
+        )]
+        for method in sorted(statuses):
+            by_status = statuses[method]
+            method_metrics = {
+                'ApiCalls': (sum(by_status.values()), 'Count'),
+                'ApiErrors': (
+                    sum(count for status, count in by_status.items() if not status.startswith('2')),
+                    'Count'
+                ),
+            }
+            method_metrics.update(percentiles(latency.get(method, Histogram())))
+            documents.append(emf_document(
+                METRICS_NAMESPACE, {'FunctionName': function, 'Method': method}, method_metrics,
+                properties={'Statuses': by_status}
+            ))
+        return documents
+    
+    def emit(self):
+        """Print this invocation's EMF records to stdout, where CloudWatch Logs picks them up."""
+        for document in self.documents():
+            print(json.dumps(document))
+
+
+def _sweep(cleanup, event, incremental):
+    """Run a full or incremental sweep with the backend the event asks for."""
+    if event.get('backend') == 'async' and not incremental:
+        import asyncio
+        return asyncio.run(cleanup.search_and_cleanup_async())
+    return cleanup.search_and_cleanup()
+
+
+def account_state_parameter(account):
+    """str: SSM parameter holding one account's sync state (SSM names allow [A-Za-z0-9_.-/])."""
+    return f"{STATE_PARAMETER}/{re.sub(r'[^A-Za-z0-9_.-]', '_', account)}"
+
+
+def _run_accounts(accounts, event, deadline, incremental, invocation):
+    """
+    Clean up several mailboxes concurrently.
+    
+    Secrets for accounts without warm credentials are read in one batch. Each
+    account gets its own credentials, rate limiter, sync state and stats, and
+    a failing account does not stop the others.
+    
+    Args:
+        accounts (list): Account identifiers (secret name suffixes)
+        event (dict): Handler event
+        deadline (float): time.monotonic() value shared by every account
+        incremental (bool): Only process mail added since each account's checkpoint
+        invocation (InvocationMetrics): Collects each account's cleanup for metrics
+    
+    Returns:
+        dict: Response body with combined stats and a result per account
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    
+    caches = {account: account_credential_cache(account) for account in accounts}
+    cold = [cache.secret_id for cache in caches.values() if cache.needs_secret()]
+    secrets, secret_errors = fetch_secrets(cold) if cold else ({}, {})
+    # Create the shared SSM client here; boto3 client creation is not thread-safe
+    aws_client('ssm')
+    
+    def run_account(account):
+        cache = caches[account]
+        if cache.secret_id in secret_errors:
+            return {'status': 'error', 'error': secret_errors[cache.secret_id]}
+        try:
+            cleanup = invocation.track(LambdaGmailCleanup(
+                dry_run=event.get('dry_run', False),
+                incremental=incremental,
+                state_store=SSMStateStore(account_state_parameter(account)),
+                deadline=deadline,
+                credential_cache=cache,
+                secret_string=secrets.get(cache.secret_id)
+            ))
+            stats = _sweep(cleanup, event, incremental)
+        except Exception as e:
+            print(f"✗ {account}: {e}")
+            if is_auth_error(e):
+                cache.invalidate()
+            return {'status': 'error', 'error': str(e)}
+        print(f"✓ {account}: checked {stats['total_checked']}, trashed {stats['total_trashed']}")
+        return {
+            'status': 'ok',
+            'stats': stats,
+            'complete': not cleanup.stopped_early,
+            'quota_units': cleanup.limiter.total_units
+        }
+    
+    workers = max(1, min(event.get('account_concurrency', ACCOUNT_CONCURRENCY), len(accounts)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='account') as executor:
+        results = dict(zip(accounts, executor.map(run_account, accounts)))
+    
+    totals = {}
+    for result in results.values():
+        for key, value in result.get('stats', {}).items():
+            totals[key] = totals.get(key, 0) + value
+    failed = [account for account, result in results.items() if result['status'] != 'ok']
+    return {
+        'message': 'Email cleanup completed',
+        'stats': totals,
+        'complete': all(result.get('complete', True) for result in results.values()),
+        'failed_accounts': failed,
+        'accounts': results
+    }
+
+
+def _run_coordinator(event, deadline, invocation):
+    """
+    List matching messages and fan them out to worker invocations.
+    
+    Workers report their own metrics, so only the listing is counted here.
+    
+    Args:
+        event (dict): Coordinator event (see lambda_handler)
+        deadline (float): time.monotonic() value the coordinator must finish by
+        invocation (InvocationMetrics): Collects the listing cleanup for metrics
+    
+    Returns:
+        dict: Response body
+    """
+    from fanout import (
+        run_coordinator, LambdaInvoker, LocalInvoker, DEFAULT_SHARD_SIZE, DEFAULT_MAX_WORKERS
+    )
+    
+    max_workers = event.get('max_workers', DEFAULT_MAX_WORKERS)
+    list_deadline = None
+    if deadline is not None:
+        list_deadline = time.monotonic() + (deadline - time.monotonic()) * COORDINATOR_LIST_FRACTION
+    lister = invocation.track(
+        LambdaGmailCleanup(dry_run=event.get('dry_run', False), deadline=list_deadline)
+    )
+    message_ids = lister.list_message_ids(event.get('max_messages'))
+    print(f"Coordinator listed {len(message_ids)} emails")
+    
+    if event.get('local'):
+        invoker = LocalInvoker(lambda_handler)
+        # Local workers run one at a time, so there is nothing to run in parallel
+        max_workers = 1
+    else:
+        invoker = LambdaInvoker(os.environ['AWS_LAMBDA_FUNCTION_NAME'], aws_client('lambda'))
+    
+    # Workers share the mailbox's quota, so each gets an equal slice of it
+    worker_quota = GMAIL_USER_QUOTA_PER_SECOND and GMAIL_USER_QUOTA_PER_SECOND / max(1, max_workers)
+    # Wall-clock form of the deadline, which workers check when they start
+    # (an invocation may begin well after its event was built)
+    deadline_ms = None
+    if deadline is not None:
+        deadline_ms = int((time.time() + deadline - time.monotonic()) * 1000)
+    
+    def make_event(shard):
+        worker_event = {
+            'mode': 'worker',
+            'message_ids': shard,
+            'dry_run': event.get('dry_run', False),
+            'quota_units_per_second': worker_quota
+        }
+        if deadline_ms is not None:
+            # Workers must return before the coordinator's own deadline
+            worker_event['deadline_ms'] = deadline_ms
+        return worker_event
+    
+    # Workers stop DEADLINE_MARGIN before the coordinator's deadline, so one
+    # dispatched later would have no time to do anything
+    dispatch_deadline = deadline - DEADLINE_MARGIN if deadline is not None else None
+    result = run_coordinator(
+        message_ids, invoker, make_event,
+        shard_size=event.get('shard_size', DEFAULT_SHARD_SIZE),
+        max_workers=max_workers, deadline=dispatch_deadline
+    )
+    result['quota_units'] += lister.limiter.total_units
+    return {
+        'message': 'Email cleanup fan-out completed',
+        'stats': result['stats'],
+        'complete': not lister.stopped_early and result['unprocessed'] == 0,
+        'shards': result['shards'],
+        'failed_shards': result['failed_shards'],
+        'unprocessed': result['unprocessed'],
+        'quota_units': result['quota_units']
+    }
+
+
+def _run_worker(event, deadline, invocation):
+    """
+    Process one shard of message IDs handed out by a coordinator.
+    
+    A worker that starts after the coordinator's deadline ("deadline_ms",
+    Unix time in milliseconds) hands its whole shard back unprocessed.
+    
+    Args:
+        event (dict): Worker event (see _run_coordinator)
+        deadline (float): time.monotonic() value derived from the Lambda context
+        invocation (InvocationMetrics): Collects the worker's cleanup for metrics
+    
+    Returns:
+        dict: Response body, with the IDs not reached in 'remaining'
+    """
+    if event.get('deadline_ms') is not None:
+        budget = event['deadline_ms'] / 1000 - time.time()
+        budget_deadline = time.monotonic() + budget - DEADLINE_MARGIN
+        deadline = budget_deadline if deadline is None else min(deadline, budget_deadline)
+    cleanup = invocation.track(LambdaGmailCleanup(
+        dry_run=event.get('dry_run', False),
+        deadline=deadline,
+        quota_units_per_second=event.get('quota_units_per_second', GMAIL_USER_QUOTA_PER_SECOND)
+    ))
+    remaining = cleanup.process_messages(event.get('message_ids', []))
+    return {
+        'message': 'Email cleanup shard completed',
+        'stats': cleanup.stats,
+        'remaining': remaining,
+        'quota': cleanup.limiter.summary()
+    }
+
+
 def lambda_handler(event, context):
-    """AWS Lambda handler function."""
+    """
+    AWS Lambda handler function.
+    
+    Event options:
+        "backend": "async"    Use the asyncio backend (full sweeps only)
+        "incremental": true   Only process mail added since the last run (also
+                              enabled by the INCREMENTAL_SYNC=true env variable)
+        "mode": "coordinator" List matching mail and fan it out to parallel
+                              invocations of this function ("max_workers",
+                              "shard_size", "max_messages" and "dry_run" tune it;
+                              "local": true runs the workers in-process,
+                              one at a time)
+        "mode": "worker"      Process the "message_ids" a coordinator sent
+        "accounts": [...]     Clean up these mailboxes concurrently (also read
+                              from the comma-separated GMAIL_ACCOUNTS env
+                              variable); "account_concurrency" limits how many
+                              run at once
+    
+    Runs stop starting new pages DEADLINE_MARGIN seconds before the function
+    times out and save a resume cursor; "complete" in the response is false
+    when the next invocation still has work to pick up.
+    
+    The invocation's metrics are printed as CloudWatch EMF records once it
+    ends, whether or not it succeeded (set EMIT_METRICS=false to turn off).
+    """
+    global _cold_start
+    invocation = InvocationMetrics(_cold_start)
     try:
-        cleanup = LambdaGmailCleanup(dry_run=False)
-        stats = cleanup.search_and_cleanup()
+        return _handle(event or {}, context, invocation)
+    finally:
+        _cold_start = False
+        if EMIT_METRICS:
+            try:
+                invocation.emit()
+            except Exception as e:
+                print(f"✗ Could not emit metrics: {e}")
+
+
+def _handle(event, context, invocation):
+    """Run the invocation lambda_handler describes and build its response."""
+    try:
+        incremental = event.get(
+            'incremental', os.environ.get('INCREMENTAL_SYNC', 'false').lower() == 'true'
+        )
+        deadline = None
+        if context is not None:
+            remaining = context.get_remaining_time_in_millis() / 1000
+            deadline = time.monotonic() + remaining - DEADLINE_MARGIN
+        
+        mode = event.get('mode')
+        if mode in ('coordinator', 'worker'):
+            invocation.mode = mode
+        if mode == 'coordinator':
+            body = _run_coordinator(event, deadline, invocation)
+            return {'statusCode': 200, 'body': json.dumps(body)}
+        if mode == 'worker':
+            return {'statusCode': 200, 'body': json.dumps(_run_worker(event, deadline, invocation))}
+        
+        accounts = event.get('accounts')
+        if accounts is None and os.environ.get('GMAIL_ACCOUNTS'):
+            accounts = [a.strip() for a in os.environ['GMAIL_ACCOUNTS'].split(',') if a.strip()]
+        if accounts:
+            invocation.mode = 'accounts'
+            body = _run_accounts(accounts, event, deadline, incremental, invocation)
+            return {'statusCode': 200, 'body': json.dumps(body)}
+        
+        cleanup = invocation.track(LambdaGmailCleanup(
+            dry_run=False,
+            incremental=incremental,
+            state_store=SSMStateStore(),
+            deadline=deadline
+        ))
+        stats = _sweep(cleanup, event, incremental)
         
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': 'Email cleanup completed',
-                'stats': stats
+                'stats': stats,
+                'complete': not cleanup.stopped_early,
+                'quota': cleanup.limiter.summary()
             })
         }
     
     except Exception as e:
         print(f"Lambda error: {e}")
+        if is_auth_error(e):
+            # Re-read the secret on the next invocation instead of reusing bad credentials
+            _credential_cache.invalidate()
         return {
             'statusCode': 500,
             'body': json.dumps({
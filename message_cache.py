@@ -0,0 +1,233 @@
+"""
+On-disk cache of message metadata used for classification
+
+Stores the decoded sender, subject, labelIds and internalDate of every message
+GmailCleanup fetches, with the historyId its labels are current as of, keyed
+by message ID, in a SQLite file. A dry run followed by --execute (or
+overlapping daily sweeps) can then classify already-seen messages without
+fetching them again.
+
+Gmail never changes a message's headers, so cached sender and subject are
+always valid. Labels can change: before a run uses them, the History API is
+read from label_checkpoint() and entries whose labels changed since are
+expired with expire_labels(); mark_validated() then records the historyId the
+remaining labels are current to. Labels are trusted for label_ttl seconds at
+most; after that a message whose classification depends on its labels is
+fetched again. The cache holds at most max_entries rows, evicting the least
+recently used ones.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    sender TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    label_ids TEXT NOT NULL,
+    internal_date TEXT,
+    history_id TEXT,
+    fetched_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_last_used ON messages (last_used);
+"""
+
+# SQLite limits the number of ? placeholders in one statement
+_MAX_PARAMS = 500
+
+
+class CachedMessage:
+    """Cached classification fields for one message."""
+
+    __slots__ = ('id', 'sender', 'subject', 'label_ids', 'internal_date', 'history_id',
+                 'fetched_at')
+
+    def __init__(self, id, sender, subject, label_ids, internal_date, history_id, fetched_at):
+        self.id = id
+        self.sender = sender
+        self.subject = subject
+        self.label_ids = label_ids
+        self.internal_date = internal_date
+        self.history_id = history_id
+        self.fetched_at = fetched_at
+
+    def labels_fresh(self, label_ttl, now=None):
+        """bool: True if labelIds were fetched less than label_ttl seconds ago."""
+        return ((now or time.time()) - self.fetched_at) < label_ttl
+
+
+class MessageCache:
+    """SQLite-backed, size-bounded message metadata cache (thread-safe)."""
+
+    def __init__(self, path, max_entries=100000, label_ttl=24 * 3600):
+        """
+        Args:
+            path (str): SQLite database file (':memory:' for a throwaway cache)
+            max_entries (int): Rows kept before least recently used ones are evicted
+            label_ttl (float): Seconds cached labelIds are trusted
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.label_ttl = label_ttl
+        self.lookups = 0
+        self.hits = 0
+        self.served = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def get_many(self, message_ids):
+        """
+        Look up several messages and mark them as recently used.
+
+        Args:
+            message_ids (list): Gmail message IDs
+
+        Returns:
+            dict: message_id -> CachedMessage for the IDs that are cached
+        """
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(message_ids), _MAX_PARAMS):
+                chunk = message_ids[start:start + _MAX_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    "SELECT id, sender, subject, label_ids, internal_date, history_id, fetched_at "
+                    f"FROM messages WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = CachedMessage(
+                        row[0], row[1], row[2], json.loads(row[3]), row[4], row[5], row[6]
+                    )
+                self._conn.execute(
+                    f"UPDATE messages SET last_used = ? WHERE id IN ({placeholders})",
+                    [now] + chunk
+                )
+            self._conn.commit()
+            self.lookups += len(message_ids)
+            self.hits += len(found)
+        return found
+
+    def label_checkpoint(self, now=None):
+        """
+        Find where the History API must be read from to validate cached labels.
+
+        Returns:
+            str: Lowest historyId among entries whose labels are still within
+                label_ttl (None if there are none)
+        """
+        oldest = (now or time.time()) - self.label_ttl
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(CAST(history_id AS INTEGER)) FROM messages "
+                "WHERE fetched_at > ? AND history_id IS NOT NULL", (oldest,)
+            ).fetchone()
+        return None if row[0] is None else str(row[0])
+
+    def expire_labels(self, message_ids=None):
+        """
+        Stop trusting cached labels; sender and subject stay cached.
+
+        Args:
+            message_ids (iterable): Messages whose labels changed (None = every entry)
+
+        Returns:
+            int: Number of entries expired
+        """
+        with self._lock:
+            if message_ids is None:
+                expired = self._conn.execute(
+                    "UPDATE messages SET fetched_at = 0 WHERE fetched_at > 0"
+                ).rowcount
+            else:
+                message_ids = list(message_ids)
+                expired = 0
+                for start in range(0, len(message_ids), _MAX_PARAMS):
+                    chunk = message_ids[start:start + _MAX_PARAMS]
+                    placeholders = ','.join('?' * len(chunk))
+                    expired += self._conn.execute(
+                        f"UPDATE messages SET fetched_at = 0 "
+                        f"WHERE fetched_at > 0 AND id IN ({placeholders})", chunk
+                    ).rowcount
+            self._conn.commit()
+        return expired
+
+    def mark_validated(self, history_id, now=None):
+        """
+        Record that the labels still within label_ttl are current as of history_id.
+
+        Call after expiring every message the History API reported as changed
+        since label_checkpoint(), so the next validation starts from here.
+
+        Args:
+            history_id (str): Mailbox historyId the changes were read up to
+        """
+        oldest = (now or time.time()) - self.label_ttl
+        with self._lock:
+            self._conn.execute(
+                "UPDATE messages SET history_id = ? WHERE fetched_at > ? AND history_id IS NOT NULL",
+                (str(history_id), oldest)
+            )
+            self._conn.commit()
+
+    def record_served(self, count):
+        """Count cached entries that were used without re-fetching the message."""
+        with self._lock:
+            self.served += count
+
+    def put_many(self, entries, history_id=None):
+        """
+        Store freshly fetched messages.
+
+        Args:
+            entries (list): (message_id, sender, subject, message) tuples, where
+                message is the Gmail resource the fields were extracted from
+            history_id (str): Mailbox historyId read before the messages were
+                fetched, which their labels are current as of (default: each
+                message's own historyId)
+        """
+        if not entries:
+            return
+        now = time.time()
+        rows = [
+            (message_id, sender, subject, json.dumps(message.get('labelIds', [])),
+             message.get('internalDate'), history_id or message.get('historyId'), now, now)
+            for message_id, sender, subject, message in entries
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages "
+                "(id, sender, subject, label_ids, internal_date, history_id, fetched_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def evict(self):
+        """
+        Trim the cache to max_entries, dropping least recently used rows first.
+
+        Returns:
+            int: Number of rows removed
+        """
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            self._conn.execute(
+                "DELETE FROM messages WHERE id IN "
+                "(SELECT id FROM messages ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self._conn.commit()
+            return excess
+
+    def close(self):
+        """Evict down to max_entries and close the database."""
+        self.evict()
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,253 @@
+"""
+Run metrics for GmailCleanup
+
+A run records four kinds of timing, one histogram per pipeline stage:
+  list      - messages.list / history.list requests
+  get       - messages.get requests (a whole batch request counts once)
+  classify  - classifying one message (header decoding, allowlist, rules)
+  trash     - messages.batchModify / messages.trash requests
+
+API latencies, response statuses and bytes received are recorded by the run's
+rate_limiter.RateLimiter, which every request already goes through;
+RunMetrics adds the classification timings and rule hits and puts it all
+together into one JSON-serializable dict.
+
+emf_document() formats metrics as CloudWatch Embedded Metric Format records:
+a JSON line printed to a Lambda's stdout becomes CloudWatch metrics without
+any API call.
+"""
+
+import bisect
+import threading
+import time
+
+# Upper bounds (seconds) of the histogram buckets; a last bucket holds the rest
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+STAGES = ('list', 'get', 'classify', 'trash')
+
+# Gmail methods whose request latencies make up each API stage
+STAGE_METHODS = {
+    'list': ('messages.list', 'history.list'),
+    'get': ('messages.get',),
+    'trash': ('messages.batchModify', 'messages.trash'),
+}
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """
+        Args:
+            bounds (tuple): Ascending bucket upper bounds
+        """
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Record one duration."""
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add the observations of another histogram with the same bounds."""
+        with other._lock:
+            buckets, count, total = list(other.buckets), other.count, other.total
+            low, high = other.min, other.max
+        if not count:
+            return
+        with self._lock:
+            self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, buckets)]
+            self.count += count
+            self.total += total
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+
+    def percentile(self, q):
+        """
+        Estimate a percentile by interpolating inside its bucket.
+
+        Args:
+            q (float): Percentile between 0 and 100
+
+        Returns:
+            float: Estimated duration in seconds (None if nothing was recorded)
+        """
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q / 100 * self.count
+            seen = 0
+            for index, count in enumerate(self.buckets):
+                if count and seen + count >= rank:
+                    low = self.bounds[index - 1] if index > 0 else 0.0
+                    high = self.bounds[index] if index < len(self.bounds) else self.max
+                    estimate = low + (high - low) * (rank - seen) / count
+                    return min(max(estimate, self.min), self.max)
+                seen += count
+            return self.max
+
+    def summary(self):
+        """
+        Report the distribution.
+
+        Returns:
+            dict: count, sum, mean, min, max, p50, p90, p99 (seconds) and
+                buckets (upper bound -> count, non-empty buckets only)
+        """
+        percentiles = {f"p{q}": self.percentile(q) for q in (50, 90, 99)}
+        with self._lock:
+            buckets = {}
+            for index, count in enumerate(self.buckets):
+                if count:
+                    bound = str(self.bounds[index]) if index < len(self.bounds) else '+Inf'
+                    buckets[bound] = count
+            summary = {
+                'count': self.count,
+                'sum': self.total,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.min,
+                'max': self.max,
+            }
+        summary.update(percentiles)
+        for key, value in summary.items():
+            if isinstance(value, float):
+                summary[key] = round(value, 6)
+        summary['buckets'] = buckets
+        return summary
+
+
+class RunMetrics:
+    """Classification timings and rule hits of one run, plus the full report."""
+
+    def __init__(self):
+        self.classify = Histogram()
+        self.rule_hits = {}
+        self._lock = threading.Lock()
+
+    def classified(self, seconds):
+        """Record how long classifying one message took."""
+        self.classify.observe(seconds)
+
+    def rule_hit(self, rule):
+        """Count a message trashed (or that would be) by a rule, by its config key."""
+        with self._lock:
+            self.rule_hits[rule] = self.rule_hits.get(rule, 0) + 1
+
+    def stage_histograms(self, limiter):
+        """
+        Group request latencies by pipeline stage.
+
+        Args:
+            limiter (RateLimiter): The run's limiter
+
+        Returns:
+            dict: Stage name -> Histogram
+        """
+        stages = {}
+        for stage in STAGES:
+            if stage == 'classify':
+                stages[stage] = self.classify
+                continue
+            histogram = Histogram()
+            for method in STAGE_METHODS[stage]:
+                if method in limiter.latency:
+                    histogram.merge(limiter.latency[method])
+            stages[stage] = histogram
+        return stages
+
+    def report(self, limiter, cache=None):
+        """
+        Put together the metrics of a run.
+
+        Args:
+            limiter (RateLimiter): The run's limiter
+            cache (MessageCache): The run's message cache (None = not used)
+
+        Returns:
+            dict: stages (histogram summaries), api_calls (per method: calls,
+                quota units and responses by HTTP status), retries, throttled,
+                bytes_received, rule_hits and cache (lookups, hits, messages
+                served without a fetch and hit_ratio = served / lookups; None
+                without a cache)
+        """
+        usage = limiter.summary()
+        api_calls = {}
+        for method, calls in sorted(usage['calls_by_method'].items()):
+            api_calls[method] = {
+                'calls': calls,
+                'units': usage['units_by_method'].get(method, 0),
+                'statuses': usage['statuses_by_method'].get(method, {}),
+            }
+
+        cache_report = None
+        if cache is not None:
+            cache_report = {
+                'lookups': cache.lookups,
+                'hits': cache.hits,
+                'served': cache.served,
+                'hit_ratio': round(cache.served / cache.lookups, 4) if cache.lookups else None,
+            }
+
+        with self._lock:
+            rule_hits = dict(sorted(self.rule_hits.items()))
+        return {
+            'stages': {
+                stage: histogram.summary()
+                for stage, histogram in self.stage_histograms(limiter).items()
+            },
+            'api_calls': api_calls,
+            'retries': usage['retries'],
+            'throttled': usage['throttled'],
+            'bytes_received': usage['bytes_received'],
+            'rule_hits': rule_hits,
+            'cache': cache_report,
+        }
+
+
+def emf_document(namespace, dimensions, metrics, dimension_sets=None, properties=None,
+                 timestamp=None):
+    """
+    Build a CloudWatch Embedded Metric Format record.
+
+    Args:
+        namespace (str): CloudWatch namespace
+        dimensions (dict): Dimension name -> value
+        metrics (dict): Metric name -> (value, unit), e.g. ('Milliseconds');
+            metrics whose value is None are left out
+        dimension_sets (list): Lists of dimension names to publish every metric
+            under (default: all of dimensions as one set)
+        properties (dict): Extra fields kept in the log record only
+        timestamp (float): Seconds since the epoch (default: now)
+
+    Returns:
+        dict: Record to print as one line of JSON
+    """
+    present = {name: value for name, value in metrics.items() if value[0] is not None}
+    document = dict(properties or {})
+    document.update(dimensions)
+    document['_aws'] = {
+        'Timestamp': int((time.time() if timestamp is None else timestamp) * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': namespace,
+            'Dimensions': dimension_sets or [list(dimensions)],
+            'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in present.items()],
+        }],
+    }
+    for name, (value, _) in present.items():
+        document[name] = round(value, 3) if isinstance(value, float) else value
+    return document
@@ -0,0 +1,341 @@
+"""
+Gmail search query planner
+
+Compiles UNWANTED_RULES, ALLOWLIST and SEARCH_FILTERS into server-side Gmail
+search queries so that fewer messages are listed and fetched:
+
+  - every enabled rule becomes an OR term (from:, subject:, category:)
+  - allowlisted full addresses and *.domain entries become -from:
+    exclusions, so protected mail is never fetched just to be discarded
+    (plain domain entries stay client-side: Gmail's from:company.com also
+    matches subdomains, which the allowlist does not protect)
+  - date windows and label filters are applied by Gmail; compile_filter
+    builds the same checks for messages that never went through a search
+    (History API pages, cache hits), reading labelIds and internalDate
+
+Gmail's from:/subject: operators match whole words rather than substrings, so
+rule terms only narrow the search; the client still evaluates the rules and
+the allowlist on every fetched message. The plan records which predicates are
+exact on the server and which still need client-side evaluation.
+
+Queries longer than MAX_QUERY_LENGTH are split into several sub-queries whose
+results are de-duplicated by iter_plan_pages.
+"""
+
+import datetime
+import re
+import time
+
+# Longest q string sent to Gmail. Gmail does not document a hard limit, but
+# very long queries are rejected, so stay well clear of it.
+MAX_QUERY_LENGTH = 1024
+
+# Share of the query length that -from: exclusions may use; exclusions that do
+# not fit are left to the client-side allowlist check
+EXCLUSION_BUDGET = 0.5
+
+# Characters that need a term to be quoted in Gmail search syntax
+_QUOTE_CHARS = set(' ()"{}:')
+
+# Days in each older_than:/newer_than: unit (Gmail's months and years are
+# calendar based; these lengths are close enough for a cleanup window)
+_RELATIVE_UNIT_DAYS = {'d': 1, 'm': 30, 'y': 365}
+
+# Date formats Gmail accepts for before:/after:
+_DATE_FORMATS = ('%Y/%m/%d', '%Y-%m-%d', '%m/%d/%Y')
+
+
+def _quote(term):
+    """Quote a search term if Gmail would otherwise split or misparse it."""
+    if any(char in _QUOTE_CHARS for char in term):
+        return '"' + term.replace('"', '') + '"'
+    return term
+
+
+def _is_full_address(entry):
+    """True for allowlist entries that are a complete email address."""
+    local, _, domain = entry.partition('@')
+    return bool(local) and '.' in domain and ' ' not in entry
+
+
+class QueryPlan:
+    """Server-side queries plus a record of what the client must still check."""
+
+    def __init__(self, queries, server_exact, client_side):
+        """
+        Args:
+            queries (list): Gmail q strings; a message matches if any query matches
+            server_exact (list): Predicates Gmail evaluates exactly
+            client_side (list): Predicates that still need client-side evaluation
+        """
+        self.queries = queries
+        self.server_exact = server_exact
+        self.client_side = client_side
+
+    def __bool__(self):
+        return bool(self.queries)
+
+
+def _rule_terms(rules, server_exact, client_side):
+    """Translate enabled rules into OR terms, noting how exact each one is."""
+    terms = []
+    for name, rule in rules.items():
+        if not rule.get('enabled', False):
+            continue
+        if name == 'no_reply_senders':
+            terms.append(f"from:{_quote(rule.get('pattern', 'no-reply@'))}")
+            client_side.append(f"{name}: sender contains '{rule.get('pattern', 'no-reply@')}'")
+        elif name == 'subject_keywords':
+            keywords = rule.get('keywords', [])
+            terms.extend(f"subject:{_quote(keyword)}" for keyword in keywords)
+            client_side.append(f"{name}: subject contains one of {len(keywords)} keywords")
+        elif name == 'gmail_category_promotions':
+            category = rule.get('category', 'PROMOTIONS').lower()
+            terms.append(f"category:{category}")
+            server_exact.append(f"{name}: category:{category}")
+    return terms
+
+
+def _filter_terms(filters, server_exact):
+    """Translate SEARCH_FILTERS into terms every sub-query must carry."""
+    terms = []
+    for key in ('older_than', 'newer_than', 'before', 'after'):
+        value = filters.get(key)
+        if value:
+            terms.append(f"{key}:{value}")
+    for label in filters.get('include_labels', []):
+        terms.append(f"label:{_quote(label)}")
+    for label in filters.get('exclude_labels', []):
+        terms.append(f"-label:{_quote(label)}")
+    server_exact.extend(terms)
+    return terms
+
+
+class MessageFilter:
+    """SEARCH_FILTERS evaluated on a fetched message's labelIds and internalDate."""
+
+    def __init__(self, after=None, before=None, include_labels=(), exclude_labels=()):
+        """
+        Args:
+            after (int): Earliest internalDate allowed, in ms since the epoch (None = any)
+            before (int): internalDate must be earlier than this, in ms (None = any)
+            include_labels (iterable): Label IDs a message must all carry
+            exclude_labels (iterable): Label IDs a message must not carry
+        """
+        self.after = after
+        self.before = before
+        self.include_labels = frozenset(include_labels)
+        self.exclude_labels = frozenset(exclude_labels)
+
+    @property
+    def uses_labels(self):
+        """bool: True if the outcome depends on a message's labels."""
+        return bool(self.include_labels or self.exclude_labels)
+
+    def matches(self, label_ids, internal_date):
+        """
+        Check a message against the filters.
+
+        Args:
+            label_ids (list): Gmail labelIds of the message
+            internal_date (str): Gmail internalDate (ms since the epoch)
+
+        Returns:
+            bool: True if a search with the same filters would list the message;
+                a message without internalDate fails any date window
+        """
+        labels = set(label_ids or ())
+        if not self.include_labels <= labels or self.exclude_labels & labels:
+            return False
+        if self.after is None and self.before is None:
+            return True
+        if internal_date is None:
+            return False
+        date = int(internal_date)
+        if self.after is not None and date < self.after:
+            return False
+        if self.before is not None and date >= self.before:
+            return False
+        return True
+
+
+def _parse_relative(key, value, now):
+    """Turn an older_than:/newer_than: value such as '2y' into ms since the epoch."""
+    match = re.fullmatch(r'\s*(\d+)\s*([dmy])\s*', str(value).lower())
+    if not match:
+        raise ValueError(f"SEARCH_FILTERS['{key}'] must look like '7d', '6m' or '1y', got {value!r}")
+    days = int(match.group(1)) * _RELATIVE_UNIT_DAYS[match.group(2)]
+    return int((now - days * 86400) * 1000)
+
+
+def _parse_date(key, value):
+    """Turn a before:/after: date (or seconds since the epoch) into ms, local time."""
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value) * 1000
+    for date_format in _DATE_FORMATS:
+        try:
+            day = datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        return int(day.timestamp() * 1000)
+    raise ValueError(f"SEARCH_FILTERS['{key}'] must be a date such as 2024/01/31, got {value!r}")
+
+
+def compile_filter(filters, label_ids=None, now=None):
+    """
+    Build the client-side equivalent of the filters plan_queries puts in q.
+
+    Args:
+        filters (dict): Shaped like config.SEARCH_FILTERS (None = no filters)
+        label_ids (dict): Lowercased label name -> label ID, as from
+            gmail_pipeline.get_label_ids (None = filter labels are IDs already)
+        now (float): Seconds since the epoch for older_than/newer_than (default: now)
+
+    Returns:
+        MessageFilter: Filter to apply, or None if no filter is set
+
+    Raises:
+        ValueError: If a date filter can't be parsed
+    """
+    filters = filters or {}
+    now = time.time() if now is None else now
+    label_ids = label_ids or {}
+
+    lower_bounds = []
+    upper_bounds = []
+    if filters.get('older_than'):
+        upper_bounds.append(_parse_relative('older_than', filters['older_than'], now))
+    if filters.get('newer_than'):
+        lower_bounds.append(_parse_relative('newer_than', filters['newer_than'], now))
+    if filters.get('before'):
+        upper_bounds.append(_parse_date('before', filters['before']))
+    if filters.get('after'):
+        lower_bounds.append(_parse_date('after', filters['after']))
+
+    resolve = lambda label: label_ids.get(label.lower(), label)
+    include_labels = [resolve(label) for label in filters.get('include_labels', [])]
+    exclude_labels = [resolve(label) for label in filters.get('exclude_labels', [])]
+
+    if not (lower_bounds or upper_bounds or include_labels or exclude_labels):
+        return None
+    return MessageFilter(
+        after=max(lower_bounds) if lower_bounds else None,
+        before=min(upper_bounds) if upper_bounds else None,
+        include_labels=include_labels,
+        exclude_labels=exclude_labels,
+    )
+
+
+def _exclusion_terms(allowlist, budget, server_exact, client_side):
+    """Turn allowlisted addresses and domains into -from: terms within budget."""
+    candidates = []
+    for entry in allowlist.get('senders', []):
+        if _is_full_address(entry):
+            candidates.append((entry, f"-from:{_quote(entry.lower())}"))
+        else:
+            client_side.append(f"allowlist: sender contains '{entry}'")
+    for entry in allowlist.get('domains', []):
+        domain = entry.lower()
+        if not domain.startswith('*.'):
+            # from:example.com also matches subdomains in Gmail search, but a
+            # plain domain entry only protects the exact domain
+            client_side.append(f"allowlist: sender ends with '@{domain}'")
+            continue
+        candidates.append((entry, f"-from:{_quote(domain[2:])}"))
+
+    terms = []
+    used = 0
+    for entry, term in candidates:
+        if used + len(term) + 1 > budget:
+            client_side.append(f"allowlist: '{entry}' (query length limit)")
+            continue
+        terms.append(term)
+        used += len(term) + 1
+    server_exact.extend(terms)
+    return terms
+
+
+def plan_queries(rules, allowlist=None, filters=None, max_length=MAX_QUERY_LENGTH):
+    """
+    Build the Gmail search queries for a cleanup run.
+
+    Args:
+        rules (dict): Shaped like config.UNWANTED_RULES
+        allowlist (dict): Shaped like config.ALLOWLIST (None = no exclusions)
+        filters (dict): Shaped like config.SEARCH_FILTERS (None = no filters)
+        max_length (int): Longest q string to produce
+
+    Returns:
+        QueryPlan: Plan with no queries if no rules are enabled
+    """
+    server_exact = []
+    client_side = []
+    rule_terms = _rule_terms(rules, server_exact, client_side)
+    if not rule_terms:
+        return QueryPlan([], server_exact, client_side)
+
+    suffix_terms = _filter_terms(filters or {}, server_exact)
+    suffix_budget = int(max_length * EXCLUSION_BUDGET) - len(' '.join(suffix_terms))
+    suffix_terms += _exclusion_terms(allowlist or {}, suffix_budget, server_exact, client_side)
+    suffix = ' '.join(suffix_terms)
+
+    # Pack OR terms greedily into as few sub-queries as fit the length limit
+    def build(terms):
+        disjunction = ' OR '.join(terms)
+        if not suffix:
+            return disjunction
+        if len(terms) > 1:
+            disjunction = f"({disjunction})"
+        return f"{disjunction} {suffix}"
+
+    queries = []
+    current = []
+    for term in rule_terms:
+        if current and len(build(current + [term])) > max_length:
+            queries.append(build(current))
+            current = []
+        current.append(term)
+    queries.append(build(current))
+
+    return QueryPlan(queries, server_exact, client_side)
+
+
+def iter_plan_pages(plan, pages_for_query, max_total=None):
+    """
+    Page through every sub-query of a plan, yielding each message once.
+
+    Args:
+        plan (QueryPlan): Plan from plan_queries
+        pages_for_query (callable): pages_for_query(query) -> iterable of pages
+        max_total (int): Stop after this many unique messages (None = no limit)
+
+    Yields:
+        list: Message stubs not yet seen in an earlier page
+    """
+    if len(plan.queries) == 1:
+        yield from pages_for_query(plan.queries[0])
+        return
+
+    seen = set()
+    remaining = max_total
+    for query in plan.queries:
+        pages = pages_for_query(query)
+        try:
+            for messages in pages:
+                fresh = []
+                for message in messages:
+                    if message['id'] not in seen:
+                        seen.add(message['id'])
+                        fresh.append(message)
+                if remaining is not None:
+                    fresh = fresh[:remaining]
+                    remaining -= len(fresh)
+                if fresh:
+                    yield fresh
+                if remaining is not None and remaining <= 0:
+                    return
+        finally:
+            close = getattr(pages, 'close', None)
+            if close:
+                close()
@@ -0,0 +1,268 @@
+"""
+Quota-aware rate limiting for Gmail API calls
+
+Gmail charges every method a number of quota units and allows each user 250
+units per second (15,000 per minute). A RateLimiter is shared by every stage
+of a run: each request reserves its cost from a token bucket before it is
+sent, and requests that would exceed the budget wait instead of being
+rejected with 429 rateLimitExceeded.
+
+The budget adapts: a throttling response halves the allowed rate and each
+successful request wins a little of it back (additive increase,
+multiplicative decrease), so a mailbox shared with other clients settles
+below the point where Gmail starts refusing requests. The limiter also counts
+calls, quota units, retries and time spent waiting, and records response
+statuses, request latencies and bytes received, for the run summary and
+metrics.RunMetrics.
+"""
+
+import threading
+import time
+
+from metrics import Histogram
+
+# Quota units per call (https://developers.google.com/gmail/api/reference/quota).
+# Calls inside a batch request are charged individually.
+QUOTA_UNITS = {
+    'messages.list': 5,
+    'messages.get': 5,
+    'messages.trash': 5,
+    'messages.modify': 5,
+    'messages.batchModify': 50,
+    'history.list': 2,
+    'getProfile': 1,
+    'labels.list': 1,
+}
+
+# Per-user limit: 15,000 quota units per minute
+GMAIL_USER_QUOTA_PER_SECOND = 250
+
+# Lowest rate a run is throttled down to, as a share of the configured rate
+MIN_RATE_FRACTION = 0.05
+
+# Rate regained after each successful request, as a share of the configured rate
+RATE_RECOVERY_STEP = 0.02
+
+# Throttling responses closer together than this only lower the rate once
+THROTTLE_COOLDOWN = 1.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out waiting times instead of sleeping."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """
+        Args:
+            rate (float): Tokens added per second (None = unlimited)
+            capacity (float): Largest burst (default: one second's worth)
+            clock (callable): Monotonic time source
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        """
+        Take tokens, going into debt if there aren't enough.
+
+        Reservations are granted in call order, so concurrent callers queue up
+        behind each other rather than all retrying at once.
+
+        Args:
+            amount (float): Tokens to take
+
+        Returns:
+            float: Seconds the caller must wait before using them
+        """
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill(self._clock())
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def time_until(self, amount):
+        """
+        Estimate the wait for amount tokens without taking them.
+
+        Args:
+            amount (float): Tokens needed
+
+        Returns:
+            float: Seconds until they would be available at the current rate
+        """
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            self._refill(self._clock())
+            return max(0.0, amount - self._tokens) / self.rate
+
+    def set_rate(self, rate):
+        """Change the refill rate, keeping the tokens accumulated so far."""
+        if self.rate is None:
+            return
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = rate
+
+
+class RateLimiter:
+    """Shared quota budget, adaptive rate and usage counters for one run."""
+
+    def __init__(self, units_per_second=GMAIL_USER_QUOTA_PER_SECOND, clock=time.monotonic):
+        """
+        Args:
+            units_per_second (float): Quota units to allow per second
+                (None = no limit, only count usage)
+            clock (callable): Monotonic time source
+        """
+        self.max_rate = units_per_second
+        self.min_rate = units_per_second and units_per_second * MIN_RATE_FRACTION
+        self._clock = clock
+        self._bucket = TokenBucket(units_per_second, clock=clock)
+        self._lock = threading.Lock()
+        self._last_throttle = None
+        self.calls = {}
+        self.units = {}
+        self.retries = 0
+        self.throttled_count = 0
+        self.wait_seconds = 0.0
+        self.statuses = {}
+        self.latency = {}
+        self.bytes_received = 0
+
+    @property
+    def rate(self):
+        """float: Quota units per second currently allowed (None = unlimited)."""
+        return self._bucket.rate
+
+    def reserve(self, method, calls=1):
+        """
+        Charge calls to the budget.
+
+        Use this from async code and sleep for the returned time; synchronous
+        code should call wait() instead.
+
+        Args:
+            method (str): Gmail method name, a key of QUOTA_UNITS
+            calls (int): Number of calls (e.g. parts of a batch request)
+
+        Returns:
+            float: Seconds to wait before sending the request(s)
+        """
+        units = QUOTA_UNITS[method] * calls
+        delay = self._bucket.reserve(units)
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + calls
+            self.units[method] = self.units.get(method, 0) + units
+            self.wait_seconds += delay
+        return delay
+
+    def time_for(self, method, calls=1):
+        """
+        Estimate how long calls would wait for the budget, without charging them.
+
+        Args:
+            method (str): Gmail method name, a key of QUOTA_UNITS
+            calls (int): Number of calls
+
+        Returns:
+            float: Seconds at the current (possibly throttled) rate
+        """
+        return self._bucket.time_until(QUOTA_UNITS[method] * calls)
+
+    def wait(self, method, calls=1):
+        """Charge calls to the budget, sleeping until they fit within it."""
+        delay = self.reserve(method, calls)
+        if delay > 0:
+            time.sleep(delay)
+
+    def throttled(self):
+        """Record a 429/rateLimitExceeded response and halve the allowed rate."""
+        with self._lock:
+            self.throttled_count += 1
+            if self.max_rate is None:
+                return
+            now = self._clock()
+            if self._last_throttle is not None and now - self._last_throttle < THROTTLE_COOLDOWN:
+                return
+            self._last_throttle = now
+            self._bucket.set_rate(max(self.min_rate, self._bucket.rate / 2))
+
+    def succeeded(self):
+        """Record a successful request and win back some of the allowed rate."""
+        if self.max_rate is None or self._bucket.rate >= self.max_rate:
+            return
+        with self._lock:
+            self._bucket.set_rate(
+                min(self.max_rate, self._bucket.rate + self.max_rate * RATE_RECOVERY_STEP)
+            )
+
+    def retried(self, count=1):
+        """Record requests that are being sent again after a transient error."""
+        with self._lock:
+            self.retries += count
+
+    def record_response(self, method, status, seconds=None, count=1):
+        """
+        Record responses to calls of method.
+
+        Args:
+            method (str): Gmail method name, a key of QUOTA_UNITS
+            status (int): HTTP status (None = no response, e.g. a network error)
+            seconds (float): Round-trip time of the HTTP request that carried
+                them (None = don't record a latency, e.g. for the other parts
+                of a batch request)
+            count (int): Number of responses with this status
+        """
+        key = 'error' if status is None else str(status)
+        with self._lock:
+            by_status = self.statuses.setdefault(method, {})
+            by_status[key] = by_status.get(key, 0) + count
+            histogram = None
+            if seconds is not None:
+                histogram = self.latency.setdefault(method, Histogram())
+        if histogram is not None:
+            histogram.observe(seconds)
+
+    def received(self, nbytes):
+        """Count response body bytes read from the network."""
+        with self._lock:
+            self.bytes_received += nbytes
+
+    @property
+    def total_units(self):
+        """int: Quota units charged so far."""
+        return sum(self.units.values())
+
+    def summary(self):
+        """
+        Report usage for this run.
+
+        Returns:
+            dict: quota_units, units_by_method, calls_by_method,
+                statuses_by_method (HTTP status -> responses), retries,
+                throttled, wait_seconds (summed over all requests, so it can
+                exceed the run time when requests wait concurrently) and
+                bytes_received
+        """
+        with self._lock:
+            return {
+                'quota_units': sum(self.units.values()),
+                'units_by_method': dict(self.units),
+                'calls_by_method': dict(self.calls),
+                'retries': self.retries,
+                'throttled': self.throttled_count,
+                'wait_seconds': round(self.wait_seconds, 3),
+                'statuses_by_method': {
+                    method: dict(by_status) for method, by_status in self.statuses.items()
+                },
+                'bytes_received': self.bytes_received
+            }
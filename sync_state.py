@@ -0,0 +1,47 @@
+"""
+Persistent run state for incremental cleanups
+
+Stores small JSON documents such as the last processed Gmail historyId. The
+local script uses FileStateStore; lambda_handler.py provides an SSM Parameter
+Store implementation with the same load()/save() interface.
+"""
+
+import json
+import os
+
+
+class FileStateStore:
+    """Keep run state in a local JSON file."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): JSON file to read and write
+        """
+        self.path = path
+
+    def load(self):
+        """
+        Read the saved state.
+
+        Returns:
+            dict: Saved state, or {} if the file is missing or unreadable
+        """
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            return state if isinstance(state, dict) else {}
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self, state):
+        """
+        Write the state atomically so an interrupted run never corrupts it.
+
+        Args:
+            state (dict): JSON-serialisable state
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
@@ -56,6 +56,54 @@ resource "aws_iam_role_policy" "lambda_secrets" {
           "secretsmanager:GetSecretValue"
         ]
         Resource = "arn:aws:secretsmanager:${var.aws_region}:${data.aws_caller_identity.current.account_id}:secret:gmail-credentials*"
+      },
+      {
+        # Multi-account mode reads every account's secret in one call; this
+        # action does not support resource-level permissions
+        Effect   = "Allow"
+        Action   = "secretsmanager:BatchGetSecretValue"
+        Resource = "*"
+      }
+    ]
+  })
+}
+
+# Allow Lambda to keep incremental sync state in SSM Parameter Store
+resource "aws_iam_role_policy" "lambda_sync_state" {
+  name = "lambda-sync-state-policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "ssm:GetParameter",
+          "ssm:PutParameter"
+        ]
+        Resource = [
+          "arn:aws:ssm:${var.aws_region}:${data.aws_caller_identity.current.account_id}:parameter${var.state_parameter_name}",
+          "arn:aws:ssm:${var.aws_region}:${data.aws_caller_identity.current.account_id}:parameter${var.state_parameter_name}/*"
+        ]
+      }
+    ]
+  })
+}
+
+# Allow the function to invoke itself, so a "coordinator" event can fan a
+# large sweep out to parallel "worker" invocations
+resource "aws_iam_role_policy" "lambda_fanout" {
+  name = "lambda-fanout-policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = "lambda:InvokeFunction"
+        Resource = aws_lambda_function.email_cleanup.arn
       }
     ]
   })
@@ -77,7 +125,12 @@ resource "aws_lambda_function" "email_cleanup" {
 
   environment {
     variables = {
-      DRY_RUN = "false"
+      DRY_RUN           = "false"
+      INCREMENTAL_SYNC  = tostring(var.incremental_sync)
+      STATE_PARAMETER   = var.state_parameter_name
+      SECRET_CACHE_TTL  = tostring(var.secret_cache_ttl)
+      GMAIL_ACCOUNTS    = join(",", var.gmail_accounts)
+      METRICS_NAMESPACE = var.metrics_namespace
     }
   }
 
@@ -11,3 +11,33 @@ variable "eventbridge_enabled" {
   type        = bool
   default     = true
 }
+
+variable "incremental_sync" {
+  description = "Only process mail added since the previous run (Gmail History API)"
+  type        = bool
+  default     = false
+}
+
+variable "state_parameter_name" {
+  description = "SSM parameter that stores the incremental sync checkpoint"
+  type        = string
+  default     = "/email-cleanup/sync-state"
+}
+
+variable "secret_cache_ttl" {
+  description = "Seconds a warm Lambda container reuses the Gmail secret before reading it again"
+  type        = number
+  default     = 3600
+}
+
+variable "gmail_accounts" {
+  description = "Mailboxes to clean up in multi-account mode; each needs a gmail-credentials/<account> secret (empty = single gmail-credentials mailbox)"
+  type        = list(string)
+  default     = []
+}
+
+variable "metrics_namespace" {
+  description = "CloudWatch namespace of the metrics each invocation logs in Embedded Metric Format"
+  type        = string
+  default     = "EmailCleanup"
+}